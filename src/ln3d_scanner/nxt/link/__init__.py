@@ -0,0 +1,6 @@
+from .scheduler import BrickScheduler, Priority, SchedulerStats
+from .link_profile import LinkProfile, LinkProfileStore, profile_link, load_link_profile, get_link_profile, set_link_profile
+from .pipeline import get_output_states, set_output_states, reset_motor_positions
+from .instrumentation import BrickInstrumentation, instrument, uninstrument, instrumented, instrument_from_env, get_instrumentation
+from .recording import RecordingSock, Recording, RecordedExchange, record, stop_recording, recorded, read_recording, load_recording
+from .brick_locator import BrickAddress, BrickAddressStore, BrickLocator, find_brick
@@ -0,0 +1,111 @@
+import importlib
+import logging
+
+from typing import NamedTuple, Optional
+
+from nxt.brick import Brick
+
+from ln3d_scanner.storage import JsonStore, data_path
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = data_path('brick.json')
+
+
+class BrickAddress(NamedTuple):
+    backend: str  # nxt-python backend module, usb or bluetooth.
+    host: str  # Bluetooth address reported by the brick, it identifies the brick over usb as well.
+    name: str
+
+    def to_dict(self) -> dict:
+        return self._asdict()
+
+    @classmethod
+    def from_dict(cls, values: dict) -> 'BrickAddress':
+        return cls(**{field: values[field] for field in cls._fields})
+
+
+class BrickAddressStore(JsonStore):
+    """ Json file with the backend and address of the last brick connected to. """
+
+    entry_type = BrickAddress
+    description = 'brick address'
+    key = 'last'
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        super().__init__(path)
+
+    def get(self) -> Optional[BrickAddress]:
+        return self.get_entry(self.key)
+
+    def save(self, address: BrickAddress):
+        self.save_entry(self.key, address)
+
+
+def load_libusb():
+    """ Load the libusb bundled with libusb_package, pyusb reuses it when the usb backend looks for devices. """
+    try:
+        import libusb_package
+    except ImportError:
+        logger.debug('libusb_package is not installed, pyusb looks for a system libusb')
+        return
+    libusb_package.get_libusb1_backend()
+
+
+def get_backend(name: str):
+    """ nxt-python backend by module name, imported on first use. None when it isn't available on this platform. """
+    if name == 'usb':
+        load_libusb()
+    return importlib.import_module(f'nxt.backend.{name}').get_backend()
+
+
+class BrickLocator:
+    """
+        Finds the brick, trying the backend and address of the last successful connection first.
+        Over bluetooth a known address skips device discovery. Only when that brick can't be reached every backend
+        is searched, like nxt.locator.find does.
+    """
+
+    def __init__(self, store: Optional[BrickAddressStore] = None, cache: bool = True):
+        self.store = BrickAddressStore() if store is None else store
+        self.cache = cache
+        self.cached = False  # Whether the last find connected to the stored address.
+        self.address: Optional[BrickAddress] = None
+
+    def _find_cached(self, address: BrickAddress) -> Optional[Brick]:
+        import nxt.locator
+        try:
+            backend = get_backend(address.backend)
+        except ImportError:
+            logger.info('Backend %s of the last connection is not available', address.backend)
+            return None
+        if backend is None:
+            return None
+        try:
+            return nxt.locator.find(backends=[backend], host=address.host, config=None)
+        except nxt.locator.BrickNotFoundError:
+            logger.info('Brick %s is not reachable via %s, searching', address.name, address.backend)
+            return None
+
+    def find(self) -> Brick:
+        """ Connect to the brick and remember how it was found. Raises nxt.locator.BrickNotFoundError when there is none. """
+        import nxt.locator
+        stored = self.store.get() if self.cache else None
+        brick = None if stored is None else self._find_cached(stored)
+        self.cached = brick is not None
+        if self.cached:
+            # The locator already checked the address of the brick.
+            self.address = stored
+        else:
+            load_libusb()
+            brick = nxt.locator.find()
+            name, host, _, _ = brick.get_device_info()
+            self.address = BrickAddress(brick._sock.type, host, name)
+            self.store.save(self.address)
+        logger.info('Connected to %s via %s%s', self.address.name, self.address.backend, ' (cached address)' if self.cached else '')
+        return brick
+
+
+def find_brick(store: Optional[BrickAddressStore] = None, cache: bool = True) -> Brick:
+    return BrickLocator(store, cache).find()
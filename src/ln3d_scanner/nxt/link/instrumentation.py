@@ -0,0 +1,205 @@
+import atexit
+import bisect
+import collections
+import contextlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from typing import Dict, Iterator, List, Optional
+
+from nxt.brick import Brick
+from nxt.telegram import Opcode, Telegram
+
+from . import scheduler  # Circular, the scheduler instruments its brick. Only used at call time.
+
+
+logger = logging.getLogger(__name__)
+
+
+ENV_VAR = 'LN3D_INSTRUMENT'  # 1 logs a summary at exit, any other value is a json file to write it to.
+
+BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5)  # Upper bounds of the latency histogram in seconds.
+
+# Frames of these modules are skipped when looking for the caller of a brick command.
+_SKIPPED_MODULES = ('nxt.', 'ln3d_scanner.nxt.link.', 'ln3d_scanner.nxt.simulator.', 'concurrent.', 'threading', 'asyncio.', 'functools')
+
+
+def opcode_name(opcode: int) -> str:
+    try:
+        return Opcode(opcode).name
+    except ValueError:
+        return hex(opcode)
+
+
+def find_caller() -> str:
+    """ Return module and function of the first frame outside nxt and the link layer. """
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if not module.startswith(_SKIPPED_MODULES):
+            return f'{module}.{frame.f_code.co_name}'
+        frame = frame.f_back
+    return 'unknown'
+
+
+class LatencyHistogram:
+    """ Count, total, max and bucketed latency of one command. """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)  # Last bucket holds everything slower than the last bound.
+
+    def add(self, latency: float):
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+        self.buckets[bisect.bisect_left(BUCKETS, latency)] += 1
+
+    def to_dict(self) -> dict:
+        buckets = {f'<={bound * 1000:g}ms': count for bound, count in zip(BUCKETS, self.buckets)}
+        buckets['slower'] = self.buckets[-1]
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'max': self.max,
+            'buckets': buckets,
+        }
+
+
+class BrickInstrumentation:
+    """ Counts brick commands per opcode and per caller, with latency histograms of the commands that have a reply. """
+
+    def __init__(self):
+        self.commands = collections.Counter()  # Opcode name -> telegrams sent.
+        self.callers = collections.Counter()  # (caller, opcode name) -> telegrams sent.
+        self.latency: Dict[str, LatencyHistogram] = collections.defaultdict(LatencyHistogram)  # Opcode name -> reply latency.
+        self.caller_time = collections.Counter()  # (caller, opcode name) -> seconds waited for replies.
+        self._lock = threading.Lock()
+
+    def record_send(self, opcode: str, caller: str):
+        with self._lock:
+            self.commands[opcode] += 1
+            self.callers[caller, opcode] += 1
+
+    def record_reply(self, opcode: str, caller: str, latency: float):
+        with self._lock:
+            self.latency[opcode].add(latency)
+            self.caller_time[caller, opcode] += latency
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                'commands': dict(self.commands),
+                'callers': {f'{caller} {opcode}': count for (caller, opcode), count in self.callers.most_common()},
+                'latency': {opcode: histogram.to_dict() for opcode, histogram in self.latency.items()},
+                'caller_time': {f'{caller} {opcode}': total for (caller, opcode), total in self.caller_time.most_common()},
+            }
+
+    def summary(self) -> str:
+        lines = ['Brick commands:']
+        for opcode, count in self.commands.most_common():
+            histogram = self.latency.get(opcode)
+            if histogram is None:
+                lines.append(f'  {opcode:<28}{count:>8}  no reply')
+            else:
+                lines.append(f'  {opcode:<28}{count:>8}  mean {histogram.total / histogram.count * 1000:.1f}ms max {histogram.max * 1000:.1f}ms')
+        lines.append('Callers:')
+        for (caller, opcode), count in self.callers.most_common():
+            lines.append(f'  {caller} {opcode}: {count} ({self.caller_time[caller, opcode] * 1000:.0f}ms waiting in total)')
+        return '\n'.join(lines)
+
+
+class InstrumentedSock:
+    """ Wraps the socket of a brick and records every telegram. Replies are matched to requests in order. """
+
+    def __init__(self, sock, instrumentation: BrickInstrumentation):
+        self.sock = sock
+        self.instrumentation = instrumentation
+        self._pending = collections.deque()  # (opcode, caller, send time) of requests waiting for a reply.
+        self._local = threading.local()
+
+    def __getattr__(self, name: str):
+        return getattr(self.sock, name)
+
+    @contextlib.contextmanager
+    def caller(self, caller: Optional[str]):
+        """ Attribute the telegrams sent within the block to caller, used when sending on behalf of another thread. """
+        previous = getattr(self._local, 'caller', None)
+        self._local.caller = caller
+        try:
+            yield
+        finally:
+            self._local.caller = previous
+
+    def send(self, data: bytes):
+        opcode = opcode_name(data[1])
+        caller = getattr(self._local, 'caller', None) or find_caller()
+        self.instrumentation.record_send(opcode, caller)
+        if not data[0] & Telegram.TYPE_REPLY_NOT_REQUIRED:
+            self._pending.append((opcode, caller, time.perf_counter()))
+        self.sock.send(data)
+
+    def recv(self) -> bytes:
+        data = self.sock.recv()
+        if self._pending:
+            opcode, caller, sent = self._pending.popleft()
+            self.instrumentation.record_reply(opcode, caller, time.perf_counter() - sent)
+        return data
+
+
+def get_instrumentation(brick: Brick) -> Optional[BrickInstrumentation]:
+    sock = scheduler.connection(brick)._sock
+    return sock.instrumentation if isinstance(sock, InstrumentedSock) else None
+
+
+def instrument(brick: Brick, instrumentation: Optional[BrickInstrumentation] = None) -> BrickInstrumentation:
+    """ Start recording the commands of the brick. Does nothing if it is instrumented already. """
+    brick = scheduler.connection(brick)
+    if isinstance(brick._sock, InstrumentedSock):
+        return brick._sock.instrumentation
+    instrumentation = BrickInstrumentation() if instrumentation is None else instrumentation
+    with brick._lock:
+        brick._sock = InstrumentedSock(brick._sock, instrumentation)
+    return instrumentation
+
+
+def uninstrument(brick: Brick):
+    brick = scheduler.connection(brick)
+    with brick._lock:
+        if isinstance(brick._sock, InstrumentedSock):
+            brick._sock = brick._sock.sock
+
+
+@contextlib.contextmanager
+def instrumented(brick: Brick) -> Iterator[BrickInstrumentation]:
+    """ Record brick commands within the block and log a summary at the end. """
+    instrumentation = instrument(brick)
+    try:
+        yield instrumentation
+    finally:
+        uninstrument(brick)
+        logger.info(instrumentation.summary())
+
+
+def _dump(instrumentation: BrickInstrumentation, target: str):
+    if target == '1':
+        logger.info(instrumentation.summary())
+        return
+    with open(target, 'w') as f:
+        json.dump(instrumentation.to_dict(), f, indent=2)
+
+
+def instrument_from_env(brick: Brick) -> Optional[BrickInstrumentation]:
+    """ Instrument the brick when the LN3D_INSTRUMENT environment variable is set and dump the summary at exit. """
+    target = os.environ.get(ENV_VAR)
+    if not target or target == '0' or get_instrumentation(brick) is not None:
+        return get_instrumentation(brick)
+    instrumentation = instrument(brick)
+    atexit.register(_dump, instrumentation, target)
+    return instrumentation
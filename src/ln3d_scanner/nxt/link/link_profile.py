@@ -0,0 +1,184 @@
+import logging
+import math
+import statistics
+import time
+import weakref
+
+from typing import Callable, List, Optional
+
+import nxt.motor as Motor
+import nxt.sensor as Sensor
+
+from nxt.brick import Brick
+
+from ln3d_scanner.storage import JsonStore, data_path
+
+from .scheduler import connection
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_PATH = data_path('link_profiles.json')
+
+_profiles = weakref.WeakKeyDictionary()  # Brick -> LinkProfile of the active connection.
+
+
+class LinkProfile:
+    """
+        Measured latency and jitter of a brick connection in seconds.
+        Thresholds and poll rate are derived from the measurements instead of a table per transport.
+    """
+
+    max_speed = 800  # Tacho units per second of a motor at full power.
+
+    def __init__(self, name: str, method: str, output_state_latency: float, output_state_jitter: float,
+                 set_state_latency: float, touch_latency: Optional[float] = None, touch_jitter: Optional[float] = None,
+                 created: Optional[float] = None):
+        self.name = name
+        self.method = method
+        self.output_state_latency = output_state_latency
+        self.output_state_jitter = output_state_jitter
+        self.set_state_latency = set_state_latency
+        self.touch_latency = touch_latency
+        self.touch_jitter = touch_jitter
+        self.created = time.time() if created is None else created
+
+    @property
+    def key(self) -> str:
+        return profile_key(self.name, self.method)
+
+    @property
+    def threshold(self) -> int:
+        """ Tacho units a motor at full speed travels between the tacho sample and the stop command landing. """
+        delay = self.output_state_latency + self.set_state_latency + 2 * self.output_state_jitter
+        return max(5, math.ceil(self.max_speed * delay))
+
+    @property
+    def frequency(self) -> float:
+        """ Poll rate at which sleeping takes about as long as a tacho request. """
+        period = self.output_state_latency + 2 * self.output_state_jitter
+        return min(200.0, 1 / max(period, 0.005))
+
+    def is_drifted(self, latency: float, tolerance: float = 0.5) -> bool:
+        """ Return if a newly measured latency is too far off the profiled latency. """
+        allowed = max(tolerance * self.output_state_latency, 3 * self.output_state_jitter, 0.002)
+        return abs(latency - self.output_state_latency) > allowed
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'method': self.method,
+            'output_state_latency': self.output_state_latency,
+            'output_state_jitter': self.output_state_jitter,
+            'set_state_latency': self.set_state_latency,
+            'touch_latency': self.touch_latency,
+            'touch_jitter': self.touch_jitter,
+            'created': self.created,
+        }
+
+    @classmethod
+    def from_dict(cls, values: dict) -> 'LinkProfile':
+        return cls(**values)
+
+    def __str__(self):
+        return (f"Link profile {self.key}: get state {self.output_state_latency * 1000:.1f}ms "
+                f"(+-{self.output_state_jitter * 1000:.1f}ms), threshold {self.threshold}, frequency {self.frequency:.0f}Hz")
+
+
+def profile_key(name: str, method: str) -> str:
+    return f"{name}/{method}"
+
+
+def _time_calls(call: Callable[[], object], samples: int) -> List[float]:
+    durations = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        call()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def measure_output_state_latency(brick: Brick, port: Motor.Port = Motor.Port.A, samples: int = 5) -> float:
+    """ Median round trip of get_output_state. """
+    return statistics.median(_time_calls(lambda: brick.get_output_state(port), samples))
+
+
+def profile_link(brick: Brick, motor_port: Motor.Port = Motor.Port.A, touch_port: Optional[Sensor.Port] = None, samples: int = 20) -> LinkProfile:
+    """
+        Measure the round trip latency and jitter of the connected brick.
+        set_output_state has no reply, it is timed together with a get_output_state and the get latency is subtracted.
+        The motor state is written back unchanged so nothing moves.
+    """
+    name = brick.get_device_info()[0]
+    method = brick._sock.type
+
+    get_durations = _time_calls(lambda: brick.get_output_state(motor_port), samples)
+    get_latency = statistics.median(get_durations)
+
+    state = brick.get_output_state(motor_port)[:7]
+
+    def set_and_get():
+        brick.set_output_state(*state)
+        brick.get_output_state(motor_port)
+    set_latency = max(0.0, statistics.median(_time_calls(set_and_get, samples)) - get_latency)
+
+    touch_latency = touch_jitter = None
+    if touch_port is not None:
+        touch_durations = _time_calls(lambda: brick.get_input_values(touch_port), samples)
+        touch_latency = statistics.median(touch_durations)
+        touch_jitter = statistics.pstdev(touch_durations)
+
+    profile = LinkProfile(name, method, get_latency, statistics.pstdev(get_durations), set_latency, touch_latency, touch_jitter)
+    logger.info(str(profile))
+    return profile
+
+
+class LinkProfileStore(JsonStore):
+    """ Json file with link profiles keyed by brick name and transport. """
+
+    entry_type = LinkProfile
+    description = 'link profile'
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        super().__init__(path)
+
+    def get(self, name: str, method: str) -> Optional[LinkProfile]:
+        return self.get_entry(profile_key(name, method))
+
+    def save(self, profile: LinkProfile):
+        self.save_entry(profile.key, profile)
+
+
+def get_link_profile(brick: Brick) -> Optional[LinkProfile]:
+    """ Return the profile registered for the brick, if any. """
+    return _profiles.get(connection(brick))
+
+
+def set_link_profile(brick: Brick, profile: Optional[LinkProfile]):
+    brick = connection(brick)
+    if profile is None:
+        _profiles.pop(brick, None)
+    else:
+        _profiles[brick] = profile
+
+
+def load_link_profile(brick: Brick, store: Optional[LinkProfileStore] = None, motor_port: Motor.Port = Motor.Port.A,
+                      touch_port: Optional[Sensor.Port] = None, tolerance: float = 0.5) -> LinkProfile:
+    """
+        Load the cached profile of the brick and register it for motors and sensors created afterwards.
+        A few requests are timed to verify the cached profile, the link is only profiled again when latency drifted.
+    """
+    store = LinkProfileStore() if store is None else store
+    name = brick.get_device_info()[0]
+    method = brick._sock.type
+    profile = store.get(name, method)
+    if profile is not None:
+        latency = measure_output_state_latency(brick, motor_port)
+        if profile.is_drifted(latency, tolerance):
+            logger.info(f'Link latency drifted to {latency * 1000:.1f}ms, profiling again.')
+            profile = None
+    if profile is None:
+        profile = profile_link(brick, motor_port, touch_port)
+        store.save(profile)
+    set_link_profile(brick, profile)
+    return profile
@@ -0,0 +1,43 @@
+from typing import Iterable, List
+
+import nxt.motor as Motor
+
+from nxt.brick import Brick
+from nxt.telegram import Opcode, Telegram
+
+from .scheduler import BrickScheduler
+from .telegrams import get_output_state_telegram, parse_output_state, set_output_state_telegram, reset_position_telegram
+
+
+def get_output_states(brick: Brick, ports: Iterable[Motor.Port]) -> List[tuple]:
+    """
+        Get the output state of several ports in one effective round trip.
+        All requests are sent back to back before the replies are collected, replies arrive in request order.
+    """
+    ports = list(ports)
+    if isinstance(brick, BrickScheduler):
+        return brick.get_output_states(ports)
+    with brick._lock:
+        for port in ports:
+            brick._sock.send(get_output_state_telegram(port).to_bytes())
+        replies = [Telegram(opcode=Opcode.DIRECT_GET_OUT_STATE, pkt=brick._sock.recv()) for _ in ports]
+    return [parse_output_state(reply) for reply in replies]
+
+
+def _send_no_reply(brick: Brick, tgrams: List[Telegram]):
+    """ Send telegrams back to back without other commands in between. """
+    if isinstance(brick, BrickScheduler):
+        return brick.send_no_reply(tgrams)
+    with brick._lock:
+        for tgram in tgrams:
+            brick._sock.send(tgram.to_bytes())
+
+
+def set_output_states(brick: Brick, states: Iterable[list]):
+    """ Send several set_output_state commands in no reply mode. Each state is [port, power, mode, regulation_mode, turn_ratio, run_state, tacho_limit]. """
+    _send_no_reply(brick, [set_output_state_telegram(*state) for state in states])
+
+
+def reset_motor_positions(brick: Brick, ports: Iterable[Motor.Port], relative: bool):
+    """ Reset the motor positions of several ports in no reply mode. """
+    _send_no_reply(brick, [reset_position_telegram(port, relative) for port in ports])
@@ -0,0 +1,161 @@
+import collections
+import contextlib
+import logging
+import struct
+import threading
+import time
+
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional
+
+from nxt.brick import Brick
+from nxt.telegram import Telegram
+
+from .scheduler import connection
+
+
+logger = logging.getLogger(__name__)
+
+
+MAGIC = b'LN3DREC1'
+
+SEND = 0
+RECV = 1
+
+# Kind, seconds since the recording started, telegram length. The telegram bytes follow.
+ENTRY = struct.Struct('<BdB')
+
+
+class RecordedExchange(NamedTuple):
+    request: bytes
+    sent: float  # Seconds since the recording started.
+    reply: Optional[bytes]  # None for commands without reply.
+    received: Optional[float]
+
+    @property
+    def latency(self) -> Optional[float]:
+        return None if self.received is None else self.received - self.sent
+
+
+class Recording(NamedTuple):
+    method: str  # Connection type of the recorded session, usb or bluetooth.
+    exchanges: List[RecordedExchange]
+
+    @property
+    def duration(self) -> float:
+        if not self.exchanges:
+            return 0.0
+        last = self.exchanges[-1]
+        return (last.sent if last.received is None else last.received) - self.exchanges[0].sent
+
+    @property
+    def round_trips(self) -> int:
+        return sum(exchange.reply is not None for exchange in self.exchanges)
+
+    def to_dict(self) -> dict:
+        return {
+            'method': self.method,
+            'telegrams': len(self.exchanges),
+            'round_trips': self.round_trips,
+            'duration': self.duration,
+        }
+
+
+class RecordingSock:
+    """
+        Wraps the socket of a brick and writes every telegram with its timestamp to a compact binary file:
+        magic, connection type, then per telegram its kind, time and bytes.
+    """
+
+    def __init__(self, sock, f: BinaryIO):
+        self.sock = sock
+        self.file = f
+        self.start = time.monotonic()
+        self._lock = threading.Lock()
+        method = getattr(sock, 'type', '').encode()
+        f.write(MAGIC + struct.pack('<B', len(method)) + method)
+
+    def __getattr__(self, name: str):
+        return getattr(self.sock, name)
+
+    def _write(self, kind: int, data: bytes):
+        with self._lock:
+            if not self.file.closed:
+                self.file.write(ENTRY.pack(kind, time.monotonic() - self.start, len(data)) + data)
+
+    def send(self, data: bytes):
+        self._write(SEND, data)
+        self.sock.send(data)
+
+    def recv(self) -> bytes:
+        data = self.sock.recv()
+        self._write(RECV, data)
+        return data
+
+    def close(self):
+        with self._lock:
+            self.file.close()
+        self.sock.close()
+
+
+def read_recording(f: BinaryIO, source: str = 'file') -> Recording:
+    """ Read telegrams written by a RecordingSock. Replies are matched to requests in order. """
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f'{source} is not a brick recording.')
+    length, = struct.unpack('<B', f.read(1))
+    method = f.read(length).decode()
+    exchanges, pending = [], collections.deque()
+    while True:
+        header = f.read(ENTRY.size)
+        if len(header) < ENTRY.size:
+            break  # A session that didn't close cleanly ends mid entry.
+        kind, timestamp, length = ENTRY.unpack(header)
+        data = f.read(length)
+        if kind == SEND:
+            exchange = RecordedExchange(data, timestamp, None, None)
+            if not data[0] & Telegram.TYPE_REPLY_NOT_REQUIRED:
+                pending.append(len(exchanges))
+            exchanges.append(exchange)
+        elif pending:
+            index = pending.popleft()
+            exchanges[index] = exchanges[index]._replace(reply=data, received=timestamp)
+    # Requests still waiting for a reply when the recording stopped can't be replayed as round trips.
+    for index in reversed(pending):
+        del exchanges[index]
+    return Recording(method, exchanges)
+
+
+def load_recording(path: str) -> Recording:
+    with open(path, 'rb') as f:
+        return read_recording(f, path)
+
+
+def record(brick: Brick, path: str) -> RecordingSock:
+    """ Start writing the telegrams of the brick to path. Closing the brick closes the file. Record before instrumenting. """
+    brick = connection(brick)
+    with brick._lock:
+        brick._sock = RecordingSock(brick._sock, open(path, 'wb'))
+        logger.info('Recording brick telegrams to %s', path)
+        return brick._sock
+
+
+def stop_recording(brick: Brick):
+    brick = connection(brick)
+    with brick._lock:
+        sock = brick._sock
+        if isinstance(sock, RecordingSock):
+            with sock._lock:
+                sock.file.close()
+            brick._sock = sock.sock
+
+
+@contextlib.contextmanager
+def recorded(brick: Brick, path: Optional[str]) -> Iterator[Optional[RecordingSock]]:
+    """ Record the telegrams of the brick within the block, does nothing when path is None. """
+    if path is None:
+        yield None
+        return
+    sock = record(brick, path)
+    try:
+        yield sock
+    finally:
+        stop_recording(brick)
@@ -0,0 +1,292 @@
+import contextlib
+import enum
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterable, List, Optional
+
+import nxt.motor as Motor
+import nxt.sensor as Sensor
+
+from nxt.brick import Brick
+from nxt.telegram import Opcode, Telegram
+
+from .instrumentation import InstrumentedSock, find_caller, instrument_from_env
+from .telegrams import (get_output_state_telegram, parse_output_state, set_output_state_telegram, reset_position_telegram,
+                        get_input_values_telegram, parse_input_values, set_input_mode_telegram)
+
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(enum.IntEnum):
+    """ Lower values are sent first within a cycle. """
+    STOP = 0  # Brake, idle or zero power commands.
+    COMMAND = 1  # Other motor and sensor commands.
+    MOTOR = 2  # Motor state reads.
+    SENSOR = 3  # Sensor polling.
+    OTHER = 4  # Sounds, device info, ...
+
+
+class _Request:
+
+    __slots__ = ('priority', 'seq', 'name', 'tgrams', 'parser', 'key', 'call', 'future', 'submitted', 'caller')
+
+    def __init__(self, priority: int, seq: int, name: str, tgrams: List[Telegram] = (), parser: Optional[Callable] = None,
+                 key: Optional[tuple] = None, call: Optional[Callable] = None, caller: Optional[str] = None):
+        self.priority = priority
+        self.seq = seq
+        self.name = name
+        self.tgrams = list(tgrams)
+        self.parser = parser
+        self.key = key
+        self.call = call
+        self.future = Future()
+        self.submitted = time.perf_counter()
+        self.caller = caller  # Only set when the brick is instrumented.
+
+    def __lt__(self, other: '_Request') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class SchedulerStats:
+    """ Queue depth and per command latency (submit till completion) of a scheduler. """
+
+    def __init__(self):
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.cycles = 0
+        self.coalesced = 0
+        self.latency: Dict[str, List[float]] = {}  # Command -> [count, total, max]
+
+    def record(self, name: str, latency: float):
+        count, total, maximum = self.latency.get(name, (0, 0.0, 0.0))
+        self.latency[name] = [count + 1, total + latency, max(maximum, latency)]
+
+    def to_dict(self) -> dict:
+        return {
+            'queue_depth': self.queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+            'cycles': self.cycles,
+            'coalesced': self.coalesced,
+            'latency': {
+                name: {'count': count, 'mean': total / count, 'max': maximum}
+                for name, (count, total, maximum) in self.latency.items()
+            },
+        }
+
+
+class BrickScheduler:
+    """
+        Owns the brick transport and serves requests from any number of motors and sensors.
+        Requests are queued and sent in cycles: stop commands before other commands before motor reads before sensor polling.
+        Commands to the same port keep their submission order, a stop never overtakes a run command queued before it.
+        All reads of a cycle are pipelined and duplicate pending reads (same motor state or sensor value) share one round trip.
+        Can be used anywhere a nxt Brick is expected.
+    """
+
+    def __init__(self, brick: Brick):
+        self.brick = brick
+        instrument_from_env(brick)
+        self.stats = SchedulerStats()
+        self._queue: List[_Request] = []
+        self._pending_reads: Dict[tuple, _Request] = {}
+        self._pending_ports: Dict[tuple, int] = {}  # Port -> highest priority value of the commands queued for it.
+        self._seq = itertools.count()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name='brick-scheduler', daemon=True)
+        self._worker.start()
+
+    @property
+    def _sock(self):
+        """ Motors read the connection type from the socket. """
+        return self.brick._sock
+
+    def __getattr__(self, name: str):
+        """ Any other brick method is executed by the scheduler thread. """
+        attribute = getattr(self.brick, name)
+        if not callable(attribute):
+            return attribute
+        return lambda *args, **kwargs: self._wait(self._submit([
+            dict(priority=Priority.OTHER, name=name, call=lambda: attribute(*args, **kwargs))
+        ]))[0]
+
+    def _submit(self, requests: List[dict]) -> List[Future]:
+        """ Queue requests at once so they end up in the same cycle. """
+        futures = []
+        caller = find_caller() if isinstance(self.brick._sock, InstrumentedSock) else None
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('Scheduler is closed.')
+            for values in requests:
+                ports = values.pop('ports', ())
+                if ports:
+                    # Sent after the commands already queued for its ports, so the last command submitted wins.
+                    values['priority'] = max([values['priority']] + [self._pending_ports.get(port, 0) for port in ports])
+                    for port in ports:
+                        self._pending_ports[port] = values['priority']
+                key = values.get('key')
+                if key is not None and key in self._pending_reads:
+                    self.stats.coalesced += 1
+                    futures.append(self._pending_reads[key].future)
+                    continue
+                request = _Request(seq=next(self._seq), caller=caller, **values)
+                heapq.heappush(self._queue, request)
+                if key is not None:
+                    self._pending_reads[key] = request
+                futures.append(request.future)
+            self.stats.queue_depth = len(self._queue)
+            self.stats.max_queue_depth = max(self.stats.max_queue_depth, self.stats.queue_depth)
+            self._condition.notify()
+        return futures
+
+    def _wait(self, futures: Iterable[Future]) -> list:
+        return [future.result() for future in futures]
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                cycle = [heapq.heappop(self._queue) for _ in range(len(self._queue))]
+                self._pending_reads.clear()  # New reads won't share replies that are already being fetched.
+                self._pending_ports.clear()
+                self.stats.queue_depth = 0
+                self.stats.cycles += 1
+            self._process(cycle)
+
+    def _complete(self, request: _Request, result=None, exception: Optional[BaseException] = None):
+        self.stats.record(request.name, time.perf_counter() - request.submitted)
+        if exception is not None:
+            request.future.set_exception(exception)
+        else:
+            request.future.set_result(result)
+
+    def _caller(self, request: _Request):
+        """ Attribute instrumented telegrams to the thread that submitted the request. """
+        sock = self.brick._sock
+        if isinstance(sock, InstrumentedSock):
+            return sock.caller(request.caller)
+        return contextlib.nullcontext()
+
+    def _process(self, cycle: List[_Request]):
+        """ Send all telegrams of the cycle in priority order, then collect the pipelined replies and run calls. """
+        waiting = []
+        try:
+            with self.brick._lock:
+                for request in cycle:
+                    if request.call is not None:
+                        continue
+                    with self._caller(request):
+                        for tgram in request.tgrams:
+                            self.brick._sock.send(tgram.to_bytes())
+                    if request.parser is None:
+                        self._complete(request)
+                    else:
+                        waiting.append(request)
+                while waiting:
+                    request = waiting[0]
+                    reply = Telegram(opcode=request.tgrams[0].opcode, pkt=self.brick._sock.recv())
+                    waiting.pop(0)
+                    try:
+                        self._complete(request, request.parser(reply))
+                    except Exception as e:
+                        self._complete(request, exception=e)
+        except Exception as e:
+            logger.exception('Brick transport failed.')
+            for request in cycle:
+                if request.call is None and not request.future.done():
+                    self._complete(request, exception=e)
+        for request in cycle:
+            if request.call is None:
+                continue
+            try:
+                with self._caller(request):
+                    result = request.call()
+                self._complete(request, result)
+            except Exception as e:
+                self._complete(request, exception=e)
+
+    @staticmethod
+    def _command_priority(tgram: Telegram) -> Priority:
+        """ Zero power set_output_state commands stop a motor and go first. """
+        data = tgram.to_bytes()
+        if data[1] == Opcode.DIRECT_SET_OUT_STATE.value and data[3] == 0:
+            return Priority.STOP
+        return Priority.COMMAND
+
+    @staticmethod
+    def _command_port(tgram: Telegram) -> Optional[tuple]:
+        """ Output or input port a command addresses, None for commands without one. """
+        data = tgram.to_bytes()
+        if data[1] in (Opcode.DIRECT_SET_OUT_STATE.value, Opcode.DIRECT_RESET_POSITION.value):
+            return 'output', data[2]
+        if data[1] == Opcode.DIRECT_SET_IN_MODE.value:
+            return 'input', data[2]
+        return None
+
+    def send_no_reply(self, tgrams: List[Telegram]):
+        """ Send telegrams back to back and wait till they are sent. """
+        if not tgrams:
+            return
+        priority = min(self._command_priority(tgram) for tgram in tgrams)
+        ports = {port for port in map(self._command_port, tgrams) if port is not None}
+        self._wait(self._submit([dict(priority=priority, name=tgrams[0].opcode.name, tgrams=tgrams, ports=ports)]))
+
+    def get_output_states(self, ports: Iterable[Motor.Port]) -> List[tuple]:
+        return self._wait(self._submit([
+            dict(priority=Priority.MOTOR, name=Opcode.DIRECT_GET_OUT_STATE.name, tgrams=[get_output_state_telegram(port)],
+                 parser=parse_output_state, key=(Opcode.DIRECT_GET_OUT_STATE, port))
+            for port in ports
+        ]))
+
+    def get_output_state(self, port: Motor.Port) -> tuple:
+        return self.get_output_states([port])[0]
+
+    def set_output_state(self, port: Motor.Port, power: int, mode: Motor.Mode, regulation_mode: Motor.RegulationMode,
+                         turn_ratio: int, run_state: Motor.RunState, tacho_limit: int):
+        self.send_no_reply([set_output_state_telegram(port, power, mode, regulation_mode, turn_ratio, run_state, tacho_limit)])
+
+    def reset_motor_position(self, port: Motor.Port, relative: bool):
+        self.send_no_reply([reset_position_telegram(port, relative)])
+
+    def get_input_values(self, port: Sensor.Port) -> tuple:
+        return self._wait(self._submit([
+            dict(priority=Priority.SENSOR, name=Opcode.DIRECT_GET_IN_VALS.name, tgrams=[get_input_values_telegram(port)],
+                 parser=parse_input_values, key=(Opcode.DIRECT_GET_IN_VALS, port))
+        ]))[0]
+
+    def set_input_mode(self, port: Sensor.Port, sensor_type: Sensor.Type, sensor_mode: Sensor.Mode):
+        self.send_no_reply([set_input_mode_telegram(port, sensor_type, sensor_mode)])
+
+    def get_motor(self, port: Motor.Port) -> Motor.Motor:
+        return Motor.Motor(self, port)
+
+    def get_sensor(self, port: Sensor.Port, cls: type, *args, **kwargs):
+        """ Sensors are created on the scheduler so their requests are queued as well. Autodetection isn't supported. """
+        return cls(self, port, *args, **kwargs)
+
+    def close(self):
+        """ Stop the scheduler thread after the queued requests are sent. The brick stays open. """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self._worker.join()
+
+    def __enter__(self) -> 'BrickScheduler':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def connection(brick: Brick) -> Brick:
+    """ The brick a scheduler owns, any other brick as is. Profiles, instrumentation and recordings belong to the connection. """
+    return brick.brick if isinstance(brick, BrickScheduler) else brick
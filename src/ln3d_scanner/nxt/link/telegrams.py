@@ -0,0 +1,77 @@
+import nxt.motor as Motor
+import nxt.sensor as Sensor
+
+from nxt.telegram import Opcode, Telegram
+
+
+def get_output_state_telegram(port: Motor.Port) -> Telegram:
+    tgram = Telegram(Opcode.DIRECT_GET_OUT_STATE)
+    tgram.add_u8(port.value)
+    return tgram
+
+
+def parse_output_state(tgram: Telegram) -> tuple:
+    """ Parse a get_output_state reply the same way nxt.brick.Brick.get_output_state does. """
+    tgram.check_status()
+    return (
+        Motor.Port(tgram.parse_u8()),
+        tgram.parse_s8(),
+        Motor.Mode(tgram.parse_u8()),
+        Motor.RegulationMode(tgram.parse_u8()),
+        tgram.parse_s8(),
+        Motor.RunState(tgram.parse_u8()),
+        tgram.parse_u32(),
+        tgram.parse_s32(),
+        tgram.parse_s32(),
+        tgram.parse_s32(),
+    )
+
+
+def set_output_state_telegram(port: Motor.Port, power: int, mode: Motor.Mode, regulation_mode: Motor.RegulationMode,
+                              turn_ratio: int, run_state: Motor.RunState, tacho_limit: int) -> Telegram:
+    tgram = Telegram(Opcode.DIRECT_SET_OUT_STATE, reply_req=False)
+    tgram.add_u8(port.value)
+    tgram.add_s8(power)
+    tgram.add_u8(mode.value)
+    tgram.add_u8(regulation_mode.value)
+    tgram.add_s8(turn_ratio)
+    tgram.add_u8(run_state.value)
+    tgram.add_u32(tacho_limit)
+    return tgram
+
+
+def reset_position_telegram(port: Motor.Port, relative: bool) -> Telegram:
+    tgram = Telegram(Opcode.DIRECT_RESET_POSITION, reply_req=False)
+    tgram.add_u8(port.value)
+    tgram.add_bool(relative)
+    return tgram
+
+
+def get_input_values_telegram(port: Sensor.Port) -> Telegram:
+    tgram = Telegram(Opcode.DIRECT_GET_IN_VALS)
+    tgram.add_u8(port.value)
+    return tgram
+
+
+def parse_input_values(tgram: Telegram) -> tuple:
+    """ Parse a get_input_values reply the same way nxt.brick.Brick.get_input_values does. """
+    tgram.check_status()
+    return (
+        Sensor.Port(tgram.parse_u8()),
+        tgram.parse_bool(),
+        tgram.parse_bool(),
+        Sensor.Type(tgram.parse_u8()),
+        Sensor.Mode(tgram.parse_u8()),
+        tgram.parse_u16(),
+        tgram.parse_u16(),
+        tgram.parse_s16(),
+        tgram.parse_s16(),
+    )
+
+
+def set_input_mode_telegram(port: Sensor.Port, sensor_type: Sensor.Type, sensor_mode: Sensor.Mode) -> Telegram:
+    tgram = Telegram(Opcode.DIRECT_SET_IN_MODE, reply_req=False)
+    tgram.add_u8(port.value)
+    tgram.add_u8(sensor_type.value)
+    tgram.add_u8(sensor_mode.value)
+    return tgram
@@ -1,3 +1,8 @@
 from .precision_motor import PrecisionMotor
 from .inverted_motor import InvertedMotor
-from .dual_motors import DualMotors
\ No newline at end of file
+from .motor_group import MotorGroup, GroupTacho, GroupState
+from .dual_motors import DualMotors
+from .motion_profile import MotionProfile
+from .motor_model import MotorModel, MotorModelStore, identify_motors, load_motor_models
+from .stop_predictor import StopPredictor
+from .skew_controller import SkewController, SkewStats
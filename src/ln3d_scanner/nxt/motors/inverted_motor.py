@@ -5,14 +5,15 @@ from .precision_motor import PrecisionMotor
 
 class InvertedMotor(PrecisionMotor):
 
-    def _set_state(self, state):
+    sign = -1
+
+    def _prepare_state(self, state):
         state.power *= -1  # Invert state power.
         #state.tacho_limit *= -1  # Inver tacho limit.
-        return super()._set_state(state)
+        return super()._prepare_state(state)
     
-    def _read_state(self):
+    def _parse_state(self, values):
         """ Invert power back to default values. """
-        values = self.brick.get_output_state(self.port)
         state, tacho = get_tacho_and_state(values)
         state.power *= -1  # Invert
         # state.tacho_limit *= -1
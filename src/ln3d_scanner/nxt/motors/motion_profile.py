@@ -0,0 +1,57 @@
+import math
+
+from typing import Optional
+
+from .motor_model import MotorModel
+
+
+class MotionProfile:
+    """
+        Trapezoidal power profile of a turn, computed from the tacho units travelled and remaining.
+        Power ramps from start_power to the turn power over ramp_up units, cruises, and ramps down to end_power over the
+        ramp_down units before the last creep units, which run at end_power. Long moves cruise at full power and still
+        arrive at a steady, slow speed, so the stop is predicted from a speed that no longer changes.
+        Power is rounded to step, so a new state is only sent when the power changed noticeably.
+    """
+
+    def __init__(self, ramp_up: int = 60, ramp_down: int = 360, start_power: int = 30, end_power: int = 20, creep: int = 90, step: int = 5):
+        self.ramp_up = ramp_up
+        self.ramp_down = ramp_down
+        self.creep = creep
+        self.start_power = abs(start_power)
+        self.end_power = abs(end_power)
+        self.step = max(1, step)
+
+    @classmethod
+    def for_model(cls, model: MotorModel, power: int, latency: Optional[float] = None, end_power: int = 20, margin: float = 2,
+                  **kwargs) -> 'MotionProfile':
+        """
+            Profile with a ramp down long enough for an identified motor to slow from power to end_power,
+            margin times the distance it needs at its acceleration, plus what it travels in one round trip.
+            It creeps for two round trips at end_power, so at least one tacho sample is taken at the final speed.
+        """
+        speed, end_speed = model.speed(power), model.speed(end_power)
+        slow_down = (speed ** 2 - end_speed ** 2) / (2 * model.acceleration)
+        ramp_down = math.ceil(margin * slow_down + speed * (latency or 0))
+        kwargs.setdefault('creep', max(1, math.ceil(2 * end_speed * (latency or 0.02))))
+        return cls(ramp_down=max(1, ramp_down), end_power=end_power, **kwargs)
+
+    def power(self, power: int, travelled: float, remaining: float) -> int:
+        """ Signed power to run at, power is the cruise power of the turn. """
+        peak = abs(power)
+        level = peak
+        if self.ramp_up > 0:
+            level = min(level, self.start_power + (peak - self.start_power) * max(0.0, travelled) / self.ramp_up)
+        if self.ramp_down > 0:
+            level = min(level, self.end_power + (peak - self.end_power) * max(0.0, remaining - self.creep) / self.ramp_down)
+        level = max(min(self.start_power, self.end_power, peak), level)
+        level = min(peak, self.step * round(level / self.step))
+        return level if power > 0 else -level
+
+    def threshold(self, threshold: int, power: int) -> int:
+        """ Stop threshold at power, thresholds are sized for full power and shrink with the speed of the approach. """
+        return max(1, round(threshold * abs(power) / 100))
+
+    def __str__(self):
+        return (f'Motion profile: ramp up {self.ramp_up} units from {self.start_power}, '
+                f'ramp down {self.ramp_down} units to {self.end_power}, creep {self.creep} units')
@@ -0,0 +1,422 @@
+
+from array import array
+from typing import List, Optional, Sequence
+
+from nxt.motor import TachoInfo, OutputState
+from typing_extensions import Self
+
+from ln3d_scanner.timer import LN3DTimer, run_blocking, run_sync
+from ln3d_scanner.nxt.link import get_link_profile, get_output_states, set_output_states, reset_motor_positions
+from ln3d_scanner.telemetry import get_recorder
+from .motion_profile import MotionProfile
+from .precision_motor import PrecisionMotor
+from .stop_predictor import StopPredictor
+from .skew_controller import SkewController
+
+
+class StateMismatchException(Exception):
+    pass
+
+
+def _shared(name: str) -> property:
+    """ Property of a GroupState that reads the same value from every state and sets it on all of them. """
+
+    def getter(self):
+        value = getattr(self.states[0], name)
+        if any(getattr(state, name) != value for state in self.states):
+            raise StateMismatchException()
+        return value
+
+    def setter(self, value):
+        for state in self.states:
+            setattr(state, name, value)
+
+    return property(getter, setter)
+
+
+class GroupState:
+    """ Output states of every motor of a group. Reading a property raises on mismatch, setting it sets all motors. """
+
+    def __init__(self, *states: OutputState):
+        self.states = list(states)
+
+    power = _shared('power')
+    mode = _shared('mode')
+    regulation_mode = _shared('regulation_mode')
+    turn_ratio = _shared('turn_ratio')
+    run_state = _shared('run_state')
+    tacho_limit = _shared('tacho_limit')
+
+
+class GroupTacho:
+    """
+        Tacho counts of every motor of a group in preallocated arrays. Samples are read into an existing GroupTacho
+        and the checks of the turn loop handle all motors in one pass, a poll doesn't create objects per motor.
+    """
+
+    __slots__ = ('counts', 'block_counts', 'rotation_counts')
+
+    def __init__(self, size: int):
+        self.counts = array('q', bytes(8 * size))
+        self.block_counts = array('q', bytes(8 * size))
+        self.rotation_counts = array('q', bytes(8 * size))
+
+    @classmethod
+    def from_tachos(cls, tachos: Sequence[TachoInfo]) -> Self:
+        group = cls(len(tachos))
+        for index, tacho in enumerate(tachos):
+            group.counts[index] = tacho.tacho_count
+            group.block_counts[index] = tacho.block_tacho_count or 0
+            group.rotation_counts[index] = tacho.rotation_count or 0
+        return group
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def copy_from(self, other: 'GroupTacho'):
+        self.counts[:] = other.counts
+        self.block_counts[:] = other.block_counts
+        self.rotation_counts[:] = other.rotation_counts
+
+    def motor(self, index: int) -> TachoInfo:
+        """ TachoInfo of one motor. """
+        return TachoInfo([self.counts[index], self.block_counts[index], self.rotation_counts[index]])
+
+    @property
+    def tacho_count(self) -> int:
+        """ Returns the average tacho count. """
+        return int(sum(self.counts) / len(self.counts))
+
+    @property
+    def block_tacho_count(self) -> int:
+        """ Return the average block tacho count. """
+        return int(sum(self.block_counts) / len(self.block_counts))
+
+    @property
+    def rotation_count(self) -> int:
+        """ Return the average rotation count. """
+        return int(sum(self.rotation_counts) / len(self.rotation_counts))
+
+    def get_target(self, tacho_limit: int, direction: int, out: Optional['GroupTacho'] = None) -> 'GroupTacho':
+        """ Tacho of every motor after moving tacho_limit in direction (1 or -1), written into out when given. """
+        if abs(direction) != 1:
+            raise ValueError("invalid direction")
+        out = type(self)(len(self)) if out is None else out
+        offset = direction * tacho_limit
+        for index, count in enumerate(self.counts):
+            out.counts[index] = count + offset
+        return out
+
+    def is_greater(self, target: 'GroupTacho', direction: int, motor: Optional[int] = None) -> bool:
+        """ If a motor index is provided, return if that motor passed the target, otherwise if the average did. """
+        if motor is not None:
+            return direction * (self.counts[motor] - target.counts[motor]) > 0
+        return direction * (self.tacho_count - target.tacho_count) > 0
+
+    def is_near(self, target: 'GroupTacho', threshold: int, motor: Optional[int] = None) -> bool:
+        """ If a motor index is provided return if that motor is near the target, otherwise if the average is. """
+        if motor is not None:
+            return abs(target.counts[motor] - self.counts[motor]) < threshold
+        return abs(target.tacho_count - self.tacho_count) < threshold
+
+    def reached(self, target: 'GroupTacho', threshold: int, direction: int) -> List[bool]:
+        """ Per motor, near or past the target. """
+        return [abs(goal - count) < threshold or direction * (count - goal) > 0 for count, goal in zip(self.counts, target.counts)]
+
+    def blocked(self, last_tacho: 'GroupTacho', direction: int) -> List[bool]:
+        """ Per motor, not moved in direction since last_tacho. """
+        return [direction * (last - count) >= 0 for count, last in zip(self.counts, last_tacho.counts)]
+
+    def __str__(self):
+        return "Group tacho stats: \n" + "\n".join(f"  {index}: {self.motor(index)}" for index in range(len(self)))
+
+
+class MotorGroup(PrecisionMotor):
+    """
+        Any number of motors turned as one. Each motor runs and stops on its own target, all requests for the
+        group are pipelined. When synchronized, every motor after the first is trimmed to keep up with the first.
+    """
+
+    state_type = GroupState
+    tacho_type = GroupTacho
+
+    def __init__(self, motors: Sequence[PrecisionMotor], **kwargs):
+        motors = list(motors)
+        if not motors:
+            raise ValueError('A motor group needs at least one motor.')
+        profile = get_link_profile(motors[0].brick)
+        if profile is not None:
+            kwargs.setdefault('frequency', profile.frequency)
+        LN3DTimer.__init__(self, **kwargs)  # Skip precision motor init.
+        self.motors = motors
+        self.ports = [motor.port for motor in motors]
+        self.skews = [SkewController() for _ in motors[1:]]  # Skew of every other motor to the first.
+
+    def __len__(self) -> int:
+        return len(self.motors)
+
+    @property
+    def brick(self):
+        return self.motors[0].brick
+
+    @property
+    def method(self) -> str:
+        return self.motors[0].method
+
+    def reset_position(self, relative):
+        reset_motor_positions(self.brick, self.ports, relative)
+        for skew in self.skews:
+            skew.reset()  # Motors are assumed to be aligned when reset.
+
+    def _get_new_state(self) -> GroupState:
+        """ Careful the motors may not like each others state. """
+        return self.state_type(*(motor._get_new_state() for motor in self.motors))
+
+    def _set_state(self, state: GroupState):
+        set_output_states(self.brick, [motor._prepare_state(motor_state) for motor, motor_state in zip(self.motors, state.states)])
+
+    def _set_states(self, indices: Sequence[int], states: Sequence[OutputState]):
+        """ Send the states of some of the motors at once. """
+        set_output_states(self.brick, [self.motors[index]._prepare_state(state) for index, state in zip(indices, states)])
+
+    def brake(self):
+        self._set_state(self.state_type(*(motor._brake_state() for motor in self.motors)))
+
+    def run(self, power=100, regulated=True):
+        """Warning! After calling this method, make sure to call idle. The
+        motors are reported to behave wildly otherwise.
+        """
+        self._set_state(self.state_type(*(motor._run_state(power, regulated) for motor in self.motors)))
+
+    def idle(self):
+        """ Idle all motors. """
+        self._set_state(self.state_type(*(motor._idle_state() for motor in self.motors)))
+
+    def _eta(self, tacho, target, power):
+        """ Returns the eta of the slowest motor when all are identified, otherwise the average guess. """
+        etas = [motor._eta(tacho.motor(index), target.motor(index), power) for index, motor in enumerate(self.motors)]
+        if all(motor.model is not None for motor in self.motors):
+            return max(etas)
+        return sum(etas) / len(etas)
+
+    def move_time(self, tacho_units: int, power: int):
+        """ Seconds till the slowest motor stopped, None unless all motors are identified. """
+        times = [motor.move_time(tacho_units, power) for motor in self.motors]
+        return None if None in times else max(times)
+
+    def _is_blocked(self, tacho: GroupTacho, last_tacho: GroupTacho, direction: int, motor: Optional[int] = None):
+        """ Return if any motor is blocked, or the motor at index motor if provided. """
+        blocked = tacho.blocked(last_tacho, direction)
+        return any(blocked) if motor is None else blocked[motor]
+
+    def _parse_tacho(self, replies: Sequence[tuple], out: GroupTacho) -> GroupTacho:
+        """ Write get_output_state replies into out. Only the power of the cached motor states is updated. """
+        counts, block_counts, rotation_counts = out.counts, out.block_counts, out.rotation_counts
+        for index, (motor, values) in enumerate(zip(self.motors, replies)):
+            sign = motor.sign
+            motor._state.power = sign * values[1]
+            counts[index] = sign * values[7]
+            block_counts[index] = sign * values[8]
+            rotation_counts[index] = sign * values[9]
+        return out
+
+    def read_tacho(self, out: GroupTacho) -> GroupTacho:
+        """ Read the tacho of all motors into out in one pipelined round trip. """
+        start = self.now()
+        replies = get_output_states(self.brick, self.ports)
+        end = self.now()
+        for motor in self.motors:
+            motor._update_latency(start, end)
+        return self._parse_tacho(replies, out)
+
+    def _new_tacho(self) -> GroupTacho:
+        return self.tacho_type(len(self.motors))
+
+    def get_tacho(self) -> GroupTacho:
+        """ Returns a new tacho of all motors, the average is the tacho of the group. """
+        return self.read_tacho(self._new_tacho())
+
+    def record_tacho(self, recorder, tacho: GroupTacho):
+        """ Add the last read tacho of every motor to a telemetry recorder, straight from the group arrays. """
+        counts, block_counts = tacho.counts, tacho.block_counts
+        for index, motor in enumerate(self.motors):
+            recorder.record(motor.tacho_time, motor.port.value, counts[index], block_counts[index], motor._state.power, motor.latency)
+
+    @property
+    def latency(self):
+        """ Round trip of a pipelined group tacho request. """
+        latencies = [motor.latency for motor in self.motors if motor.latency is not None]
+        return max(latencies) if latencies else None
+
+    def turn(self, power, tacho_units, brake: bool = True, stop_turn = lambda: False, timeout: int = 1, predictive: bool = False,
+             synchronized: bool = False, profile: Optional[MotionProfile] = None):
+        """
+            Override turn method. We want to run motors separately and not averaged.
+            If one motor spins more than the other the next time it can spin slightly less to keep up.
+            Disable emulation on grouped motors.
+            When predictive is set each motor is braked early based on its own measured velocity and latency.
+            When synchronized is set the power of the other motors is trimmed every poll to keep up with the first
+            and skew left after the move is made up in the next synchronized move.
+            With a profile the power of the group ramps up at the start and down on approach, from the average tacho.
+            Blocking version of turn_async.
+        """
+        return run_sync(self.turn_async(power, tacho_units, brake, stop_turn, timeout, predictive, synchronized, profile))
+
+    async def turn_async(self, power, tacho_units, brake: bool = True, stop_turn = lambda: False, timeout: int = 1, predictive: bool = False,
+                         synchronized: bool = False, profile: Optional[MotionProfile] = None):
+        """ Awaitable turn, brick requests run in a thread so other motors can move at the same time. """
+        tacho_limit = tacho_units
+
+        if tacho_limit < 0:
+            raise ValueError("tacho_units must be greater than 0!")
+
+        # Use a bound of 10 as minimum otherwise moters won't run.
+        tacho_limit = max(10, tacho_limit)
+
+        threshold = self.get_threshold()
+        size = len(self.motors)
+
+        recorder = get_recorder()
+        if recorder is not None:
+            recorder.start_move()
+
+        # Two sample buffers, each poll is read into the older one.
+        tacho, last_tacho = self._new_tacho(), self._new_tacho()
+        await run_blocking(self.read_tacho, tacho)
+        if recorder is not None:
+            self.record_tacho(recorder, tacho)
+        state = self._get_new_state()
+
+        # Update modifiers even if they aren't used, might have been changed
+        base_power = power if profile is None else profile.power(power, 0, tacho_limit)
+        state.power = base_power
+
+        await run_blocking(self._set_state, state)
+
+        direction = 1 if power > 0 else -1
+
+        tacho_target = tacho.get_target(tacho_limit, direction)
+        if synchronized:
+            # The other motors also make up the skew of the previous moves.
+            for index, skew in enumerate(self.skews, 1):
+                tacho_target.counts[index] += skew.start(tacho.counts[0], tacho.counts[index])
+            powers = [base_power] * size
+        blocked = False
+
+        current_time = self.now()
+        last_time = current_time
+
+        start_time = self.now()
+        predictors = [StopPredictor(target, direction, motor.brake_time, motor.model, power, start_time)
+                      for target, motor in zip(tacho_target.counts, self.motors)]
+        for predictor, count, motor in zip(predictors, tacho.counts, self.motors):
+            predictor.update(count, motor.tacho_time)
+        stop_threshold = 1 if predictive else threshold  # The predictors decide when to stop.
+        if profile is not None and not predictive:
+            stop_threshold = profile.threshold(threshold, base_power)
+
+        running = [True] * size
+        target_count = tacho_target.tacho_count  # The average target is fixed for the whole loop.
+
+        async def stop_motors(indices: List[int]):
+            """ Stop the motors at indices with one batch of commands. """
+            for index in indices:
+                running[index] = False
+            states = [self.motors[index]._brake_state() if brake else self.motors[index]._idle_state() for index in indices]
+            await run_blocking(self._set_states, indices, states)
+
+        def time_to_target(now: float):
+            """ Time till the first running motor reaches its target. """
+            etas = [predictor.time_to_target(now) for predictor, is_running in zip(predictors, running) if is_running]
+            etas = [eta for eta in etas if eta is not None]
+            return min(etas) if etas else None
+
+        self.start_loop()
+        while not await run_blocking(stop_turn) and any(running):
+            # Returns if any motor is near, which ever comes first.
+            await self.wait_next_async(self._poll_interval(time_to_target(self.now())))
+
+            if not blocked:  # if still blocked, don't reset the counter
+                last_tacho, tacho = tacho, last_tacho
+                last_time = current_time
+                current_time = self.now()
+
+            await run_blocking(self.read_tacho, tacho)
+            if recorder is not None:
+                self.record_tacho(recorder, tacho)
+            blocked_motors = tacho.blocked(last_tacho, direction)
+            blocked = any(blocked_motors)
+
+            if (current_time - last_time) > timeout:
+                # The motor can be up to 80+ degrees in either direction from target
+                # when using Bluetooth.
+                stopping = [index for index in range(size) if running[index] and blocked_motors[index]]
+                if stopping:
+                    await stop_motors(stopping)
+            else:
+                # Check if motors are near target to stop them.
+                reached = tacho.reached(tacho_target, stop_threshold, direction)
+                stopping = [index for index in range(size) if running[index] and reached[index]]
+                if stopping:
+                    await stop_motors(stopping)
+                if synchronized and any(running) and not all(running):
+                    # Motors are kept together, stop all at once. What is left is made up in the next move.
+                    await stop_motors([index for index in range(size) if running[index]])
+
+            if profile is not None and any(running):
+                remaining = direction * (target_count - tacho.tacho_count)
+                profiled = profile.power(power, tacho_limit - remaining, remaining)
+                if profiled != base_power and not (synchronized and all(running)):
+                    # Synchronized motors get the new power with the next trim.
+                    indices = [index for index in range(size) if running[index]]
+                    await run_blocking(self._set_states, indices, [self.motors[index]._run_state(profiled, True) for index in indices])
+                base_power = profiled
+                if not predictive:
+                    stop_threshold = profile.threshold(threshold, base_power)
+
+            if synchronized and all(running):
+                powers = await self._trim(powers, base_power, tacho)
+
+            for predictor, count, motor in zip(predictors, tacho.counts, self.motors):
+                predictor.update(count, motor.tacho_time)
+            # While a profile slows the motors down the measured velocity lags, predict once they creep at end power.
+            if predictive and (profile is None or abs(base_power) <= profile.end_power):
+                now = self.now()
+                horizon = self._poll_interval(time_to_target(now)) + (self.latency or 0)
+                brake_times = []
+                for index, (motor, predictor) in enumerate(zip(self.motors, predictors)):
+                    delay = predictor.brake_delay(now, motor.latency)
+                    if running[index] and delay is not None and delay < horizon:
+                        brake_times.append((now + delay, index))
+                # Brake each motor at its own moment, the others may keep running.
+                for brake_at, index in sorted(brake_times):
+                    await self.wait_async(max(0, brake_at - self.now()))
+                    await stop_motors([index])
+
+        if brake:
+            await self.stop_async()
+        if synchronized:
+            await run_blocking(self.read_tacho, tacho)
+            for index, skew in enumerate(self.skews, 1):
+                skew.finish(tacho.counts[0], tacho.counts[index])
+
+    async def _trim(self, powers: List[int], power: int, tacho: GroupTacho) -> List[int]:
+        """ Send new powers when a skew controller changed them. The first motor runs at the lowest power asked for. Returns the powers sent. """
+        trimmed = [power] + [0] * len(self.skews)
+        for index, skew in enumerate(self.skews, 1):
+            first, trimmed[index] = skew.update(power, tacho.counts[0], tacho.counts[index])
+            if abs(first) < abs(trimmed[0]):
+                trimmed[0] = first
+        if trimmed != powers:
+            await run_blocking(self._set_state, self.state_type(*(motor._run_state(motor_power, True) for motor, motor_power in zip(self.motors, trimmed))))
+        return trimmed
+
+    def stop(self):
+        """ Stops motors. """
+        run_sync(self.stop_async())
+
+    async def stop_async(self):
+        """ Awaitable stop. """
+        await run_blocking(self.brake)
+        await self.wait_async(.5)  # wait for .5 seconds to brake correctly before idle.
+        await run_blocking(self.idle)
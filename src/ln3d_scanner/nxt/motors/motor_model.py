@@ -0,0 +1,278 @@
+import logging
+import math
+import statistics
+import time
+
+from typing import List, Optional, Sequence, Tuple
+
+from ln3d_scanner.storage import JsonStore, data_path
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = data_path('motor_models.json')
+
+
+class MotorModel:
+    """
+        Measured dynamics of one motor on one port.
+        After a run command nothing moves for dead_time seconds, then the motor accelerates at acceleration units/s²
+        to its steady speed, speed_gain * (power - dead_power) units/s. After the brake lands it coasts
+        brake_time * speed + brake_drag * speed² units.
+    """
+
+    def __init__(self, name: str, port: int, dead_time: float, speed_gain: float, dead_power: float, acceleration: float,
+                 brake_time: float, brake_drag: float = 0.0, created: Optional[float] = None):
+        self.name = name
+        self.port = port
+        self.dead_time = dead_time
+        self.speed_gain = speed_gain
+        self.dead_power = dead_power
+        self.acceleration = acceleration
+        self.brake_time = brake_time
+        self.brake_drag = brake_drag
+        self.created = time.time() if created is None else created
+
+    @property
+    def key(self) -> str:
+        return model_key(self.name, self.port)
+
+    def speed(self, power: int) -> float:
+        """ Steady speed in tacho units per second at power. """
+        return max(0.0, self.speed_gain * (abs(power) - self.dead_power))
+
+    def distance(self, elapsed: float, power: int) -> float:
+        """ Tacho units travelled elapsed seconds after the run command. """
+        speed = self.speed(power)
+        moving = elapsed - self.dead_time
+        if moving <= 0 or speed <= 0:
+            return 0.0
+        ramp = speed / self.acceleration
+        if moving < ramp:
+            return 0.5 * self.acceleration * moving ** 2
+        return speed * (moving - ramp / 2)
+
+    def eta(self, tacho_units: float, power: int, elapsed: float = 0.0) -> Optional[float]:
+        """ Seconds from now till tacho_units from the start are reached, elapsed seconds after the run command. None if it never moves. """
+        speed = self.speed(power)
+        if speed <= 0:
+            return None
+        ramp = speed / self.acceleration
+        ramp_distance = 0.5 * speed * ramp
+        if tacho_units < ramp_distance:
+            moving = math.sqrt(2 * max(0.0, tacho_units) / self.acceleration)
+        else:
+            moving = ramp + (tacho_units - ramp_distance) / speed
+        return max(0.0, self.dead_time + moving - elapsed)
+
+    def brake_distance(self, speed: float) -> float:
+        """ Tacho units the motor keeps moving after the brake lands at speed. """
+        speed = abs(speed)
+        return self.brake_time * speed + self.brake_drag * speed ** 2
+
+    def move_time(self, tacho_units: float, power: int) -> Optional[float]:
+        """ Seconds of a turn of tacho_units, from the run command till the motor stopped. """
+        eta = self.eta(tacho_units, power)
+        if eta is None:
+            return None
+        speed = min(self.speed(power), math.sqrt(2 * self.acceleration * max(0.0, tacho_units)))
+        return eta + (2 * self.brake_distance(speed) / speed if speed else 0.0)  # Decelerates about evenly.
+
+    def overhead(self, power: int) -> Optional[float]:
+        """ Seconds a long move at power takes longer than travelling at steady speed: dead time, ramp up and braking. """
+        speed = self.speed(power)
+        if speed <= 0:
+            return None
+        return self.dead_time + speed / self.acceleration / 2 + 2 * self.brake_distance(speed) / speed
+
+    def to_dict(self) -> dict:
+        return {
+            'name': self.name,
+            'port': self.port,
+            'dead_time': self.dead_time,
+            'speed_gain': self.speed_gain,
+            'dead_power': self.dead_power,
+            'acceleration': self.acceleration,
+            'brake_time': self.brake_time,
+            'brake_drag': self.brake_drag,
+            'created': self.created,
+        }
+
+    @classmethod
+    def from_dict(cls, values: dict) -> 'MotorModel':
+        return cls(**values)
+
+    def __str__(self):
+        return (f"{self.key}: dead time {self.dead_time * 1000:.0f}ms, {self.speed(100):.0f} units/s at full power "
+                f"(dead power {self.dead_power:.0f}), acceleration {self.acceleration:.0f} units/s², "
+                f"brake {self.brake_distance(self.speed(100)):.0f} units at full speed")
+
+
+def model_key(name: str, port: int) -> str:
+    return f'{name}/{port}'
+
+
+def _fit_line(xs: Sequence[float], ys: Sequence[float]) -> Tuple[float, float]:
+    """ Least squares slope and intercept. """
+    if len(xs) < 2 or len(set(xs)) < 2:
+        return (ys[0] / xs[0] if xs and xs[0] else 0.0), 0.0
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / sum((x - mean_x) ** 2 for x in xs)
+    return slope, mean_y - slope * mean_x
+
+
+def _counts(tacho) -> List[int]:
+    """ Tacho count of every motor of a group, or of a single motor. """
+    return list(tacho.counts) if hasattr(tacho, 'counts') else [tacho.tacho_count]
+
+
+def _test_move(motor, power: int, tacho_units: int, timeout: float) -> dict:
+    """
+        Run motor (a motor or group) at power till it moved tacho_units, brake and wait till it stopped.
+        Returns the samples of every motor as (time, count) and the moment the brake was sent.
+    """
+    start_counts = _counts(motor.get_tacho())
+    samples = [[] for _ in start_counts]
+    start = motor.now()
+    motor.run(power, True)
+    direction = 1 if power > 0 else -1
+    while motor.now() - start < timeout:
+        counts = _counts(motor.get_tacho())
+        sample_time = _sample_time(motor)
+        moved = [direction * (count - first) for count, first in zip(counts, start_counts)]
+        for motor_samples, distance in zip(samples, moved):
+            motor_samples.append((sample_time, distance))
+        if min(moved) >= tacho_units:
+            break
+    brake_sent = motor.now()
+    motor.brake()
+    last, stable = None, 0
+    while stable < 3 and motor.now() - brake_sent < timeout:
+        counts = _counts(motor.get_tacho())
+        stable = stable + 1 if counts == last else 0
+        last = counts
+    motor.idle()
+    stops = [direction * (count - first) for count, first in zip(last, start_counts)]
+    return {'start': start, 'brake_sent': brake_sent, 'samples': samples, 'stops': stops}
+
+
+def _sample_time(motor) -> float:
+    motors = getattr(motor, 'motors', [motor])
+    return motors[0].tacho_time
+
+
+def _analyse(move: dict, index: int, latency: float) -> Optional[dict]:
+    """ Dead time, steady speed, acceleration and coasting distance of one motor in one test move. """
+    samples = move['samples'][index]
+    start = move['start']
+    moving = [position for position, (_, distance) in enumerate(samples) if distance >= 2]
+    if len(moving) < 4:
+        return None
+    first = moving[0]
+    before_time = samples[first - 1][0] if first > 0 else start
+    dead_time = max(0.0, (before_time + samples[first][0]) / 2 - start)
+    steady = samples[first + (len(samples) - first) // 2:]
+    if len(steady) < 2:
+        return None
+    speed, _ = _fit_line([sample_time for sample_time, _ in steady], [distance for _, distance in steady])
+    if speed <= 0:
+        return None
+    end_time, end_distance = samples[-1]
+    ramp = max(1e-3, 2 * (end_time - start - dead_time - end_distance / speed))
+    # Position when the brake landed, extrapolated from the last sample.
+    landed = end_distance + speed * (move['brake_sent'] - end_time + latency / 2)
+    return {'dead_time': dead_time, 'speed': speed, 'acceleration': speed / ramp, 'coast': max(0.0, move['stops'][index] - landed)}
+
+
+def identify_motors(motor, powers: Sequence[int] = (40, 70, 100), tacho_units: int = 360, timeout: float = 5) -> List[MotorModel]:
+    """
+        Run a test move per power and fit a MotorModel for every motor of motor (a PrecisionMotor or MotorGroup).
+        Moves alternate direction, so the motors end about where they started. Motors of one axle are identified together.
+    """
+    motors = getattr(motor, 'motors', [motor])
+    name = motor.brick.get_device_info()[0]
+    results = [[] for _ in motors]
+    for number, power in enumerate(powers):
+        signed = power if number % 2 == 0 else -power
+        move = _test_move(motor, signed, tacho_units, timeout)
+        latency = motor.latency or 0
+        for index in range(len(motors)):
+            result = _analyse(move, index, latency)
+            if result is not None:
+                results[index].append((abs(power), result))
+        time.sleep(0.2)
+
+    models = []
+    for single, measured in zip(motors, results):
+        if not measured:
+            raise RuntimeError(f'Motor on port {single.port} did not move, can not identify it.')
+        gain, intercept = _fit_line([power for power, _ in measured], [result['speed'] for _, result in measured])
+        speeds = [result['speed'] for _, result in measured]
+        coasts = [result['coast'] for _, result in measured]
+        if len(measured) > 1 and len(set(speeds)) > 1:
+            brake_time, brake_drag = _fit_brake(speeds, coasts)
+        else:
+            brake_time, brake_drag = statistics.mean(coast / speed for coast, speed in zip(coasts, speeds)), 0.0
+        model = MotorModel(
+            name, single.port.value,
+            dead_time=statistics.median(result['dead_time'] for _, result in measured),
+            speed_gain=gain,
+            dead_power=max(0.0, -intercept / gain) if gain > 0 else 0.0,
+            acceleration=statistics.median(result['acceleration'] for _, result in measured),
+            brake_time=brake_time,
+            brake_drag=brake_drag,
+        )
+        logger.info(f'Identified {model}')
+        models.append(model)
+    return models
+
+
+def _fit_brake(speeds: Sequence[float], coasts: Sequence[float]) -> Tuple[float, float]:
+    """ Least squares coast = a * speed + b * speed², without intercept. Falls back to linear when b comes out negative. """
+    s2 = sum(speed ** 2 for speed in speeds)
+    s3 = sum(speed ** 3 for speed in speeds)
+    s4 = sum(speed ** 4 for speed in speeds)
+    c1 = sum(coast * speed for coast, speed in zip(coasts, speeds))
+    c2 = sum(coast * speed ** 2 for coast, speed in zip(coasts, speeds))
+    determinant = s2 * s4 - s3 ** 2
+    if determinant > 0:
+        linear = (c1 * s4 - c2 * s3) / determinant
+        quadratic = (s2 * c2 - s3 * c1) / determinant
+        if linear >= 0 and quadratic >= 0:
+            return linear, quadratic
+    return max(0.0, c1 / s2), 0.0
+
+
+class MotorModelStore(JsonStore):
+    """ Json file with motor models keyed by brick name and port. """
+
+    entry_type = MotorModel
+    description = 'motor model'
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        super().__init__(path)
+
+    def get(self, name: str, port: int) -> Optional[MotorModel]:
+        return self.get_entry(model_key(name, port))
+
+    def save(self, *models: MotorModel):
+        self.save_entries({model.key: model for model in models})
+
+
+def load_motor_models(motor, store: Optional[MotorModelStore] = None, identify: bool = True, **kwargs) -> List[Optional[MotorModel]]:
+    """
+        Set the stored models on motor (a PrecisionMotor or MotorGroup). When a motor has none and identify is set, the
+        motors are identified with test moves (kwargs go to identify_motors) and the models are stored.
+    """
+    store = MotorModelStore() if store is None else store
+    motors = getattr(motor, 'motors', [motor])
+    name = motor.brick.get_device_info()[0]
+    models = [store.get(name, single.port.value) for single in motors]
+    if identify and any(model is None for model in models):
+        models = identify_motors(motor, **kwargs)
+        store.save(*models)
+    for single, model in zip(motors, models):
+        if model is not None:
+            single.set_model(model)
+    return models
@@ -1,20 +1,133 @@
-from nxt.motor import Motor, BlockedException
 
-from ln3d_scanner.timer import LN3DTimer
+from typing import Optional
+
+from nxt.motor import Motor, BlockedException, Mode, RegulationMode, RunState, get_tacho_and_state
+
+from ln3d_scanner.timer import LN3DTimer, run_blocking, run_sync
+from ln3d_scanner.nxt.link import get_link_profile, set_output_states
+from ln3d_scanner.telemetry import get_recorder
+from .motion_profile import MotionProfile
+from .motor_model import MotorModel
+from .stop_predictor import StopPredictor
 
 
 class PrecisionMotor(Motor, LN3DTimer):
 
+    brake_time = 0.02  # Seconds the motor keeps moving after the brake command arrives.
+    latency = None  # Measured round trip time of tacho requests in seconds.
+    tacho_time = None  # Estimated time the last tacho was sampled on the brick.
+    sign = 1  # Sign of power and tacho as seen by this class relative to the brick.
+    model = None  # Identified MotorModel, see set_model.
+
     def __init__(self, brick, port, **kwargs):
+        profile = get_link_profile(brick)
+        if profile is not None:
+            kwargs.setdefault('frequency', profile.frequency)
         Motor.__init__(self, brick, port)
         LN3DTimer.__init__(self, **kwargs)
+        if profile is not None:
+            self.latency = profile.output_state_latency
+
+    def _read_state(self):
+        return self._parse_state(self.brick.get_output_state(self.port))
+
+    def _parse_state(self, values):
+        """ Parse get_output_state values into the state and tacho. Allows reading several motors at once. """
+        self._state, tacho = get_tacho_and_state(values)
+        return self._state, tacho
+
+    def _prepare_state(self, state) -> list:
+        """ Store the state and return the values to send with set_output_state. """
+        self._state = state
+        return [self.port] + state.to_list()
+
+    def _set_state(self, state):
+        set_output_states(self.brick, [self._prepare_state(state)])
+
+    def _brake_state(self):
+        """ State that holds the motor in place. """
+        state = self._get_new_state()
+        state.power = 0
+        state.mode = Mode.ON | Mode.BRAKE | Mode.REGULATED
+        return state
+
+    def _idle_state(self):
+        """ State that stops the motor without holding it. """
+        state = self._get_new_state()
+        state.power = 0
+        state.mode = Mode.IDLE
+        state.regulation_mode = RegulationMode.IDLE
+        state.run_state = RunState.IDLE
+        return state
+
+    def _run_state(self, power: int, regulated: bool):
+        """ State that runs the motor continuously. """
+        state = self._get_new_state()
+        state.power = power
+        if not regulated:
+            state.mode = Mode.ON
+        return state
+
+    def _profiled_state(self, power: int, tacho_limit: Optional[int] = None):
+        """ State of a turn running at a new power, with the remaining tacho limit when the brick runs the limit. """
+        state = self._get_new_state()
+        state.power = power
+        if tacho_limit is not None:
+            state.tacho_limit = max(1, tacho_limit)
+        return state
+
+    def run(self, power=100, regulated=False):
+        self._set_state(self._run_state(power, regulated))
+
+    def brake(self):
+        self._set_state(self._brake_state())
+
+    def run_limited(self, power: int, tacho_units: int):
+        """ Let the brick brake the motor after tacho_units. Nothing is polled so link latency doesn't matter, precise for short slow moves. """
+        state = self._run_state(power, True)
+        state.mode = state.mode | Mode.BRAKE
+        state.tacho_limit = tacho_units
+        self._set_state(state)
+
+    def idle(self):
+        self._set_state(self._idle_state())
+
+    def _update_latency(self, start: float, end: float):
+        """ Track the round trip of a tacho request made between start and end. """
+        round_trip = end - start
+        self.latency = round_trip if self.latency is None else 0.8 * self.latency + 0.2 * round_trip
+        self.tacho_time = (start + end) / 2  # The brick answers roughly halfway.
 
     def get_tacho(self):
+        """ Returns the tacho and measures the round trip latency of the request. """
+        start = self.now()
         tacho = super().get_tacho()
+        self._update_latency(start, self.now())
         return tacho
 
+    def record_tacho(self, recorder, tacho):
+        """ Add the last read tacho to a telemetry recorder. """
+        recorder.record(self.tacho_time, self.port.value, tacho.tacho_count, tacho.block_tacho_count, self._state.power, self.latency)
+
+    def set_model(self, model: MotorModel):
+        """ Use the identified dynamics for ETAs, poll intervals and the predicted brake distance. """
+        self.model = model
+        self.brake_time = model.brake_time
+
+    def _eta(self, current, target, power):
+        """ Returns seconds from current to target, from the model when the motor is identified. """
+        eta = None if self.model is None else self.model.eta(abs(current.tacho_count - target.tacho_count), power)
+        return super()._eta(current, target, power) if eta is None else eta
+
+    def move_time(self, tacho_units: int, power: int):
+        """ Seconds a turn of tacho_units takes till the motor stopped, None without a model. """
+        return None if self.model is None else self.model.move_time(tacho_units, power)
+
     def get_threshold(self) -> int:
-        # TODO Calibrate the new values for ip socket latency.
+        """ Returns the threshold of the profiled link, falls back to guessed values per transport. """
+        profile = get_link_profile(self.brick)
+        if profile is not None:
+            return profile.threshold
         if self.method == "bluetooth":
             threshold = 70
         elif self.method == "usb":
@@ -27,11 +140,24 @@ class PrecisionMotor(Motor, LN3DTimer):
             threshold = 30  # compromise
         return threshold
 
-    def turn(self, power: int, tacho_units: int, brake: bool = True, stop_turn = lambda: False, timeout: int = 1, emulate: bool = True):
+    def _poll_interval(self, time_to_target) -> float:
+        """ Sleep longer when far from the target, based on the estimated time to target and the link latency. """
+        return self.next_interval(time_to_target, self.latency)
+
+    def turn(self, power: int, tacho_units: int, brake: bool = True, stop_turn = lambda: False, timeout: int = 1, emulate: bool = True,
+             predictive: bool = False, profile: Optional[MotionProfile] = None):
         """ 
             Rotate motors with more precision. 
             Set the frequency to the number of state requests to make per second. Default is 30 times per second.
+            When predictive is set the brake is sent early based on the measured velocity and latency instead of the threshold table.
+            With a profile the power ramps up at the start and down on approach instead of running at power throughout.
+            Blocking version of turn_async.
         """
+        return run_sync(self.turn_async(power, tacho_units, brake, stop_turn, timeout, emulate, predictive, profile))
+
+    async def turn_async(self, power: int, tacho_units: int, brake: bool = True, stop_turn = lambda: False, timeout: int = 1,
+                         emulate: bool = True, predictive: bool = False, profile: Optional[MotionProfile] = None):
+        """ Awaitable turn, brick requests run in a thread so other motors can move at the same time. """
         tacho_limit = tacho_units
     
         if tacho_limit < 0:
@@ -43,37 +169,50 @@ class PrecisionMotor(Motor, LN3DTimer):
 
         threshold = self.get_threshold()
 
-        tacho = self.get_tacho()
+        recorder = get_recorder()
+        if recorder is not None:
+            recorder.start_move()
+
+        tacho = await run_blocking(self.get_tacho)
+        if recorder is not None:
+            self.record_tacho(recorder, tacho)
         state = self._get_new_state()
 
         # Update modifiers even if they aren't used, might have been changed
-        state.power = power
+        state.power = power if profile is None else profile.power(power, 0, tacho_limit)
         if not emulate:
             state.tacho_limit = tacho_limit
+        sent_power = state.power
+        if profile is not None and not predictive:
+            stop_threshold = profile.threshold(threshold, sent_power)
 
-        self._set_state(state)
+        await run_blocking(self._set_state, state)
 
         direction = 1 if power > 0 else -1
 
         tacho_target = tacho.get_target(tacho_limit, direction)
         blocked = False
 
+        predictor = StopPredictor(tacho_target.tacho_count, direction, self.brake_time, self.model, power, self.now())
+        predictor.update(tacho.tacho_count, self.tacho_time)
+        if profile is None or predictive:
+            stop_threshold = 1 if predictive else threshold  # The predictor decides when to stop.
+
         current_time = self.now()
         last_time = current_time
+        self.start_loop()
         try:
-            while not stop_turn():
-                if not tacho.is_near(tacho_target, 100):
-                    # Only sleep when not near.
-                    self.wait(0.1)
-                else:
-                    self.wait()
+            while not await run_blocking(stop_turn):
+                await self.wait_next_async(self._poll_interval(predictor.time_to_target(self.now())))
 
                 if not blocked:  # if still blocked, don't reset the counter
                     last_tacho = tacho
                     last_time = current_time
                     current_time = self.now()
 
-                tacho = self.get_tacho()
+                tacho = await run_blocking(self.get_tacho)
+                if recorder is not None:
+                    self.record_tacho(recorder, tacho)
                 blocked = self._is_blocked(tacho, last_tacho, direction)
                 if blocked:
                     # The motor can be up to 80+ degrees in either direction from target
@@ -84,14 +223,33 @@ class PrecisionMotor(Motor, LN3DTimer):
                         else:
                             raise BlockedException("Blocked!")
 
-                if tacho.is_near(tacho_target, threshold) or tacho.is_greater(
+                if tacho.is_near(tacho_target, stop_threshold) or tacho.is_greater(
                     tacho_target, direction
                 ):
                     break
+
+                if profile is not None:
+                    remaining = direction * (tacho_target.tacho_count - tacho.tacho_count)
+                    profiled = profile.power(power, tacho_limit - remaining, remaining)
+                    if profiled != sent_power:
+                        sent_power = profiled
+                        await run_blocking(self._set_state, self._profiled_state(profiled, None if emulate else remaining))
+                    if not predictive:
+                        stop_threshold = profile.threshold(threshold, sent_power)
+
+                predictor.update(tacho.tacho_count, self.tacho_time)
+                # While a profile slows the motor down the measured velocity lags, predict once it creeps at end power.
+                if predictive and (profile is None or abs(sent_power) <= profile.end_power):
+                    now = self.now()
+                    delay = predictor.brake_delay(now, self.latency)
+                    # Brake now or sleep till the brake moment if the next poll would be too late.
+                    if delay is not None and delay < self._poll_interval(predictor.time_to_target(now)) + (self.latency or 0):
+                        await self.wait_async(max(0, delay))
+                        break
         finally:
             if brake:
-                self.brake()
+                await run_blocking(self.brake)
             else:
-                self.idle() 
+                await run_blocking(self.idle)
 
 
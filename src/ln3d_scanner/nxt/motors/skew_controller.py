@@ -0,0 +1,78 @@
+from typing import Optional, Tuple
+
+
+class SkewStats:
+    """ Skew (leader minus follower tacho units) seen during synchronized moves. """
+
+    def __init__(self):
+        self.moves = 0
+        self.samples = 0
+        self.total_abs = 0.0
+        self.max_abs = 0
+        self.final = None  # Skew at the end of the last move.
+
+    def record(self, skew: int):
+        self.samples += 1
+        self.total_abs += abs(skew)
+        self.max_abs = max(self.max_abs, abs(skew))
+
+    def finish(self, skew: int):
+        self.moves += 1
+        self.final = skew
+
+    @property
+    def mean_abs(self) -> Optional[float]:
+        return self.total_abs / self.samples if self.samples else None
+
+    def to_dict(self) -> dict:
+        return {
+            'moves': self.moves,
+            'samples': self.samples,
+            'mean_abs': self.mean_abs,
+            'max_abs': self.max_abs,
+            'final': self.final,
+        }
+
+
+class SkewController:
+    """
+        Proportional controller that keeps two motors of one axle together.
+        Skew is how many tacho units the follower is behind the leader, including the residual of earlier moves.
+        The follower power is trimmed by the skew, when it is already at full power the leader is slowed down instead.
+    """
+
+    def __init__(self, gain: float = 0.5, max_trim: int = 30):
+        self.gain = gain
+        self.max_trim = max_trim
+        self.residual = 0  # Skew left after the previous moves.
+        self.stats = SkewStats()
+        self._start = None
+
+    def start(self, leader_tacho: int, follower_tacho: int) -> int:
+        """ Start a move and return the residual skew the follower has to make up. """
+        self._start = (leader_tacho, follower_tacho, self.residual)
+        return self.residual
+
+    def skew(self, leader_tacho: int, follower_tacho: int) -> int:
+        leader_start, follower_start, residual = self._start
+        return (leader_tacho - leader_start) - (follower_tacho - follower_start) + residual
+
+    def update(self, power: int, leader_tacho: int, follower_tacho: int) -> Tuple[int, int]:
+        """ Record the skew and return the leader and follower power. """
+        skew = self.skew(leader_tacho, follower_tacho)
+        self.stats.record(skew)
+        trim = max(-self.max_trim, min(self.max_trim, round(self.gain * skew)))
+        follower_power = power + trim
+        excess = follower_power - max(-100, min(100, follower_power))
+        leader_power = max(-100, min(100, power - excess))
+        return leader_power, follower_power - excess
+
+    def finish(self, leader_tacho: int, follower_tacho: int):
+        """ Keep the skew at the end of the move so the next move can make it up. """
+        self.residual = self.skew(leader_tacho, follower_tacho)
+        self.stats.finish(self.residual)
+        self._start = None
+
+    def reset(self):
+        """ Forget the residual, for example after the motor positions are reset. """
+        self.residual = 0
@@ -0,0 +1,54 @@
+from typing import Optional
+
+from .motor_model import MotorModel
+
+
+class StopPredictor:
+    """
+        Predicts when a brake command has to be sent so the motor lands on the target.
+        Velocity is estimated from the two most recent tacho samples, the brake lands half a round trip after sending
+        and the motor keeps moving for brake_time seconds after that.
+        With a motor model the coasting distance comes from the model, and so does the time to target till a velocity is measured.
+    """
+
+    def __init__(self, target: int, direction: int, brake_time: float, model: Optional[MotorModel] = None, power: Optional[int] = None,
+                 start_time: Optional[float] = None):
+        self.target = target
+        self.direction = direction
+        self.brake_time = brake_time
+        self.model = model
+        self.power = power
+        self.start_time = start_time  # When the run command was sent.
+        self.start_count = None
+        self.tacho_count = None
+        self.sample_time = None
+        self.velocity = None  # Tacho units per second.
+
+    def update(self, tacho_count: int, sample_time: float):
+        """ Add a tacho sample taken at sample_time. """
+        if self.start_count is None:
+            self.start_count = tacho_count
+        if self.sample_time is not None and sample_time > self.sample_time:
+            self.velocity = (tacho_count - self.tacho_count) / (sample_time - self.sample_time)
+        self.tacho_count = tacho_count
+        self.sample_time = sample_time
+
+    def brake_delay(self, now: float, latency: Optional[float]) -> Optional[float]:
+        """ Return seconds from now until the brake must be sent, negative when late. None if the motor isn't moving towards the target. """
+        if self.velocity is None or self.direction * self.velocity <= 0:
+            return None
+        speed = abs(self.velocity)
+        remaining = self.direction * (self.target - self.tacho_count)
+        one_way = 0 if latency is None else latency / 2
+        if self.model is not None:
+            return self.sample_time + (remaining - self.model.brake_distance(speed)) / speed - one_way - now
+        return self.sample_time + remaining / speed - one_way - self.brake_time - now
+
+    def time_to_target(self, now: float) -> Optional[float]:
+        """ Return estimated seconds from now until the target is reached. None if the motor isn't moving towards the target. """
+        if self.velocity is None and self.model is not None and self.start_time is not None and self.start_count is not None:
+            return self.model.eta(self.direction * (self.target - self.start_count), self.power, now - self.start_time)
+        if self.velocity is None or self.direction * self.velocity <= 0:
+            return None
+        remaining = self.direction * (self.target - self.tacho_count)
+        return self.sample_time + remaining / abs(self.velocity) - now
@@ -1 +1 @@
-from .switch import Switch
\ No newline at end of file
+from .switch import Switch, SwitchEvent
@@ -1,18 +1,42 @@
+import asyncio
+import contextlib
+import logging
+import threading
+
 import nxt.sensor as Sensor
 
 from nxt.brick import Brick
 from nxt.sensor.generic import Touch
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
 from typing_extensions import Self
 
-from ln3d_scanner.timer import LN3DTimer
+from ln3d_scanner.timer import LN3DTimer, run_blocking, run_sync
+from ln3d_scanner.nxt.link import get_link_profile
+
+
+logger = logging.getLogger(__name__)
+
+EVENTS = ('press', 'release', 'long_press')
+
+
+class SwitchEvent(NamedTuple):
+    kind: str  # One of EVENTS.
+    timestamp: float  # Monotonic time of the edge, halfway between the samples either side of it.
+    duration: float  # Seconds the switch was in its previous state, or held for a long press.
 
 
 class Switch(LN3DTimer):
     """
         Wrapper class to act on touch using a timer and duration presses for the touch sensor.
+        With start_sampling (or the sampled context) a background thread reads the sensor at a fixed rate and
+        timestamps the edges, press durations no longer depend on how often the caller polls. Linked motors are
+        braked by the sampling thread on the press edge, before any callback or awaiting coroutine runs.
     """
 
     def __init__(self, brick: Brick, port: Sensor.Port, **kwargs):
+        profile = get_link_profile(brick)
+        if profile is not None:
+            kwargs.setdefault('frequency', profile.frequency)
         super().__init__(**kwargs)
         self.touch = brick.get_sensor(port, Touch)
         self.start_counter = -1
@@ -20,16 +44,208 @@ class Switch(LN3DTimer):
 
         self._pressed_state = None  # Pressed state. can be None true or false
 
+        self.long_press = 1.0  # Seconds held before a long_press event.
+        self.last_event: Optional[SwitchEvent] = None
+        self._sampler: Optional[threading.Thread] = None
+        self._stop_sampling = threading.Event()
+        self._lock = threading.Lock()
+        self._sampled_state: Optional[bool] = None  # Last sampled state, None till the first sample.
+        self._edge_time = 0.0  # Timestamp of the last edge.
+        self._long_pressed = False
+        self._linked: List = []
+        self._callbacks: Dict[str, List[Callable[[SwitchEvent], None]]] = {kind: [] for kind in EVENTS}
+        self._waiters: List[Tuple[str, asyncio.AbstractEventLoop, asyncio.Future]] = []
+
     def _is_pressed(self) -> bool:
         """ Wrapped method to return if the touch sensor is pressed. """
         if self._pressed_state is None:
-            return self.touch.is_pressed()  # Query touch but don't store result.
+            return self.read()  # Query touch but don't store result.
         return self._pressed_state  # Return stored value.
+
+    def read(self) -> bool:
+        """ The sampled state while sampling, otherwise the sensor is read. """
+        if self.sampling:
+            return self._sampled_state
+        return self.touch.is_pressed()
+
+    @property
+    def sampling(self) -> bool:
+        return self._sampler is not None and self._sampled_state is not None
+
+    def start_sampling(self, frequency: Optional[int] = None, long_press: Optional[float] = None):
+        """
+            Read the sensor in a background thread at frequency (the switch frequency by default) till stop_sampling.
+            Returns after the first sample, so the state is known. long_press sets the seconds for long_press events.
+        """
+        if self._sampler is not None:
+            raise RuntimeError('Switch is already sampling.')
+        if long_press is not None:
+            self.long_press = long_press
+        self._stop_sampling.clear()
+        started = threading.Event()
+        self._sampler = threading.Thread(target=self._sample_loop, args=(frequency or self.frequency, started),
+                                         name='switch-sampler', daemon=True)
+        self._sampler.start()
+        started.wait()
+
+    def stop_sampling(self):
+        """ Stop the background thread, pending awaitables are cancelled. """
+        if self._sampler is None:
+            return
+        self._stop_sampling.set()
+        self._sampler.join()
+        self._sampler = None
+        self._sampled_state = None
+        with self._lock:
+            waiters, self._waiters = self._waiters, []
+        for _, loop, future in waiters:
+            loop.call_soon_threadsafe(self._cancel, future)
+
+    @contextlib.contextmanager
+    def sampled(self, frequency: Optional[int] = None, motors: Iterable = (), long_press: Optional[float] = None):
+        """ Sample in the background and brake motors on the press edge inside the context. Motors linked before stay linked. """
+        with self._lock:
+            added = [motor for motor in motors if motor not in self._linked]
+        self.link_motors(*added)
+        self.start_sampling(frequency, long_press)
+        try:
+            yield self
+        finally:
+            self.stop_sampling()
+            if added:
+                self.unlink_motors(*added)
+
+    def link_motors(self, *motors):
+        """ Brake these motors (anything with a brake method) directly on the press edge while sampling. """
+        with self._lock:
+            self._linked.extend(motor for motor in motors if motor not in self._linked)
+
+    def unlink_motors(self, *motors):
+        """ Unlink the given motors, or all when none are given. """
+        with self._lock:
+            self._linked = [motor for motor in self._linked if motors and motor not in motors]
+
+    def _on(self, kind: str, callback: Callable[[SwitchEvent], None]) -> Callable[[SwitchEvent], None]:
+        with self._lock:
+            self._callbacks[kind].append(callback)
+        return callback
+
+    def on_press(self, callback: Callable[[SwitchEvent], None]):
+        """ Call callback(event) from the sampling thread on every press. Returns the callback, so it can decorate. """
+        return self._on('press', callback)
+
+    def on_release(self, callback: Callable[[SwitchEvent], None]):
+        return self._on('release', callback)
+
+    def on_long_press(self, callback: Callable[[SwitchEvent], None]):
+        return self._on('long_press', callback)
+
+    def remove_callback(self, callback: Callable[[SwitchEvent], None]):
+        with self._lock:
+            for callbacks in self._callbacks.values():
+                if callback in callbacks:
+                    callbacks.remove(callback)
+
+    async def wait_event_async(self, kind: str, timeout: Optional[float] = None) -> Optional[SwitchEvent]:
+        """ Wait for the next event of kind while sampling, returns None on timeout. """
+        if kind not in EVENTS:
+            raise ValueError(f'Unknown switch event {kind}, expected one of {EVENTS}.')
+        if self._sampler is None:
+            raise RuntimeError('Switch events need start_sampling.')
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            self._waiters.append((kind, loop, future))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            with self._lock:
+                self._waiters = [waiter for waiter in self._waiters if waiter[2] is not future]
+
+    async def wait_press_async(self, timeout: Optional[float] = None) -> Optional[SwitchEvent]:
+        return await self.wait_event_async('press', timeout)
+
+    async def wait_release_async(self, timeout: Optional[float] = None) -> Optional[SwitchEvent]:
+        return await self.wait_event_async('release', timeout)
+
+    async def wait_long_press_async(self, timeout: Optional[float] = None) -> Optional[SwitchEvent]:
+        return await self.wait_event_async('long_press', timeout)
+
+    @staticmethod
+    def _cancel(future: asyncio.Future):
+        if not future.done():
+            future.cancel()
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, event: SwitchEvent):
+        if not future.done():
+            future.set_result(event)
+
+    def _sample(self) -> Tuple[bool, float]:
+        """ Read the sensor, timestamped halfway through the request. """
+        before = self.now()
+        pressed = self.touch.is_pressed()
+        return pressed, (before + self.now()) / 2
+
+    def _sample_loop(self, frequency: int, started: threading.Event):
+        interval = 1 / frequency
+        try:
+            self._sampled_state, last_time = self._sample()
+        except Exception:
+            logger.exception('First switch sample failed.')
+            self._sampled_state, last_time = False, self.now()
+        self._edge_time = last_time
+        self._long_pressed = False
+        started.set()
+        self.start_loop()
+        while not self._stop_sampling.is_set():
+            self.wait_next(interval)
+            try:
+                pressed, timestamp = self._sample()
+            except Exception:
+                logger.exception('Switch sample failed.')
+                continue
+            if pressed != self._sampled_state:
+                if pressed:
+                    self._brake_linked()  # First, the callbacks below can wait.
+                edge_time = (last_time + timestamp) / 2
+                event = SwitchEvent('press' if pressed else 'release', edge_time, edge_time - self._edge_time)
+                self._sampled_state, self._edge_time, self._long_pressed = pressed, edge_time, False
+                self._dispatch(event)
+            elif pressed and not self._long_pressed and timestamp - self._edge_time >= self.long_press:
+                self._long_pressed = True
+                self._dispatch(SwitchEvent('long_press', timestamp, timestamp - self._edge_time))
+            last_time = timestamp
+
+    def _brake_linked(self):
+        with self._lock:
+            motors = list(self._linked)
+        for motor in motors:
+            try:
+                motor.brake()
+            except Exception:
+                logger.exception(f'Failed to brake {motor} on switch press.')
+
+    def _dispatch(self, event: SwitchEvent):
+        self.last_event = event
+        with self._lock:
+            callbacks = list(self._callbacks[event.kind])
+            waiters = [waiter for waiter in self._waiters if waiter[0] == event.kind]
+        for _, loop, future in waiters:
+            loop.call_soon_threadsafe(self._resolve, future, event)
+        for callback in callbacks:
+            try:
+                callback(event)
+            except Exception:
+                logger.exception(f'Switch {event.kind} callback failed.')
         
     def is_pressed(self, duration: int = 0, reset: bool = False, disable_till_depressed: bool = True):
         """ 
             Return if the switch is pressed.
-            Updates internal counter for duration presses, this is based on the last time this function is called.
+            Updates internal counter for duration presses, this is based on the last time this function is called,
+            or on the timestamp of the press edge while sampling.
             duration: time in milliseconds to return true for when pressed. (holding)
             reset: bool whether to reset the counter or continue counting from start press.
             disable_till_depressed: bool wether to disable all other pressed signals until it has been depressed.
@@ -47,7 +263,7 @@ class Switch(LN3DTimer):
             return not disabled
         counter = self.now()
         if self.start_counter < 0:
-            self.start_counter = counter
+            self.start_counter = self._edge_time if self.sampling else counter
         if ((counter - self.start_counter) * 1000) > duration:
             if reset:
                 self.start_counter = -1
@@ -63,22 +279,36 @@ class Switch(LN3DTimer):
     
     def wait_for_press(self, timeout: int = 20):
         """ Hold the program till touch is pressed. Provide timeout in seconds that will break that wait. """
+        run_sync(self.wait_for_press_async(timeout))
+
+    async def wait_for_press_async(self, timeout: int = 20):
+        """ Awaitable wait_for_press, other coroutines keep running while waiting. """
         start = self.now()
         while True:
             # Use real pressed getter, otherwise in context use it will halt for ever.
-            if self.touch.is_pressed() or (self.now() - start) > timeout:
+            if (self.read() if self.sampling else await run_blocking(self.touch.is_pressed)) or (self.now() - start) > timeout:
                 break
-            self.wait()
+            await self.wait_async()
     
     def __enter__(self) -> Self:
         """ When entering, internal pressed state is set. This prevents multiple calls to the sensor in a code block. """
         if self._pressed_state is not None:
             raise ReferenceError('Context is already active')
-        self._pressed_state = self.touch.is_pressed()
+        self._pressed_state = self.read()
         return self
     
     def __exit__(self, exc_type, exc_val, exc_tb):
         """ Reset the read state. """
         if self._pressed_state is None:
             raise ReferenceError('Context closed already.')
-        self._pressed_state = None
\ No newline at end of file
+        self._pressed_state = None
+
+    async def __aenter__(self) -> Self:
+        """ Same as enter, the sensor is read without blocking other coroutines. """
+        if self._pressed_state is not None:
+            raise ReferenceError('Context is already active')
+        self._pressed_state = self.read() if self.sampling else await run_blocking(self.touch.is_pressed)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.__exit__(exc_type, exc_val, exc_tb)
\ No newline at end of file
@@ -0,0 +1,5 @@
+from .transport_profile import TransportProfile, TRANSPORT_PROFILES
+from .simulated_motor import SimulatedMotor
+from .simulated_nxt import SimulatedNXT, SimulatedTouch
+from .simulated_sock import SimulatedSock, Backend, get_backend
+from .replay_sock import ReplaySock, ReplayBackend, ReplayMismatch, get_replay_backend
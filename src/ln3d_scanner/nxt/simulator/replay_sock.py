@@ -0,0 +1,174 @@
+import bisect
+import logging
+import threading
+import time
+
+from collections import Counter, defaultdict, deque
+from typing import Dict, List, Optional, Union
+
+from nxt.brick import Brick
+from nxt.telegram import Opcode, Telegram
+
+from ln3d_scanner.nxt.link.recording import Recording, RecordedExchange, load_recording
+
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayMismatch(Exception):
+    """ A strict replay was sent a request the recorded session didn't send. """
+    pass
+
+
+def request_key(data: bytes) -> bytes:
+    """ Opcode and first parameter, the port for motor and sensor commands, without the reply flag. """
+    return data[1:3]
+
+
+class ReplaySock:
+    """
+        Drop in replacement for the nxt-python backend sockets that answers from a recorded session.
+        Every request gets the reply the brick gave to the same command (opcode and port) at the same time into the
+        recorded session, after the round trip it took then. Changed logic that polls differently or at other moments
+        still reads the tacho and sensor values the brick had at that moment, so round trips and wall time can be
+        compared. Motion follows the recording, commands of the changed logic don't move anything.
+        With strict set every request has to match the recorded one in order, otherwise ReplayMismatch is raised.
+    """
+
+    bsize = 60
+
+    def __init__(self, recording: Union[Recording, str], strict: bool = False):
+        self.recording = load_recording(recording) if isinstance(recording, str) else recording
+        self.type = self.recording.method  # Connection type, used by the motors to evaluate latency.
+        self.strict = strict
+        exchanges = self.recording.exchanges
+        self._origin = exchanges[0].sent if exchanges else 0.0
+        self._times: Dict[bytes, List[float]] = defaultdict(list)
+        self._exchanges: Dict[bytes, List[RecordedExchange]] = defaultdict(list)
+        for exchange in exchanges:
+            if exchange.reply is not None:
+                key = request_key(exchange.request)
+                self._times[key].append(exchange.sent - self._origin)
+                self._exchanges[key].append(exchange)
+        self._position = 0  # Next recorded telegram, for strict replays.
+        self._start = None  # Monotonic time of the first request.
+        self._replies = deque()
+        self._last_reply = 0.0
+        self._lock = threading.Lock()
+
+        self.round_trips = 0
+        self.exchanges = 0  # Times the host waited for replies, pipelined requests share one exchange.
+        self.no_replies = 0
+        self.opcodes = Counter()
+        self._sending = True
+
+    def __str__(self):
+        return f"Replay ({self.type})"
+
+    def connect(self) -> Brick:
+        logger.debug('Replaying %d recorded telegrams via %s', len(self.recording.exchanges), self.type)
+        return Brick(self)
+
+    def close(self):
+        self._replies.clear()
+
+    def reset_stats(self):
+        self.round_trips = 0
+        self.exchanges = 0
+        self.no_replies = 0
+        self.opcodes.clear()
+
+    @property
+    def duration(self) -> float:
+        """ Seconds from the first request of the replay till the last reply. """
+        return 0.0 if self._start is None else max(0.0, self._last_reply - self._start)
+
+    def _strict(self, data: bytes) -> Optional[RecordedExchange]:
+        exchanges = self.recording.exchanges
+        if self._position >= len(exchanges):
+            raise ReplayMismatch(f'Request {data.hex()} sent after the recorded session ended.')
+        exchange = exchanges[self._position]
+        if exchange.request != data:
+            raise ReplayMismatch(f'Request {self._position} is {data.hex()}, the recorded session sent {exchange.request.hex()}.')
+        self._position += 1
+        return exchange
+
+    def _match(self, data: bytes, elapsed: float) -> RecordedExchange:
+        """ Last recorded exchange of the same command sent at or before elapsed, the first one before it was ever sent. """
+        key = request_key(data)
+        if key not in self._times:
+            key = data[1:2]  # Fall back to any reply of the same opcode.
+            for candidate in self._times:
+                if candidate[:1] == key:
+                    key = candidate
+                    break
+            else:
+                raise ReplayMismatch(f'The recorded session never sent {_opcode_name(data)}, can not reply to {data.hex()}.')
+        times = self._times[key]
+        return self._exchanges[key][max(0, bisect.bisect_right(times, elapsed) - 1)]
+
+    def send(self, data: bytes):
+        with self._lock:
+            self._sending = True
+            now = time.monotonic()
+            if self._start is None:
+                self._start = now
+            self.opcodes[_opcode_name(data)] += 1
+            exchange = self._strict(data) if self.strict else None
+            if data[0] & Telegram.TYPE_REPLY_NOT_REQUIRED:
+                self.no_replies += 1
+                return
+            if exchange is None:
+                exchange = self._match(data, now - self._start)
+            self.round_trips += 1
+            # Replies can't overtake each other, like on the recorded link.
+            ready = max(now + exchange.latency, self._last_reply)
+            self._last_reply = ready
+            self._replies.append((ready, exchange.reply))
+
+    def recv(self) -> bytes:
+        with self._lock:
+            ready, reply = self._replies.popleft()
+            if self._sending:
+                self.exchanges += 1
+                self._sending = False
+        delay = ready - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return reply
+
+    def to_dict(self) -> dict:
+        """ Round trips and wall time of the replay next to those of the recorded session. """
+        return {
+            'recorded': self.recording.to_dict(),
+            'replayed': {
+                'method': self.type,
+                'telegrams': sum(self.opcodes.values()),
+                'round_trips': self.round_trips,
+                'effective_round_trips': self.exchanges,
+                'duration': self.duration,
+            },
+        }
+
+
+def _opcode_name(data: bytes) -> str:
+    try:
+        return Opcode(data[1]).name
+    except ValueError:
+        return hex(data[1])
+
+
+class ReplayBackend:
+    """ Replay backend, can be passed to nxt.locator.find(backends=[...]). """
+
+    def __init__(self, recording: Union[Recording, str], **kwargs):
+        self.recording = recording
+        self.kwargs = kwargs
+
+    def find(self, **kwargs):
+        sock = ReplaySock(self.recording, **self.kwargs)
+        yield sock.connect()
+
+
+def get_replay_backend(recording: Union[Recording, str], **kwargs) -> ReplayBackend:
+    return ReplayBackend(recording, **kwargs)
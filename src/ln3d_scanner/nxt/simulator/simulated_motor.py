@@ -0,0 +1,125 @@
+import math
+
+from typing import Optional, Tuple
+
+from nxt.motor import Mode, RegulationMode, RunState
+
+
+class SimulatedMotor:
+    """
+        First order model of a NXT motor.
+        Velocity approaches the commanded speed using a time constant that depends on the motor mode (driven, coast or brake).
+        Position is kept in (fractional) degrees, tacho counters are derived from it.
+    """
+
+    STEP = 0.001  # Integration step in seconds.
+
+    def __init__(self, max_speed: float = 800.0, time_constant: float = 0.06, coast_time_constant: float = 0.12,
+                 brake_time_constant: float = 0.015, deadband: int = 8, load: float = 0.0, limits: Optional[Tuple[float, float]] = None):
+        self.max_speed = max_speed  # Degrees per second at full power.
+        self.time_constant = time_constant
+        self.coast_time_constant = coast_time_constant
+        self.brake_time_constant = brake_time_constant
+        self.deadband = deadband  # Power below which the motor won't overcome friction.
+        self.load = load  # 0 - 1, fraction of speed lost to load when not regulated.
+        self.limits = limits  # Mechanical end stops in degrees.
+
+        self.position = 0.0
+        self.velocity = 0.0
+
+        self.power = 0
+        self.mode = Mode.IDLE
+        self.regulation_mode = RegulationMode.IDLE
+        self.turn_ratio = 0
+        self.run_state = RunState.IDLE
+        self.tacho_limit = 0
+
+        self._limit_start = 0.0
+        self._block_zero = 0.0
+        self._rotation_zero = 0.0
+
+    def set_output_state(self, power: int, mode: Mode, regulation_mode: RegulationMode, turn_ratio: int, run_state: RunState, tacho_limit: int):
+        self.power = power
+        self.mode = mode
+        self.regulation_mode = regulation_mode
+        self.turn_ratio = turn_ratio
+        self.run_state = run_state
+        self.tacho_limit = tacho_limit
+        self._limit_start = self.position
+
+    def get_output_state(self) -> tuple:
+        """ Return values in the order of brick.get_output_state without the port. """
+        return (
+            self.power,
+            self.mode,
+            self.regulation_mode,
+            self.turn_ratio,
+            self.run_state,
+            self.tacho_limit,
+            self.tacho_count,
+            self.block_tacho_count,
+            self.rotation_count,
+        )
+
+    def reset_position(self, relative: bool):
+        if relative:
+            self._block_zero = self.position
+        else:
+            self._rotation_zero = self.position
+
+    @property
+    def tacho_count(self) -> int:
+        return int(round(self.position))
+
+    @property
+    def block_tacho_count(self) -> int:
+        return int(round(self.position - self._block_zero))
+
+    @property
+    def rotation_count(self) -> int:
+        return int(round(self.position - self._rotation_zero))
+
+    @property
+    def is_braking(self) -> bool:
+        return Mode.ON in self.mode and Mode.BRAKE in self.mode and self.power == 0
+
+    def _target(self) -> Tuple[float, float]:
+        """ Return the target velocity and the time constant to reach it. """
+        if Mode.ON not in self.mode or self.run_state == RunState.IDLE:
+            return 0.0, self.coast_time_constant
+        if self.power == 0:
+            if Mode.BRAKE in self.mode:
+                return 0.0, self.brake_time_constant
+            return 0.0, self.coast_time_constant
+        if abs(self.power) < self.deadband:
+            return 0.0, self.coast_time_constant
+        speed = self.max_speed * self.power / 100
+        if Mode.REGULATED in self.mode and self.regulation_mode != RegulationMode.IDLE:
+            speed *= 1 - 0.2 * self.load  # Regulation compensates most of the load.
+        else:
+            speed *= 1 - self.load
+        return speed, self.time_constant
+
+    def _check_tacho_limit(self):
+        if self.tacho_limit and self.run_state != RunState.IDLE and abs(self.position - self._limit_start) >= self.tacho_limit:
+            self.power = 0
+            self.run_state = RunState.IDLE
+            if Mode.BRAKE in self.mode:
+                self.run_state = RunState.RUNNING  # Keep holding position.
+
+    def advance(self, duration: float):
+        """ Integrate the motor state for duration seconds. """
+        while duration > 0:
+            step = min(self.STEP, duration)
+            duration -= step
+            target, time_constant = self._target()
+            decay = math.exp(-step / time_constant)
+            # Exact solution of a first order system over the step.
+            self.position += target * step + (self.velocity - target) * time_constant * (1 - decay)
+            self.velocity = target + (self.velocity - target) * decay
+            if self.limits is not None:
+                low, high = self.limits
+                if self.position < low or self.position > high:
+                    self.position = min(max(self.position, low), high)
+                    self.velocity = 0.0
+            self._check_tacho_limit()
@@ -0,0 +1,157 @@
+import logging
+import threading
+
+from io import BytesIO
+from struct import pack, unpack
+from typing import Callable, Dict, List, Optional, Union
+
+import nxt.motor as Motor
+import nxt.sensor as Sensor
+
+from nxt.telegram import Opcode, Telegram
+
+from .simulated_motor import SimulatedMotor
+
+
+logger = logging.getLogger(__name__)
+
+
+class SimulatedTouch:
+    """ Touch sensor state, either a fixed value or a predicate evaluated against the simulated brick. """
+
+    def __init__(self, pressed: Union[bool, Callable[['SimulatedNXT'], bool]] = False):
+        self.pressed = pressed
+        self.sensor_type = Sensor.Type.NO_SENSOR
+        self.sensor_mode = Sensor.Mode.RAW
+
+    def is_pressed(self, brick: 'SimulatedNXT') -> bool:
+        if callable(self.pressed):
+            return bool(self.pressed(brick))
+        return bool(self.pressed)
+
+
+class SimulatedNXT:
+    """
+        The brick side of a simulated connection.
+        Decodes direct command telegrams, applies them to the motor models at the time they arrive and builds replies.
+    """
+
+    STATUS_UNKNOWN_OPCODE = 0xBE
+
+    def __init__(self, name: str = 'NXT', host: str = '00:16:53:00:00:01', battery_level: int = 8000):
+        self.name = name
+        self.host = host
+        self.battery_level = battery_level
+        self.motors: Dict[Motor.Port, SimulatedMotor] = {port: SimulatedMotor() for port in Motor.Port}
+        self.touch: Dict[Sensor.Port, SimulatedTouch] = {port: SimulatedTouch() for port in Sensor.Port}
+        self.time: Optional[float] = None  # Brick time of the last processed event.
+        self._observers: List[Callable[['SimulatedNXT'], None]] = []
+        self._lock = threading.RLock()
+
+    def motor(self, port: Motor.Port) -> SimulatedMotor:
+        return self.motors[port]
+
+    def set_touch(self, port: Sensor.Port, pressed: Union[bool, Callable[['SimulatedNXT'], bool]]):
+        """ Set a touch sensor value or predicate. """
+        self.touch[port].pressed = pressed
+
+    def add_observer(self, observer: Callable[['SimulatedNXT'], None]):
+        """ Observers are called after every time step with the simulated brick. """
+        self._observers.append(observer)
+
+    def remove_observer(self, observer: Callable[['SimulatedNXT'], None]):
+        self._observers.remove(observer)
+
+    def advance_to(self, time: float):
+        """ Integrate all motors up to the given time. Times before the last event are ignored. """
+        with self._lock:
+            if self.time is None:
+                self.time = time
+            duration = time - self.time
+            if duration <= 0:
+                return
+            for motor in self.motors.values():
+                motor.advance(duration)
+            self.time = time
+            for observer in self._observers:
+                observer(self)
+
+    def handle(self, data: bytes, time: float) -> Optional[bytes]:
+        """ Process a telegram arriving at the given time. Returns the reply packet if one is requested. """
+        with self._lock:
+            self.advance_to(time)
+            pkt_type, opcode = data[0], data[1]
+            reply_req = not (pkt_type & Telegram.TYPE_REPLY_NOT_REQUIRED)
+            payload = BytesIO(data[2:])
+            try:
+                handler = self._handlers[Opcode(opcode)]
+            except (ValueError, KeyError):
+                logger.debug('Unsupported opcode %#02x', opcode)
+                body, status = b'', self.STATUS_UNKNOWN_OPCODE
+            else:
+                body, status = handler(self, payload), 0
+            if not reply_req:
+                return None
+            return bytes((Telegram.TYPE_REPLY, opcode, status)) + body
+
+    def _set_output_state(self, payload: BytesIO) -> bytes:
+        port, power, mode, regulation_mode, turn_ratio, run_state, tacho_limit = unpack('<BbBBbBI', payload.read(11))
+        self.motors[Motor.Port(port)].set_output_state(
+            power, Motor.Mode(mode), Motor.RegulationMode(regulation_mode), turn_ratio, Motor.RunState(run_state), tacho_limit
+        )
+        return b''
+
+    def _get_output_state(self, payload: BytesIO) -> bytes:
+        port = payload.read(1)[0]
+        power, mode, regulation_mode, turn_ratio, run_state, tacho_limit, tacho_count, block_tacho_count, rotation_count = \
+            self.motors[Motor.Port(port)].get_output_state()
+        return pack('<BbBBbBIiii', port, power, mode.value, regulation_mode.value, turn_ratio, run_state.value,
+                    tacho_limit, tacho_count, block_tacho_count, rotation_count)
+
+    def _reset_position(self, payload: BytesIO) -> bytes:
+        port, relative = unpack('<B?', payload.read(2))
+        self.motors[Motor.Port(port)].reset_position(relative)
+        return b''
+
+    def _set_input_mode(self, payload: BytesIO) -> bytes:
+        port, sensor_type, sensor_mode = unpack('<BBB', payload.read(3))
+        touch = self.touch[Sensor.Port(port)]
+        touch.sensor_type = Sensor.Type(sensor_type)
+        touch.sensor_mode = Sensor.Mode(sensor_mode)
+        return b''
+
+    def _get_input_values(self, payload: BytesIO) -> bytes:
+        port = payload.read(1)[0]
+        touch = self.touch[Sensor.Port(port)]
+        pressed = touch.is_pressed(self)
+        raw_value = 183 if pressed else 1023
+        return pack('<B??BBHHhh', port, True, False, touch.sensor_type.value, touch.sensor_mode.value,
+                    raw_value, raw_value, int(pressed), raw_value)
+
+    def _get_battery_level(self, payload: BytesIO) -> bytes:
+        return pack('<H', self.battery_level)
+
+    def _keep_alive(self, payload: BytesIO) -> bytes:
+        return pack('<I', 600000)
+
+    def _device_info(self, payload: BytesIO) -> bytes:
+        address = bytes(int(part, 16) for part in self.host.split(':')) + b'\0'
+        return pack('15s', self.name.encode('ascii')) + address + pack('<II', 0, 0)
+
+    def _no_reply(self, payload: BytesIO) -> bytes:
+        """ Commands that have no effect on the simulation (sounds, ...). """
+        return b''
+
+    _handlers = {
+        Opcode.DIRECT_SET_OUT_STATE: _set_output_state,
+        Opcode.DIRECT_GET_OUT_STATE: _get_output_state,
+        Opcode.DIRECT_RESET_POSITION: _reset_position,
+        Opcode.DIRECT_SET_IN_MODE: _set_input_mode,
+        Opcode.DIRECT_GET_IN_VALS: _get_input_values,
+        Opcode.DIRECT_GET_BATT_LVL: _get_battery_level,
+        Opcode.DIRECT_KEEP_ALIVE: _keep_alive,
+        Opcode.DIRECT_PLAY_TONE: _no_reply,
+        Opcode.DIRECT_PLAY_SOUND_FILE: _no_reply,
+        Opcode.DIRECT_STOP_SOUND: _no_reply,
+        Opcode.SYSTEM_DEVICEINFO: _device_info,
+    }
@@ -0,0 +1,105 @@
+import logging
+import random
+import threading
+import time
+
+from collections import Counter, deque
+from typing import Optional
+
+from nxt.brick import Brick
+from nxt.telegram import Opcode, Telegram
+
+from .simulated_nxt import SimulatedNXT
+from .transport_profile import TransportProfile, TRANSPORT_PROFILES
+
+
+logger = logging.getLogger(__name__)
+
+
+class SimulatedSock:
+    """
+        Drop in replacement for the nxt-python backend sockets.
+        Telegrams are delivered to a SimulatedNXT after the one way link delay of the transport and replies
+        are only returned once they would have travelled back.
+    """
+
+    bsize = 60
+
+    def __init__(self, method: str = 'usb', nxt: Optional[SimulatedNXT] = None, profile: Optional[TransportProfile] = None, seed: Optional[int] = None):
+        self.type = method  # Connection type, used by the motors to evaluate latency.
+        self.nxt = SimulatedNXT() if nxt is None else nxt
+        self.profile = TRANSPORT_PROFILES[method] if profile is None else profile
+        self._rng = random.Random(seed)
+        self._replies = deque()
+        self._last_arrival = 0.0
+        self._last_reply = 0.0
+        self._lock = threading.Lock()
+
+        self.round_trips = 0
+        self.exchanges = 0  # Times the host waited for replies, pipelined requests share one exchange.
+        self.no_replies = 0
+        self.opcodes = Counter()
+        self._sending = True
+
+    def __str__(self):
+        return f"Simulated ({self.type})"
+
+    def connect(self) -> Brick:
+        logger.debug('Connecting to simulated brick via %s', self.type)
+        return Brick(self)
+
+    def close(self):
+        self._replies.clear()
+
+    def reset_stats(self):
+        self.round_trips = 0
+        self.exchanges = 0
+        self.no_replies = 0
+        self.opcodes.clear()
+
+    def send(self, data: bytes):
+        with self._lock:
+            self._sending = True
+            now = time.monotonic()
+            # Telegrams can't overtake each other and each occupies the link for a slot.
+            arrival = max(now + self.profile.one_way(self._rng), self._last_arrival + self.profile.slot)
+            self._last_arrival = arrival
+            reply = self.nxt.handle(data, arrival)
+            try:
+                self.opcodes[Opcode(data[1]).name] += 1
+            except ValueError:
+                self.opcodes[hex(data[1])] += 1
+            if data[0] & Telegram.TYPE_REPLY_NOT_REQUIRED:
+                self.no_replies += 1
+                return
+            self.round_trips += 1
+            ready = max(arrival + self.profile.one_way(self._rng), self._last_reply + self.profile.slot)
+            self._last_reply = ready
+            self._replies.append((ready, reply))
+
+    def recv(self) -> bytes:
+        with self._lock:
+            ready, reply = self._replies.popleft()
+            if self._sending:
+                self.exchanges += 1
+                self._sending = False
+        delay = ready - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return reply
+
+
+class Backend:
+    """ Simulator backend, can be passed to nxt.locator.find(backends=[...]). """
+
+    def __init__(self, method: str = 'usb', **kwargs):
+        self.method = method
+        self.kwargs = kwargs
+
+    def find(self, **kwargs):
+        sock = SimulatedSock(self.method, **self.kwargs)
+        yield sock.connect()
+
+
+def get_backend(method: str = 'usb', **kwargs) -> Backend:
+    return Backend(method, **kwargs)
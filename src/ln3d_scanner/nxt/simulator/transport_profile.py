@@ -0,0 +1,34 @@
+import random
+
+from typing import Optional
+
+
+class TransportProfile:
+    """
+        Link characteristics of a brick connection.
+        Latency values are round trip times in seconds, slot is the time a single telegram occupies the link.
+    """
+
+    def __init__(self, latency: float, jitter: float = 0.0, slot: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.slot = slot
+
+    def one_way(self, rng: Optional[random.Random] = None) -> float:
+        """ Returns a one way delay including jitter. """
+        delay = self.latency / 2
+        if rng is not None and self.jitter > 0:
+            delay += rng.uniform(-self.jitter, self.jitter) / 2
+        return max(0.0, delay)
+
+    def __repr__(self):
+        return f"TransportProfile(latency={self.latency}, jitter={self.jitter}, slot={self.slot})"
+
+
+# Rough numbers measured against a NXT 2.0 brick, ip values include a local network hop.
+TRANSPORT_PROFILES = {
+    'usb': TransportProfile(latency=0.004, jitter=0.001, slot=0.0005),
+    'bluetooth': TransportProfile(latency=0.060, jitter=0.015, slot=0.004),
+    'ipusb': TransportProfile(latency=0.012, jitter=0.004, slot=0.001),
+    'ipbluetooth': TransportProfile(latency=0.075, jitter=0.020, slot=0.005),
+}
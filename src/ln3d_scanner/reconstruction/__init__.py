@@ -0,0 +1,7 @@
+from .scanner_geometry import PinholeCamera, ScannerGeometry
+from .silhouette import PosedFrame, silhouette, posed_frames, project
+from .voxel_carver import CarveStats, VoxelGrid, VoxelCarver
+from .octree_carver import OctreeCarver, VoxelOctree
+from .parallel_carver import ParallelCarver
+from .synthetic_objects import SHAPES, sphere, box, torus, sample_grid, render_silhouettes
+from .export import as_points, voxel_downsample, voxel_mesh, write_ply, read_ply, write_obj
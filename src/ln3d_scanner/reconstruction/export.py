@@ -0,0 +1,201 @@
+import logging
+
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+CHUNK = 1 << 20  # Points per chunk, bounds the temporary arrays whatever the cloud size.
+
+
+def as_points(source) -> np.ndarray:
+    """ N x 3 points of a VoxelGrid, VoxelOctree or array. """
+    if hasattr(source, 'occupancy'):
+        return source.points()
+    if hasattr(source, 'levels'):
+        return source.centers()
+    return np.asarray(source)
+
+
+def voxel_downsample(points: np.ndarray, voxel_size: float, colors: Optional[np.ndarray] = None,
+                     chunk: int = CHUNK) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+        Replace the points in every cell of voxel_size by their centroid (and mean color). Works in chunks over the
+        input, so points may be a memmap larger than memory, only the output sized sums are kept.
+    """
+    if not len(points):
+        return np.empty((0, 3), dtype=np.float32), None if colors is None else np.empty((0, 3), dtype=np.uint8)
+    # Cells are packed into one int64 key per point, so deduplicating and looking up is 1d unique and searchsorted.
+    low = np.min([np.floor(np.min(points[start:start + chunk], axis=0) / voxel_size) for start in range(0, len(points), chunk)], axis=0)
+    high = np.max([np.floor(np.max(points[start:start + chunk], axis=0) / voxel_size) for start in range(0, len(points), chunk)], axis=0)
+    dims = (high - low + 1).astype(np.int64)
+    if np.prod(dims.astype(float)) >= 2 ** 62:
+        raise ValueError(f'voxel_size {voxel_size} is too small for the extent of the points.')
+
+    def keys(block: np.ndarray) -> np.ndarray:
+        cells = (np.floor(np.asarray(block) / voxel_size) - low).astype(np.int64)
+        return (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+
+    unique = np.unique(np.concatenate([np.unique(keys(points[start:start + chunk])) for start in range(0, len(points), chunk)]))
+    sums = np.zeros((len(unique), 3))
+    color_sums = None if colors is None else np.zeros((len(unique), colors.shape[1]))
+    counts = np.zeros(len(unique))
+    for start in range(0, len(points), chunk):
+        block = np.asarray(points[start:start + chunk])
+        index = np.searchsorted(unique, keys(block))
+        counts += np.bincount(index, minlength=len(unique))
+        for axis in range(3):
+            sums[:, axis] += np.bincount(index, weights=block[:, axis], minlength=len(unique))
+        if colors is not None:
+            for channel in range(colors.shape[1]):
+                color_sums[:, channel] += np.bincount(index, weights=colors[start:start + chunk, channel], minlength=len(unique))
+    centroids = (sums / counts[:, None]).astype(np.float32)
+    mean_colors = None if colors is None else np.round(color_sums / counts[:, None]).astype(np.uint8)
+    logger.debug(f'Downsampled {len(points)} points to {len(centroids)}.')
+    return centroids, mean_colors
+
+
+def _vertex_dtype(colors: bool) -> np.dtype:
+    fields = [('x', '<f4'), ('y', '<f4'), ('z', '<f4')]
+    if colors:
+        fields += [('red', 'u1'), ('green', 'u1'), ('blue', 'u1')]
+    return np.dtype(fields)
+
+
+def _ply_header(vertices: int, faces: int, colors: bool, binary: bool) -> bytes:
+    lines = ['ply', 'format binary_little_endian 1.0' if binary else 'format ascii 1.0', 'comment ln3d_scanner',
+             f'element vertex {vertices}', 'property float x', 'property float y', 'property float z']
+    if colors:
+        lines += ['property uchar red', 'property uchar green', 'property uchar blue']
+    if faces:
+        lines += [f'element face {faces}', 'property list uchar int vertex_indices']
+    lines.append('end_header')
+    return ('\n'.join(lines) + '\n').encode('ascii')
+
+
+def write_ply(path: str, points, colors: Optional[np.ndarray] = None, faces: Optional[np.ndarray] = None, binary: bool = True,
+              voxel_size: Optional[float] = None, chunk: int = CHUNK) -> int:
+    """
+        Write points (an N x 3 array, VoxelGrid or VoxelOctree) with optional N x 3 uint8 colors and triangle faces as PLY.
+        Binary vertices are copied chunk by chunk into a memory mapped file, nothing is formatted per point.
+        ASCII is the fallback for tools without binary PLY support. Returns the number of vertices written.
+    """
+    points = as_points(points)
+    if voxel_size:
+        if faces is not None:
+            raise ValueError('Downsampling would break the faces, export meshes without voxel_size.')
+        points, colors = voxel_downsample(points, voxel_size, colors, chunk)
+    count, face_count = len(points), 0 if faces is None else len(faces)
+    header = _ply_header(count, face_count, colors is not None, binary)
+    dtype = _vertex_dtype(colors is not None)
+
+    with open(path, 'wb') as file:
+        file.write(header)
+        if binary:
+            file.truncate(len(header) + count * dtype.itemsize)
+        else:
+            _write_ascii_vertices(file, points, colors, chunk)
+            if faces is not None:
+                for start in range(0, face_count, chunk):
+                    np.savetxt(file, faces[start:start + chunk], fmt='3 %d %d %d')
+    if binary:
+        if count:
+            vertices = np.memmap(path, dtype=dtype, mode='r+', offset=len(header), shape=(count,))
+            for start in range(0, count, chunk):
+                block = vertices[start:start + chunk]
+                for axis, name in enumerate('xyz'):
+                    block[name] = points[start:start + chunk, axis]
+                if colors is not None:
+                    for channel, name in enumerate(('red', 'green', 'blue')):
+                        block[name] = colors[start:start + chunk, channel]
+            vertices.flush()
+            del vertices
+        if faces is not None:
+            _append_binary_faces(path, faces, chunk)
+    logger.info(f'Wrote {count} vertices and {face_count} faces to {path}.')
+    return count
+
+
+def _write_ascii_vertices(file, points: np.ndarray, colors: Optional[np.ndarray], chunk: int):
+    for start in range(0, len(points), chunk):
+        block = np.asarray(points[start:start + chunk], dtype=np.float32)
+        if colors is None:
+            np.savetxt(file, block, fmt='%.6g')
+        else:
+            np.savetxt(file, np.column_stack([block, colors[start:start + chunk]]), fmt='%.6g %.6g %.6g %d %d %d')
+
+
+def _append_binary_faces(path: str, faces: np.ndarray, chunk: int):
+    record = np.dtype([('n', 'u1'), ('v', '<i4', 3)])
+    with open(path, 'ab') as file:
+        for start in range(0, len(faces), chunk):
+            block = np.empty(len(faces[start:start + chunk]), dtype=record)
+            block['n'] = 3
+            block['v'] = faces[start:start + chunk]
+            file.write(block.tobytes())
+
+
+def read_ply(path: str) -> np.ndarray:
+    """ Memory mapped vertices of a binary little endian PLY written by write_ply, as a structured array. """
+    with open(path, 'rb') as file:
+        header = b''
+        while not header.endswith(b'end_header\n'):
+            line = file.readline()
+            if not line:
+                raise ValueError(f'{path} has no PLY header.')
+            header += line
+    lines = header.decode('ascii').splitlines()
+    if 'format binary_little_endian 1.0' not in lines:
+        raise ValueError(f'{path} is not a binary little endian PLY.')
+    count = next(int(line.split()[2]) for line in lines if line.startswith('element vertex'))
+    colors = 'property uchar red' in lines
+    return np.memmap(path, dtype=_vertex_dtype(colors), mode='r', offset=len(header), shape=(count,))
+
+
+def write_obj(path: str, points, faces: Optional[np.ndarray] = None, voxel_size: Optional[float] = None, chunk: int = CHUNK) -> int:
+    """ Write points as OBJ vertices with optional triangle faces (0 based, written 1 based), formatted a chunk at a time. """
+    points = as_points(points)
+    if voxel_size:
+        if faces is not None:
+            raise ValueError('Downsampling would break the faces, export meshes without voxel_size.')
+        points, _ = voxel_downsample(points, voxel_size, chunk=chunk)
+    with open(path, 'w') as file:
+        file.write('# ln3d_scanner\n')
+        for start in range(0, len(points), chunk):
+            np.savetxt(file, np.asarray(points[start:start + chunk], dtype=np.float32), fmt='v %.6g %.6g %.6g')
+        if faces is not None:
+            for start in range(0, len(faces), chunk):
+                np.savetxt(file, faces[start:start + chunk] + 1, fmt='f %d %d %d')
+    logger.info(f'Wrote {len(points)} vertices and {0 if faces is None else len(faces)} faces to {path}.')
+    return len(points)
+
+
+def voxel_mesh(grid) -> Tuple[np.ndarray, np.ndarray]:
+    """
+        Triangle mesh of the outside faces of the occupied voxels of a VoxelGrid, two triangles per exposed voxel face.
+        Corner vertices are shared between faces. Returns vertices and faces.
+    """
+    occupancy = np.pad(grid.occupancy, 1)
+    quads = []
+    # Corners of the face in direction (axis, side) in voxel units, counter clockwise seen from outside.
+    for axis in range(3):
+        u, v = (axis + 1) % 3, (axis + 2) % 3
+        for side in (0, 1):
+            neighbour = np.roll(occupancy, -1 if side else 1, axis=axis)
+            exposed = np.argwhere(occupancy & ~neighbour) - 1
+            corners = []
+            for du, dv in ((0, 0), (1, 0), (1, 1), (0, 1)) if side else ((0, 0), (0, 1), (1, 1), (1, 0)):
+                corner = exposed.copy()
+                corner[:, axis] += side
+                corner[:, u] += du
+                corner[:, v] += dv
+                corners.append(corner)
+            quads.append(np.stack(corners, axis=1))
+    quads = np.concatenate(quads) if quads else np.empty((0, 4, 3), dtype=np.int64)
+    unique, inverse = np.unique(quads.reshape(-1, 3), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1, 4)
+    faces = np.concatenate([inverse[:, [0, 1, 2]], inverse[:, [0, 2, 3]]]).astype(np.int32)
+    vertices = (grid.origin + unique * grid.voxel_size).astype(np.float32)
+    return vertices, faces
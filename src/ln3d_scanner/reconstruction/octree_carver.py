@@ -0,0 +1,144 @@
+import logging
+import time
+
+from typing import List, Sequence
+
+import numpy as np
+
+from .silhouette import PosedFrame, mask_lookup, project
+from .voxel_carver import CarveStats, VoxelGrid
+
+
+logger = logging.getLogger(__name__)
+
+# Corner offsets of a cell and child offsets of a split cell, in cell units.
+_OFFSETS = np.array([[i, j, k] for i in (0, 1) for j in (0, 1) for k in (0, 1)], dtype=np.int64)
+
+EMPTY, PARTIAL, FULL = 0, 1, 2
+
+
+class VoxelOctree:
+    """
+        Sparse carving result: occupied leaf cells of an octree over a cube with sides of side starting at origin.
+        A leaf at level l is cell coords of the 2^l cells per side. Leaves above max_level are completely inside
+        every silhouette, leaves at max_level are the surface.
+    """
+
+    def __init__(self, origin: Sequence[float], side: float, max_level: int, levels: np.ndarray, coords: np.ndarray):
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.side = side
+        self.max_level = max_level
+        self.levels = levels
+        self.coords = coords
+
+    def __len__(self) -> int:
+        return len(self.levels)
+
+    def sizes(self) -> np.ndarray:
+        return self.side / (2.0 ** self.levels)
+
+    def centers(self) -> np.ndarray:
+        return self.origin + (self.coords + 0.5) * self.sizes()[:, None]
+
+    @property
+    def volume(self) -> float:
+        return float(np.sum(self.sizes() ** 3))
+
+    def to_grid(self) -> VoxelGrid:
+        """ Dense grid at the finest level. """
+        resolution = 2 ** self.max_level
+        occupancy = np.zeros((resolution,) * 3, dtype=bool)
+        for level in np.unique(self.levels):
+            factor = 2 ** (self.max_level - int(level))
+            coords = self.coords[self.levels == level] * factor
+            block = np.stack(np.meshgrid(*(np.arange(factor),) * 3, indexing='ij'), axis=-1).reshape(-1, 3)
+            indices = (coords[:, None, :] + block[None]).reshape(-1, 3)
+            occupancy[indices[:, 0], indices[:, 1], indices[:, 2]] = True
+        return VoxelGrid(self.origin, self.side / resolution, occupancy)
+
+
+def _integral(mask: np.ndarray) -> np.ndarray:
+    """ Summed area table with a zero row and column in front, any box sum is 4 lookups. """
+    table = np.zeros((mask.shape[0] + 1, mask.shape[1] + 1), dtype=np.int64)
+    np.cumsum(np.cumsum(mask, axis=0), axis=1, out=table[1:, 1:])
+    return table
+
+
+class OctreeCarver:
+    """
+        Coarse to fine silhouette carving. Cells are classified per frame by the pixel box around their projected corners:
+        cells with no silhouette pixels in a box are carved, cells with only silhouette pixels in every frame are kept whole
+        and the rest is split into 8 children. Only cells on the surface reach the finest level, so memory scales with
+        the surface instead of the bounding volume. At the finest level cells are tested by their center like VoxelCarver.
+    """
+
+    def __init__(self, bounds_min: Sequence[float], bounds_max: Sequence[float], max_level: int = 7, base_level: int = 3,
+                 keep_outside: bool = True):
+        self.origin = np.asarray(bounds_min, dtype=np.float64)
+        self.side = float(np.max(np.asarray(bounds_max, dtype=np.float64) - self.origin))  # Bounds are made a cube.
+        self.max_level = max_level  # 2^max_level voxels along a side at the finest level.
+        self.base_level = min(base_level, max_level)
+        self.keep_outside = keep_outside
+        self.stats = CarveStats()
+        self.cells_per_level: List[int] = []
+
+    def _classify(self, coords: np.ndarray, size: float, frame: PosedFrame, integral: np.ndarray) -> np.ndarray:
+        height, width = frame.mask.shape
+        corners = self.origin + (coords[:, None, :] + _OFFSETS[None]) * size
+        u, v, depth = project(frame.projection, corners.reshape(-1, 3))
+        u, v, depth = u.reshape(-1, 8), v.reshape(-1, 8), depth.reshape(-1, 8)
+        behind = np.any(depth <= 0, axis=1)
+        with np.errstate(invalid='ignore'):
+            u0, u1 = np.floor(u.min(axis=1) + 0.5), np.floor(u.max(axis=1) + 0.5)
+            v0, v1 = np.floor(v.min(axis=1) + 0.5), np.floor(v.max(axis=1) + 0.5)
+        beyond = ~behind & ((u1 < 0) | (v1 < 0) | (u0 >= width) | (v0 >= height))  # Box completely outside the image.
+        clipped = behind | (u0 < 0) | (v0 < 0) | (u1 >= width) | (v1 >= height)
+        c0, c1 = np.clip(np.nan_to_num(u0), 0, width - 1).astype(np.intp), np.clip(np.nan_to_num(u1), 0, width - 1).astype(np.intp)
+        r0, r1 = np.clip(np.nan_to_num(v0), 0, height - 1).astype(np.intp), np.clip(np.nan_to_num(v1), 0, height - 1).astype(np.intp)
+        count = integral[r1 + 1, c1 + 1] - integral[r0, c1 + 1] - integral[r1 + 1, c0] + integral[r0, c0]
+        area = (c1 - c0 + 1) * (r1 - r0 + 1)
+
+        status = np.full(len(coords), PARTIAL, dtype=np.int8)
+        status[~clipped & (count == 0)] = EMPTY
+        status[~clipped & (count == area)] = FULL
+        # Nothing is known about cells outside the image.
+        status[beyond] = FULL if self.keep_outside else EMPTY
+        return status
+
+    def carve(self, frames: Sequence[PosedFrame]) -> VoxelOctree:
+        start = time.perf_counter()
+        integrals = [_integral(frame.mask) for frame in frames]
+        cells = 2 ** self.base_level
+        coords = np.stack(np.meshgrid(*(np.arange(cells),) * 3, indexing='ij'), axis=-1).reshape(-1, 3)
+        levels, leaves = [], []
+        self.cells_per_level = []
+
+        for level in range(self.base_level, self.max_level + 1):
+            self.cells_per_level.append(len(coords))
+            size = self.side / 2 ** level
+            if level == self.max_level:
+                alive = np.ones(len(coords), dtype=bool)
+                for frame in frames:
+                    centers = self.origin + (coords[alive] + 0.5) * size
+                    u, v, depth = project(frame.projection, centers)
+                    alive[np.flatnonzero(alive)[~mask_lookup(frame.mask, u, v, depth, self.keep_outside)]] = False
+                    self.stats.voxels += len(centers)
+                leaves.append(coords[alive])
+                levels.append(np.full(int(np.count_nonzero(alive)), level, dtype=np.int8))
+                break
+
+            full = np.ones(len(coords), dtype=bool)
+            for frame, integral in zip(frames, integrals):
+                status = self._classify(coords, size, frame, integral)
+                self.stats.voxels += len(coords)
+                full &= status == FULL
+                coords, full = coords[status != EMPTY], full[status != EMPTY]
+            leaves.append(coords[full])
+            levels.append(np.full(int(np.count_nonzero(full)), level, dtype=np.int8))
+            coords = (coords[~full][:, None, :] * 2 + _OFFSETS[None]).reshape(-1, 3)
+
+        self.stats.frames += len(frames)
+        self.stats.seconds += time.perf_counter() - start
+        octree = VoxelOctree(self.origin, self.side, self.max_level, np.concatenate(levels), np.concatenate(leaves))
+        logger.info(f'Carved {len(octree)} octree leaves, cells per level {self.cells_per_level}: {self.stats}')
+        return octree
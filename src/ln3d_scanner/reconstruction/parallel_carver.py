@@ -0,0 +1,102 @@
+import itertools
+import logging
+import os
+import tempfile
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .silhouette import PosedFrame
+from .voxel_carver import VoxelCarver, VoxelGrid
+
+
+logger = logging.getLogger(__name__)
+
+_worker = {}  # Carver, masks and projections of a worker process, set once by _init_worker.
+
+
+def _init_worker(bounds_min, bounds_max, resolution: int, keep_outside: bool, chunk: int, masks_path: str, projections: np.ndarray):
+    _worker['carver'] = VoxelCarver(bounds_min, bounds_max, resolution, keep_outside, chunk)
+    _worker['masks'] = np.load(masks_path, mmap_mode='r')  # Pages are shared between the processes, nothing is copied.
+    _worker['projections'] = projections
+
+
+def _carve_block(start: Tuple[int, int, int], stop: Tuple[int, int, int]) -> Tuple[np.ndarray, int]:
+    """ Carve one block with every frame, returns the packed occupancy and the voxels projected. """
+    carver = _worker['carver']
+    grid = carver.block_grid(start, stop)
+    before = carver.stats.voxels
+    for mask, projection in zip(_worker['masks'], _worker['projections']):
+        carver.carve_frame(grid, PosedFrame(mask, projection), start)
+        if not grid.occupancy.any():
+            break  # Nothing left to carve in this block.
+    return np.packbits(grid.occupancy, axis=None), carver.stats.voxels - before
+
+
+class ParallelCarver(VoxelCarver):
+    """
+        VoxelCarver that splits the grid in blocks of block voxels per side and carves them on a process pool.
+        The silhouettes are written once to a memory mapped file (in /dev/shm when available) that every worker maps,
+        only block bounds and packed results go through the pool. Blocks are merged by position, so the result is
+        the same as VoxelCarver's whatever the worker count or completion order.
+        With workers set to 1 the blocks are carved in this process.
+    """
+
+    def __init__(self, bounds_min: Sequence[float], bounds_max: Sequence[float], resolution: int, workers: Optional[int] = None,
+                 block: int = 32, keep_outside: bool = True, chunk: int = 1 << 20):
+        super().__init__(bounds_min, bounds_max, resolution, keep_outside, chunk)
+        self.workers = workers or os.cpu_count() or 1
+        self.block = block
+        self.blocks = 0
+
+    def block_bounds(self) -> List[Tuple[Tuple[int, ...], Tuple[int, ...]]]:
+        """ Start and stop index of every block, in a fixed order. """
+        ranges = [[(start, min(start + self.block, size)) for start in range(0, size, self.block)] for size in self.shape]
+        return [tuple(zip(*combination)) for combination in itertools.product(*ranges)]
+
+    def _temporary_directory(self):
+        return tempfile.TemporaryDirectory(prefix='ln3d-carve-', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+
+    def carve(self, frames: Sequence[PosedFrame]) -> VoxelGrid:
+        grid = self.empty_grid()
+        grid.occupancy[...] = False
+        bounds = self.block_bounds()
+        self.blocks = len(bounds)
+        start_time = time.perf_counter()
+
+        with self._temporary_directory() as directory:
+            masks_path = os.path.join(directory, 'masks.npy')
+            masks = np.lib.format.open_memmap(masks_path, 'w+', bool, (len(frames),) + frames[0].mask.shape)
+            for index, frame in enumerate(frames):
+                masks[index] = frame.mask
+            masks.flush()
+            del masks
+            projections = np.stack([frame.projection for frame in frames])
+            init_args = (self.bounds_min, self.bounds_max, self.resolution, self.keep_outside, self.chunk, masks_path, projections)
+
+            starts, stops = [start for start, _ in bounds], [stop for _, stop in bounds]
+            if self.workers <= 1:
+                _init_worker(*init_args)
+                results = map(_carve_block, starts, stops)
+                executor = None
+            else:
+                executor = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=init_args)
+                results = executor.map(_carve_block, starts, stops, chunksize=max(1, len(bounds) // (self.workers * 8)))
+            try:
+                for (start, stop), (packed, voxels) in zip(bounds, results):
+                    shape = tuple(b - a for a, b in zip(start, stop))
+                    block = np.unpackbits(packed, count=int(np.prod(shape))).reshape(shape).astype(bool)
+                    grid.occupancy[start[0]:stop[0], start[1]:stop[1], start[2]:stop[2]] = block
+                    self.stats.voxels += voxels
+            finally:
+                if executor is not None:
+                    executor.shutdown()
+                _worker.clear()
+
+        self.stats.frames += len(frames)
+        self.stats.seconds += time.perf_counter() - start_time
+        logger.info(f'Carved {grid.count} of {grid.occupancy.size} voxels in {self.blocks} blocks on {self.workers} workers: {self.stats}')
+        return grid
@@ -0,0 +1,79 @@
+import math
+
+from typing import Optional
+
+import numpy as np
+
+
+class PinholeCamera:
+    """ Intrinsics of the scanner camera in pixels, the principal point defaults to the image center. """
+
+    def __init__(self, width: int, height: int, focal: float, cx: Optional[float] = None, cy: Optional[float] = None):
+        self.width = width
+        self.height = height
+        self.focal = focal
+        self.cx = (width - 1) / 2 if cx is None else cx
+        self.cy = (height - 1) / 2 if cy is None else cy
+
+    @classmethod
+    def from_fov(cls, width: int, height: int, fov: float) -> 'PinholeCamera':
+        """ Camera with a horizontal field of view in degrees. """
+        return cls(width, height, width / 2 / math.tan(math.radians(fov) / 2))
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return np.array([[self.focal, 0, self.cx], [0, self.focal, self.cy], [0, 0, 1]])
+
+
+class ScannerGeometry:
+    """
+        Camera poses of the scanner in the frame of the object on the platform.
+        The camera sits on the bar at distance from the pivot and looks at it, the pivot is the origin at the platform center.
+        Elevation is the bar angle from vertical in degrees: 0 looks straight down, 90 looks level at the object.
+        Turning the platform by an angle is seen as the camera turning the opposite way around the vertical (z) axis.
+    """
+
+    def __init__(self, camera: PinholeCamera, distance: float, platform_gear_ratio: float = 1, bar_gear_ratio: float = 1,
+                 camera_stop_offset: int = 0):
+        self.camera = camera
+        self.distance = distance
+        self.platform_gear_ratio = platform_gear_ratio  # Motor degrees per platform degree.
+        self.bar_gear_ratio = bar_gear_ratio  # Motor degrees per camera bar degree.
+        self.camera_stop_offset = camera_stop_offset  # Bar motor tacho from the camera stop to elevation 0.
+
+    @classmethod
+    def for_scanner(cls, camera: PinholeCamera, distance: float, camera_bar, platform=None) -> 'ScannerGeometry':
+        """ Geometry with the gearing and stop offset of the camera bar and platform. """
+        return cls(camera, distance, 1 if platform is None else platform.gear_ratio, camera_bar._gear_ratio,
+                   camera_bar._camera_stop_offset)
+
+    def angle_from_tacho(self, platform_tacho: float) -> float:
+        """ Platform angle of a rotation count since the platform was zeroed. """
+        return platform_tacho / self.platform_gear_ratio
+
+    def elevation_from_tacho(self, bar_tacho: float) -> float:
+        """ Inverse of CameraBar.elevation_tacho: bar tacho counted from the camera stop to elevation. """
+        return (abs(self.camera_stop_offset) - bar_tacho) / self.bar_gear_ratio
+
+    def camera_position(self, angle: float, elevation: float) -> np.ndarray:
+        a, e = math.radians(-angle), math.radians(elevation)
+        return self.distance * np.array([math.sin(e) * math.cos(a), math.sin(e) * math.sin(a), math.cos(e)])
+
+    def extrinsics(self, angle: float, elevation: float) -> np.ndarray:
+        """ 3x4 object to camera transform, camera axes are x right, y down and z forward. """
+        a, e = math.radians(-angle), math.radians(elevation)
+        position = self.camera_position(angle, elevation)
+        forward = -position / self.distance
+        # Up in the image points along the bar towards vertical, defined at every elevation unlike the z axis.
+        up = np.array([-math.cos(e) * math.cos(a), -math.cos(e) * math.sin(a), math.sin(e)])
+        down = -up
+        right = np.cross(down, forward)
+        rotation = np.stack([right, down, forward])
+        return np.hstack([rotation, -rotation @ position[:, None]])
+
+    def projection(self, angle: float, elevation: float) -> np.ndarray:
+        """ 3x4 matrix from object coordinates to homogeneous pixels. """
+        return self.camera.matrix @ self.extrinsics(angle, elevation)
+
+    def projection_from_tacho(self, platform_tacho: float, bar_tacho: float) -> np.ndarray:
+        return self.projection(self.angle_from_tacho(platform_tacho), self.elevation_from_tacho(bar_tacho))
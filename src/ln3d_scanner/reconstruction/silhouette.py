@@ -0,0 +1,43 @@
+from typing import Iterable, List, NamedTuple
+
+import numpy as np
+
+from .scanner_geometry import ScannerGeometry
+
+
+class PosedFrame(NamedTuple):
+    mask: np.ndarray  # Height x width booleans, True where the object is.
+    projection: np.ndarray  # 3x4 matrix from object coordinates to homogeneous pixels.
+
+
+def silhouette(frame, threshold: int = 128, dark_object: bool = False) -> np.ndarray:
+    """ Object mask of a raw capture Frame by thresholding its brightness. RGB frames use the mean of the channels. """
+    if frame.encoding is not None:
+        raise ValueError(f'Frame is encoded as {frame.encoding}, decode it to pixels first.')
+    pixels = np.frombuffer(frame.pixels, dtype=np.uint8).reshape(frame.height, frame.width, frame.channels)
+    brightness = pixels[..., 0] if frame.channels == 1 else pixels.mean(axis=2)
+    return brightness < threshold if dark_object else brightness >= threshold
+
+
+def posed_frames(frames: Iterable, geometry: ScannerGeometry, threshold: int = 128, dark_object: bool = False) -> List[PosedFrame]:
+    """ Silhouettes of captured frames with the projection of the ScanPose they were captured at. """
+    return [PosedFrame(silhouette(frame, threshold, dark_object), geometry.projection(frame.pose.angle, frame.pose.elevation))
+            for frame in frames]
+
+
+def project(projection: np.ndarray, points: np.ndarray):
+    """ Pixel columns, rows and depths of N x 3 points. """
+    homogeneous = points @ projection[:, :3].T + projection[:, 3]
+    depth = homogeneous[:, 2]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return homogeneous[:, 0] / depth, homogeneous[:, 1] / depth, depth
+
+
+def mask_lookup(mask: np.ndarray, u: np.ndarray, v: np.ndarray, depth: np.ndarray, outside: bool = True) -> np.ndarray:
+    """ Mask value at every projected point, outside is returned for points outside the image or behind the camera. """
+    height, width = mask.shape
+    columns, rows = np.floor(u + 0.5), np.floor(v + 0.5)
+    inside = (depth > 0) & (columns >= 0) & (columns < width) & (rows >= 0) & (rows < height)
+    result = np.full(u.shape, outside)
+    result[inside] = mask[rows[inside].astype(np.intp), columns[inside].astype(np.intp)]
+    return result
@@ -0,0 +1,70 @@
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .scanner_geometry import ScannerGeometry
+from .silhouette import PosedFrame
+
+
+# Occupancy function of N x 3 points in object coordinates, the platform center is the origin.
+Shape = Callable[[np.ndarray], np.ndarray]
+
+
+def sphere(radius: float = 1.0, center: Sequence[float] = (0, 0, 0)) -> Shape:
+    center = np.asarray(center, dtype=np.float64)
+    return lambda points: np.sum((points - center) ** 2, axis=1) <= radius ** 2
+
+
+def box(size: Sequence[float] = (1.2, 0.8, 1.0), center: Sequence[float] = (0, 0, 0)) -> Shape:
+    half, center = np.asarray(size, dtype=np.float64) / 2, np.asarray(center, dtype=np.float64)
+    return lambda points: np.all(np.abs(points - center) <= half, axis=1)
+
+
+def torus(radius: float = 0.7, tube: float = 0.25) -> Shape:
+    """ Torus lying on the platform around the vertical axis. """
+    def occupancy(points):
+        ring = np.hypot(points[:, 0], points[:, 1]) - radius
+        return ring ** 2 + points[:, 2] ** 2 <= tube ** 2
+    return occupancy
+
+
+SHAPES: Dict[str, Callable[[], Shape]] = {'sphere': sphere, 'box': box, 'torus': torus}
+
+
+def sample_grid(bounds_min: Sequence[float], bounds_max: Sequence[float], resolution: int) -> Tuple[np.ndarray, float]:
+    """ Centers of a grid with resolution cells along the longest side, and the cell size. """
+    bounds_min, bounds_max = np.asarray(bounds_min, dtype=np.float64), np.asarray(bounds_max, dtype=np.float64)
+    size = float(np.max(bounds_max - bounds_min)) / resolution
+    axes = [bounds_min[axis] + (np.arange(int(np.ceil((bounds_max[axis] - bounds_min[axis]) / size - 1e-9))) + 0.5) * size
+            for axis in range(3)]
+    return np.stack(np.meshgrid(*axes, indexing='ij'), axis=-1).reshape(-1, 3), size
+
+
+def render_silhouettes(shape: Shape, geometry: ScannerGeometry, poses: Sequence[Tuple[float, float]], extent: float = 2.0,
+                       steps: int = 256, chunk: int = 1 << 22) -> List[PosedFrame]:
+    """
+        Silhouettes of a shape seen from (angle, elevation) poses, by sampling the shape at steps points along the ray
+        of every pixel through a sphere of diameter extent around the origin.
+    """
+    camera = geometry.camera
+    rows, columns = np.mgrid[0:camera.height, 0:camera.width]
+    pixels = np.stack([columns.ravel(), rows.ravel(), np.ones(columns.size)], axis=1)
+    rays = pixels @ np.linalg.inv(camera.matrix).T
+    rays /= np.linalg.norm(rays, axis=1)[:, None]
+    depths = np.linspace(geometry.distance - extent / 2, geometry.distance + extent / 2, steps)
+    batch = max(1, chunk // steps)
+    frames = []
+    for angle, elevation in poses:
+        extrinsics = geometry.extrinsics(angle, elevation)
+        rotation, position = extrinsics[:, :3], geometry.camera_position(angle, elevation)
+        directions = rays @ rotation  # Camera to object coordinates, the rotation is orthonormal.
+        # Only rays passing through the sphere around the shape are marched.
+        closest = np.linalg.norm(position + directions * (directions @ -position)[:, None], axis=1)
+        candidates = np.flatnonzero(closest <= extent / 2)
+        hit = np.zeros(len(directions), dtype=bool)
+        for start in range(0, len(candidates), batch):
+            indices = candidates[start:start + batch]
+            points = position + directions[indices, None, :] * depths[None, :, None]
+            hit[indices] = shape(points.reshape(-1, 3)).reshape(-1, steps).any(axis=1)
+        frames.append(PosedFrame(hit.reshape(camera.height, camera.width), geometry.projection(angle, elevation)))
+    return frames
@@ -0,0 +1,116 @@
+import logging
+import time
+
+from typing import Sequence
+
+import numpy as np
+
+from .silhouette import PosedFrame, mask_lookup
+
+
+logger = logging.getLogger(__name__)
+
+
+class CarveStats:
+    """ Voxel projections done while carving, voxels_per_second is the projection throughput. """
+
+    def __init__(self):
+        self.frames = 0
+        self.voxels = 0  # Voxel (or octree cell) projections over all frames.
+        self.seconds = 0.0
+
+    @property
+    def voxels_per_second(self) -> float:
+        return self.voxels / self.seconds if self.seconds else 0.0
+
+    def to_dict(self) -> dict:
+        return {'frames': self.frames, 'voxels': self.voxels, 'seconds': self.seconds, 'voxels_per_second': self.voxels_per_second}
+
+    def __str__(self):
+        return f'{self.voxels} voxels projected over {self.frames} frames in {self.seconds:.2f}s ({self.voxels_per_second:,.0f} voxels/s)'
+
+
+class VoxelGrid:
+    """ Dense occupancy grid over an axis aligned box, voxel (i, j, k) spans origin + (i, j, k) * voxel_size. """
+
+    def __init__(self, origin: Sequence[float], voxel_size: float, occupancy: np.ndarray):
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.voxel_size = voxel_size
+        self.occupancy = occupancy
+
+    @property
+    def shape(self):
+        return self.occupancy.shape
+
+    @property
+    def count(self) -> int:
+        return int(np.count_nonzero(self.occupancy))
+
+    @property
+    def volume(self) -> float:
+        return self.count * self.voxel_size ** 3
+
+    def centers(self, indices: np.ndarray) -> np.ndarray:
+        """ Centers of N x 3 voxel indices. """
+        return self.origin + (indices + 0.5) * self.voxel_size
+
+    def points(self) -> np.ndarray:
+        """ Centers of the occupied voxels. """
+        return self.centers(np.argwhere(self.occupancy))
+
+
+class VoxelCarver:
+    """
+        Silhouette carving on a dense grid. Every frame projects all voxels still occupied at once with NumPy and
+        carves the ones that fall outside the silhouette. Voxels projecting outside the image are kept unless keep_outside is off.
+        Voxels are processed in chunks so the temporary arrays stay bounded for large grids.
+    """
+
+    def __init__(self, bounds_min: Sequence[float], bounds_max: Sequence[float], resolution: int, keep_outside: bool = True,
+                 chunk: int = 1 << 20):
+        self.bounds_min = np.asarray(bounds_min, dtype=np.float64)
+        self.bounds_max = np.asarray(bounds_max, dtype=np.float64)
+        self.resolution = resolution  # Voxels along the longest side of the bounds.
+        self.voxel_size = float(np.max(self.bounds_max - self.bounds_min)) / resolution
+        self.shape = tuple(int(n) for n in np.ceil((self.bounds_max - self.bounds_min) / self.voxel_size - 1e-9))
+        self.keep_outside = keep_outside
+        self.chunk = chunk
+        self.stats = CarveStats()
+
+    def empty_grid(self) -> VoxelGrid:
+        return VoxelGrid(self.bounds_min, self.voxel_size, np.ones(self.shape, dtype=bool))
+
+    def block_grid(self, start: Sequence[int], stop: Sequence[int]) -> VoxelGrid:
+        """ Uncarved grid of the voxels from index start up to stop. """
+        shape = tuple(b - a for a, b in zip(start, stop))
+        return VoxelGrid(self.bounds_min + np.asarray(start) * self.voxel_size, self.voxel_size, np.ones(shape, dtype=bool))
+
+    def carve_frame(self, grid: VoxelGrid, frame: PosedFrame, offset: Sequence[int] = (0, 0, 0)):
+        """ Carve a frame out of the grid, offset is the index of a block grid within the full grid. """
+        flat = grid.occupancy.reshape(-1)
+        alive = np.flatnonzero(flat)
+        # The projection is linear, so it is the sum of a term per axis index. These are tiny tables.
+        # Centers are computed from the full grid index so blocks carve exactly like the full grid.
+        terms = [np.outer(self.bounds_min[axis] + (np.arange(offset[axis], offset[axis] + size) + 0.5) * self.voxel_size,
+                          frame.projection[:, axis]).astype(np.float32)
+                 for axis, size in enumerate(grid.shape)]
+        terms[2] += frame.projection[:, 3].astype(np.float32)
+        for start in range(0, len(alive), self.chunk):
+            indices = alive[start:start + self.chunk]
+            i, j, k = np.unravel_index(indices, grid.shape)
+            homogeneous = terms[0][i] + terms[1][j] + terms[2][k]
+            depth = homogeneous[:, 2]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                u, v = homogeneous[:, 0] / depth, homogeneous[:, 1] / depth
+            flat[indices[~mask_lookup(frame.mask, u, v, depth, self.keep_outside)]] = False
+        self.stats.voxels += len(alive)
+        self.stats.frames += 1
+
+    def carve(self, frames: Sequence[PosedFrame]) -> VoxelGrid:
+        grid = self.empty_grid()
+        start = time.perf_counter()
+        for frame in frames:
+            self.carve_frame(grid, frame)
+        self.stats.seconds += time.perf_counter() - start
+        logger.info(f'Carved {grid.count} of {grid.occupancy.size} voxels: {self.stats}')
+        return grid
@@ -1 +1,2 @@
+from .bar_state import BarState, BarStateStore
 from .camera_bar import CameraBar
@@ -0,0 +1,36 @@
+from typing import NamedTuple, Optional
+
+from ln3d_scanner.storage import JsonStore, data_path
+
+
+DEFAULT_PATH = data_path('camera_bar.json')
+
+
+class BarState(NamedTuple):
+    stop_tacho: int  # Motor tacho units the bar was away from the camera stop at shutdown.
+    up_direction: int
+    camera_stop_offset: int
+    gear_ratio: int
+
+    def to_dict(self) -> dict:
+        return self._asdict()
+
+    @classmethod
+    def from_dict(cls, values: dict) -> 'BarState':
+        return cls(**{field: values[field] for field in cls._fields})
+
+
+class BarStateStore(JsonStore):
+    """ Json file with the last known camera bar state keyed by brick name. """
+
+    entry_type = BarState
+    description = 'camera bar state'
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        super().__init__(path)
+
+    def get(self, name: str) -> Optional[BarState]:
+        return self.get_entry(name)
+
+    def save(self, name: str, state: BarState):
+        self.save_entry(name, state)
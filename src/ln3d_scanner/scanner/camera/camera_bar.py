@@ -1,13 +1,17 @@
 import logging
 
+from typing import Optional
+
 import nxt.motor as Motor
 import nxt.sensor as Sensor
 
 from nxt.brick import Brick
 
-from ln3d_scanner.timer import LN3DTimer
-from ln3d_scanner.nxt.motors import PrecisionMotor, InvertedMotor, DualMotors
+from ln3d_scanner.timer import LN3DTimer, run_blocking, run_sync
+from ln3d_scanner.nxt.motors import PrecisionMotor, InvertedMotor, DualMotors, MotionProfile
 from ln3d_scanner.nxt.sensors import Switch
+from ln3d_scanner.telemetry import get_recorder
+from .bar_state import BarState, BarStateStore
 
 
 logger = logging.getLogger(__name__)
@@ -27,6 +31,8 @@ class CameraBar(LN3DTimer):
         self._up_direction = direction
         self._camera_stop_offset = camera_stop_offset
         self._gear_ratio = gear_ratio  # From motor to camera bar ratio.
+        self._stop_count: Optional[int] = None  # Motor tacho count at the camera stop, None till homed.
+        self.profile = MotionProfile()  # Power ramps of long moves.
         
 
     @property
@@ -41,10 +47,23 @@ class CameraBar(LN3DTimer):
     def invert_up_direction(self):
         self._up_direction *= -1
 
+    def elevation_tacho(self, elevation: float) -> float:
+        """ Motor tacho units from the camera stop to an elevation in degrees, 0 is the top (center) and positive leans to the stop. """
+        return abs(self._camera_stop_offset) - elevation * self._gear_ratio
+
+    @property
+    def home_elevation(self) -> float:
+        """ Elevation after homing, the bar turns 360 tacho units away from the stop. """
+        return (abs(self._camera_stop_offset) - 360) / self._gear_ratio
+
     def up(self):
         """ Moves the camera bar up some degree. This function uses dual motor turns and must require a sleep after for accurate results. """
         self.motors.turn(self.power, 90)
 
+    async def up_async(self):
+        """ Awaitable up. """
+        await self.motors.turn_async(self.power, 90)
+
     def home(self):
         """ 
             Homes the camera bar using z stop.
@@ -52,17 +71,47 @@ class CameraBar(LN3DTimer):
                 If the camera bar is incorrectly setup, Click the camera stop to reverse direction.
                 Hold for 1 second or until the tone is played to abort homing. Must release to abort, holding longer will assume camera bar is homed.
         """
-        self.motors.run(-self.power)  # Use inverted power
+        run_sync(self.home_async())
+
+    async def home_async(self):
+        """
+            Awaitable home, the platform or other devices can move while the camera bar is homing.
+            The switch is sampled in the background and brakes the motors on the press edge, so a busy loop doesn't overshoot the stop.
+        """
+        with self.camera_stop.sampled(motors=(self.motors,)):
+            state = await self._seek_stop_async()
+
+        if state == 'reverse':
+            logger.info('Reverse homing direction.')
+            self.invert_up_direction()
+            await self.home_async()  # Re home.
+        elif state =='abort':
+            logger.info('Abort homing procedure')
+        else:
+            await run_blocking(self.brick.play_sound_file, False, '! Backup.rso')
+            await self.motors.turn_async(self.power, 360)
+            logger.info('Homed camera bar.')
+    
+
+    async def _seek_stop_async(self) -> Optional[str]:
+        """ Run to the camera stop and handle the presses of home, returns 'reverse', 'abort' or None when homed. """
+        await run_blocking(self.motors.run, -self.power)  # Use inverted power
+        recorder = get_recorder()
+        if recorder is not None:
+            recorder.start_move()
         state = None
         while True:
-            with self.camera_stop as switch:
+            if recorder is not None:
+                # Only read the motors while recording, homing itself just needs the switch.
+                self.motors.record_tacho(recorder, await run_blocking(self.motors.get_tacho))
+            async with self.camera_stop as switch:
                 # Use enter method to update once per loop and not on each function call.
                 if switch.is_pressed():
                     # Stop motors as soon as switch is pressed.
                     state = 'reverse'
-                    self.motors.stop()
+                    await self.motors.stop_async()
                 if switch.is_pressed(1000):
-                    self.brick.play_tone(440, 500)
+                    await run_blocking(self.brick.play_tone, 440, 500)
                     state = 'abort'
                 if switch.is_pressed(2000):
                     # If switch reaches 2 seconds, the camera bar is homed.
@@ -70,19 +119,98 @@ class CameraBar(LN3DTimer):
                     break
                 if state is not None and switch.is_released():
                     break
-            self.wait()  # Allow processing time between each loop.
+            await self.wait_async()  # Allow processing time between each loop.
+        return state
 
-        if state == 'reverse':
-            logger.info('Reverse homing direction.')
-            self.invert_up_direction()
-            self.home()  # Re home.
-        elif state =='abort':
-            logger.info('Abort homing procedure')
-        else:
-            self.brick.play_sound_file(False, '! Backup.rso')
-            self.motors.turn(self.power, 360)
-            logger.info('Homed camera bar.')
-    
+    def _stop_pressed(self) -> bool:
+        return self.camera_stop.read()
+
+    async def _approach_async(self, power: int, tacho_units: int) -> bool:
+        """ Turn towards the camera stop till it is pressed, returns whether it was. """
+        await self.motors.turn_async(-self._up_direction * power, tacho_units, stop_turn=self._stop_pressed)
+        return await run_blocking(self._stop_pressed)
+
+    async def _touch_async(self, slow_power: int, back_off: int) -> bool:
+        """ Find the switch edge at slow power from back_off units away and remember the position. """
+        for _ in range(4):
+            if not await run_blocking(self._stop_pressed):
+                break
+            await self.motors.turn_async(self.power, back_off)  # Release the switch first.
+        if not await self._approach_async(slow_power, 2 * back_off):
+            return False
+        self._stop_count = (await run_blocking(self.motors.get_tacho)).tacho_count
+        return True
+
+    async def home_fast_async(self, slow_power: int = 20, back_off: int = 180, max_travel: Optional[int] = None):
+        """
+            Two phase homing: approach the camera stop at full power, back off and touch it again at slow power,
+            so the stop is hit fast but its position is found without the overshoot of a fast stop.
+            Ends 360 units away from the stop like home. Doesn't reverse, use home to find the direction of a new setup.
+        """
+        max_travel = 360 * self._gear_ratio if max_travel is None else max_travel  # A full turn of the bar.
+        with self.camera_stop.sampled(motors=(self.motors,)):
+            found = await self._approach_async(self._power, max_travel) and await self._touch_async(slow_power, back_off)
+        if not found:
+            raise RuntimeError('Camera stop not reached, check the up direction or home manually.')
+        await self.motors.turn_async(self.power, 360)
+        logger.info('Homed camera bar.')
+
+    def home_fast(self, slow_power: int = 20, back_off: int = 180, max_travel: Optional[int] = None):
+        """ Blocking version of home_fast_async. """
+        run_sync(self.home_fast_async(slow_power, back_off, max_travel))
+
+    async def verify_home_async(self, stop_tacho: int, margin: int = 180, slow_power: int = 20) -> bool:
+        """
+            Check that the bar is stop_tacho units from the camera stop with one short touch: a fast move to margin units
+            before the stop and a slow approach of at most 2 * margin. Ends 360 units from the stop when verified.
+        """
+        with self.camera_stop.sampled(motors=(self.motors,)):
+            if stop_tacho - margin > 10:
+                await self._approach_async(self._power, stop_tacho - margin)
+            found = await self._touch_async(slow_power, margin)
+        if not found:
+            return False
+        await self.motors.turn_async(self.power, 360)
+        return True
+
+    def get_stop_tacho(self) -> Optional[int]:
+        """ Motor tacho units the bar is away from the camera stop, None when not homed. """
+        if self._stop_count is None:
+            return None
+        return (self.motors.get_tacho().tacho_count - self._stop_count) * self._up_direction
+
+    def save_state(self, store: Optional[BarStateStore] = None) -> Optional[BarState]:
+        """ Persist the bar position and calibration, call at shutdown so the next start can skip homing. """
+        stop_tacho = self.get_stop_tacho()
+        if stop_tacho is None:
+            logger.warning('Camera bar not homed, its state is not saved.')
+            return None
+        state = BarState(stop_tacho, self._up_direction, self._camera_stop_offset, self._gear_ratio)
+        store = BarStateStore() if store is None else store
+        store.save(self.brick.get_device_info()[0], state)
+        return state
+
+    async def startup_async(self, store: Optional[BarStateStore] = None, margin: int = 180) -> bool:
+        """
+            Restore the saved calibration and verify the saved position with one touch, home when there is no saved state
+            or it doesn't match. Returns True when homing was skipped.
+        """
+        store = BarStateStore() if store is None else store
+        name = (await run_blocking(self.brick.get_device_info))[0]
+        state = store.get(name)
+        if state is not None and state.gear_ratio == self._gear_ratio:
+            self._up_direction = state.up_direction
+            self._camera_stop_offset = state.camera_stop_offset
+            if await self.verify_home_async(state.stop_tacho, margin):
+                logger.info('Camera bar position verified.')
+                return True
+            logger.info('Camera bar not where it was saved, homing.')
+        await self.home_fast_async(back_off=margin)
+        return False
+
+    def startup(self, store: Optional[BarStateStore] = None, margin: int = 180) -> bool:
+        """ Blocking version of startup_async. """
+        return run_sync(self.startup_async(store, margin))
 
     def calibrate_camera_offset(self):
         """ 
@@ -96,15 +224,15 @@ class CameraBar(LN3DTimer):
                 6) Camera will home again.
         """
         logger.info('Calibrating camera bar rotation offset.')
-        self.home()
+        self.home_fast()
         # only limit to half a camera bar rotation so it won't break anything.
         logger.info('Reverse camera rotating till center with a maximum of 180 degrees camera bar rotation.')
-        self.motors.turn(self.power, 180 * self._gear_ratio, stop_turn=self.camera_stop.is_pressed)
+        self.motors.turn(self.power, 180 * self._gear_ratio, stop_turn=self.camera_stop.is_pressed, profile=self.profile)
         logger.info('Waiting for user input to continue.')
         self.camera_stop.wait_for_press(timeout=120)  # Allow 2 minutes of calibatrion.
         logger.info('User calibrated center. Returning home.')
         self.motors.reset_position(True)
-        self.home()
+        self.home_fast()
         rotation = self.motors.get_tacho().block_tacho_count
         logger.info(f'Camera calibration results:\n  Rotation from center to camera stop: {rotation}\n  Up direction: {self._up_direction}')
         self._camera_stop_offset = rotation
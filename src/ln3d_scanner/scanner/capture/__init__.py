@@ -0,0 +1,6 @@
+from .camera import Camera, Frame
+from .synthetic_camera import SyntheticCamera
+from .file_camera import FileCamera, CameraExhausted
+from .image_encoding import encode_frame, encode_png, encode_pnm, read_pnm
+from .capture_pipeline import CapturePipeline, PipelineStats
+from .continuous_capture import ContinuousCapture, CapturedFrame
@@ -0,0 +1,51 @@
+import abc
+import time
+
+from typing import NamedTuple, Optional
+
+
+class Frame(NamedTuple):
+    pose: object  # Scan pose the frame was captured at, usually a ScanPose.
+    timestamp: float  # Monotonic time of the exposure.
+    width: int
+    height: int
+    channels: int  # 1 for grey, 3 for RGB.
+    pixels: bytes  # Row major, 8 bits per channel. Already encoded image data when encoding is set.
+    encoding: Optional[str] = None  # File extension of already encoded pixels, None for raw pixels.
+
+
+class Camera(abc.ABC):
+    """
+        Camera backend of the capture pipeline. Backends implement _grab, capture adds the timing.
+        capture returns as soon as the exposure is done so the next move can start, encoding and writing is left to the pipeline.
+    """
+
+    def __init__(self, exposure: float = 0.0):
+        self.exposure = exposure  # Seconds the scanner has to stand still for a frame.
+        self.frames = 0
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @abc.abstractmethod
+    def _grab(self, pose, timestamp: float) -> Frame:
+        pass
+
+    def capture(self, pose) -> Frame:
+        """ Expose a frame at the pose, blocks for the exposure. """
+        timestamp = time.monotonic()
+        if self.exposure:
+            time.sleep(self.exposure)
+        frame = self._grab(pose, timestamp)
+        self.frames += 1
+        return frame
@@ -0,0 +1,196 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+
+from .camera import Camera, Frame
+from .image_encoding import encode_frame
+
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineStats:
+    """
+        Where the time of a scan went. motion is the time between captures, spent moving to the next pose,
+        io_blocked is the time a capture waited for a free writer and drain the wait for the last writes at close.
+        encode and write are summed over the worker threads, so they overlap with the rest.
+    """
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+        self.capture = 0.0
+        self.motion = 0.0
+        self.io_blocked = 0.0
+        self.drain = 0.0
+        self.encode = 0.0
+        self.write = 0.0
+        self.max_pending = 0
+        self._lock = threading.Lock()
+
+    def add_save(self, encode: float, write: float, size: int):
+        with self._lock:
+            self.encode += encode
+            self.write += write
+            self.bytes += size
+
+    def to_dict(self) -> dict:
+        return {
+            'frames': self.frames,
+            'bytes': self.bytes,
+            'capture': self.capture,
+            'motion': self.motion,
+            'io_blocked': self.io_blocked,
+            'drain': self.drain,
+            'encode': self.encode,
+            'write': self.write,
+            'max_pending': self.max_pending,
+        }
+
+    def __str__(self):
+        return (f'{self.frames} frames: capture {self.capture:.2f}s, motion {self.motion:.2f}s, '
+                f'blocked on I/O {self.io_blocked + self.drain:.2f}s (encode {self.encode:.2f}s, write {self.write:.2f}s in workers)')
+
+
+class CapturePipeline:
+    """
+        Captures a frame per scan pose and saves it in the background.
+        capture blocks only for the exposure, encoding and writing run on a bounded thread pool so the next move
+        starts while the previous frame is still being saved. When max_pending frames are waiting the next capture
+        blocks until one is written, so memory stays bounded when the disk can't keep up.
+        Frames are written as image files to directory, or appended unencoded to a ScanSession when session is given.
+        An instance can be passed as capture callback to run_plan.
+    """
+
+    def __init__(self, camera: Camera, directory: Optional[str] = None, workers: int = 2, max_pending: int = 4,
+                 image_format: str = 'png', compression: int = 6, session=None):
+        if (directory is None) == (session is None):
+            raise ValueError('Give either a directory or a session to write to.')
+        self.camera = camera
+        self.directory = directory
+        self.session = session
+        self.workers = workers
+        self.max_pending = max_pending
+        self.image_format = image_format
+        self.compression = compression
+        self.stats = PipelineStats()
+        self.manifest: List[dict] = []  # File and pose of every saved frame, written to frames.json on close.
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._futures: List[Future] = []
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._last_capture: Optional[float] = None
+        self._first_index = 0  # Frames already in the session when resuming.
+
+    def open(self):
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+        self.camera.open()
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='ln3d-capture')
+        self._last_capture = None
+        self._first_index = 0 if self.session is None else len(self.session)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __call__(self, pose) -> Future:
+        return self.capture(pose)
+
+    def _save(self, entry: dict, frame: Frame) -> str:
+        if self.session is not None:
+            start = time.monotonic()
+            self.session.append_frame(frame, entry['index'])
+            self.stats.add_save(0.0, time.monotonic() - start, len(frame.pixels))
+            entry['file'] = self.session.path
+            return self.session.path
+        start = time.monotonic()
+        data, extension = encode_frame(frame, self.image_format, self.compression)
+        encoded = time.monotonic()
+        name = entry['file'] = f'frame_{entry["index"]:05d}.{extension}'
+        with open(os.path.join(self.directory, name), 'wb') as file:
+            file.write(data)
+        self.stats.add_save(encoded - start, time.monotonic() - encoded, len(data))
+        return name
+
+    def _saved(self, future: Future):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def _raise_errors(self):
+        """ Raise the first failed write and forget the finished ones. """
+        done = [future for future in self._futures if future.done()]
+        self._futures = [future for future in self._futures if not future.done()]
+        for future in done:
+            future.result()
+
+    def capture(self, pose) -> Future:
+        """ Capture a frame at the pose and queue it for saving. Returns a future of the file name. """
+        if self._executor is None:
+            self.open()
+        self._raise_errors()
+        start = time.monotonic()
+        if self._last_capture is not None:
+            self.stats.motion += start - self._last_capture
+
+        frame = self.camera.capture(pose)
+        captured = time.monotonic()
+        self.stats.capture += captured - start
+
+        # Wait for a writer when too many frames are queued.
+        self._slots.acquire()
+        slotted = time.monotonic()
+        self.stats.io_blocked += slotted - captured
+
+        index = self._first_index + self.stats.frames
+        self.stats.frames += 1
+        with self._lock:
+            self._pending += 1
+            self.stats.max_pending = max(self.stats.max_pending, self._pending)
+        entry = {
+            'index': index,
+            'file': None,  # Set once written.
+            'timestamp': frame.timestamp,
+            'angle': getattr(pose, 'angle', None),
+            'elevation': getattr(pose, 'elevation', None),
+        }
+        self.manifest.append(entry)
+        future = self._executor.submit(self._save, entry, frame)
+        future.add_done_callback(self._saved)
+        self._futures.append(future)
+        self._last_capture = slotted
+        return future
+
+    def flush(self):
+        """ Wait till every queued frame is written. """
+        start = time.monotonic()
+        for future in self._futures:
+            future.result()
+        self._futures.clear()
+        self.stats.drain += time.monotonic() - start
+
+    def close(self):
+        if self._executor is None:
+            return
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown()
+            self._executor = None
+            self.camera.close()
+        if self.session is not None:
+            self.session.update_metadata(capture_stats=self.stats.to_dict())
+        else:
+            with open(os.path.join(self.directory, 'frames.json'), 'w') as file:
+                json.dump({'stats': self.stats.to_dict(), 'frames': self.manifest}, file, indent=2)
+        logger.info(f'Capture pipeline: {self.stats}')
@@ -0,0 +1,187 @@
+import asyncio
+import bisect
+import inspect
+import logging
+import math
+
+from typing import Callable, Iterable, List, NamedTuple, Optional, Tuple
+
+from nxt.motor import BlockedException
+
+from ln3d_scanner.timer import LN3DTimer, run_blocking, run_sync
+from ln3d_scanner.nxt.motors import PrecisionMotor
+
+
+logger = logging.getLogger(__name__)
+
+
+class CapturedFrame(NamedTuple):
+    target: float  # Requested angle in degrees.
+    timestamp: float  # Monotonic time of the exposure.
+    tacho: float  # Tacho count interpolated at the exposure.
+    angle: float  # Angle at the exposure in degrees.
+    data: object  # Whatever the capture callback returned.
+
+
+class ContinuousCapture(LN3DTimer):
+    """
+        Captures frames while a motor spins at a constant regulated speed instead of stopping at every angle.
+        Speed is fitted on the most recent tacho samples, each capture is triggered at the predicted moment
+        the motor passes its angle and the frame is tagged with the tacho interpolated at the exposure.
+        Works with the platform motor as well as the camera bar DualMotors (their average tacho is used).
+    """
+
+    def __init__(self, motor: PrecisionMotor, tacho_per_degree: float = 1, power: int = 30, trigger_delay: float = 0.0,
+                 lead_in: int = 20, window: int = 5, timeout: float = 1, **kwargs):
+        kwargs.setdefault('frequency', motor.frequency)
+        super().__init__(**kwargs)
+        self.motor = motor
+        self.tacho_per_degree = tacho_per_degree
+        self.power = power
+        self.trigger_delay = trigger_delay  # Seconds from calling capture till the exposure.
+        self.lead_in = lead_in  # Tacho units between reaching a steady speed and the first capture.
+        self.window = window  # Tacho samples used to fit the speed.
+        self.timeout = timeout  # Seconds without progress before the motor is considered blocked.
+        self._times: List[float] = []
+        self._tachos: List[int] = []
+
+    @property
+    def direction(self) -> int:
+        return 1 if self.power > 0 else -1
+
+    def _sample(self) -> Tuple[float, int]:
+        """ Read the tacho, it is sampled roughly halfway the request. Runs in an executor, so it doesn't store the sample. """
+        start = self.now()
+        tacho = self.motor.get_tacho().tacho_count
+        return (start + self.now()) / 2, tacho
+
+    def _add(self, sample_time: float, tacho: int) -> int:
+        """ Store a sample, only on the event loop thread so speed and predict never see half of one. """
+        self._times.append(sample_time)
+        self._tachos.append(tacho)
+        return tacho
+
+    def speed(self, window: Optional[int] = None) -> Optional[float]:
+        """ Least squares speed in tacho units per second over the last samples. """
+        window = self.window if window is None else window
+        times, tachos = self._times[-window:], self._tachos[-window:]
+        if len(times) < 2:
+            return None
+        mean_time = sum(times) / len(times)
+        mean_tacho = sum(tachos) / len(tachos)
+        variance = sum((t - mean_time) ** 2 for t in times)
+        if variance == 0:
+            return None
+        return sum((t - mean_time) * (c - mean_tacho) for t, c in zip(times, tachos)) / variance
+
+    def predict(self, tacho: float) -> Optional[float]:
+        """ Time the motor passes the tacho count, None while it doesn't move towards it. """
+        speed = self.speed()
+        if speed is None or speed * self.direction <= 0:
+            return None
+        return self._times[-1] + (tacho - self._tachos[-1]) / speed
+
+    def interpolate(self, timestamp: float) -> float:
+        """ Tacho count at timestamp, linear between the samples around it. """
+        index = bisect.bisect_left(self._times, timestamp)
+        if index == 0:
+            index = 1
+        elif index == len(self._times):
+            index -= 1
+        t0, t1 = self._times[index - 1], self._times[index]
+        c0, c1 = self._tachos[index - 1], self._tachos[index]
+        if t1 == t0:
+            return float(c1)
+        return c0 + (c1 - c0) * (timestamp - t0) / (t1 - t0)
+
+    def targets(self, angles: Iterable[float], tacho: int) -> List[Tuple[float, float]]:
+        """ Return (angle, tacho) of the next pass over every angle, after the lead in, in the order they are reached. """
+        start = tacho + self.direction * self.lead_in
+        revolution = 360 * self.tacho_per_degree
+        targets = []
+        for angle in angles:
+            base = angle * self.tacho_per_degree
+            # First time the angle comes by after the lead in.
+            turns = math.ceil(self.direction * (start - base) / revolution)
+            targets.append((angle, base + self.direction * turns * revolution))
+        return sorted(targets, key=lambda item: self.direction * item[1])
+
+    async def _spin_up(self) -> int:
+        """ Sample till the speed is steady, returns the last tacho count. """
+        start = self.now()
+        while True:
+            await self.wait_next_async()
+            tacho = self._add(*await run_blocking(self._sample))
+            speed, recent = self.speed(), self.speed(2)
+            if len(self._times) > self.window and speed and recent and abs(recent - speed) < 0.05 * abs(speed):
+                return tacho
+            if self.now() - start > self.timeout and (not speed or speed * self.direction <= 0):
+                raise BlockedException('Blocked!')
+            if self.now() - start > 3 * self.timeout:
+                return tacho  # Not steady but moving, the speed keeps being fitted while capturing.
+
+    async def capture_async(self, angles: Iterable[float], capture: Callable[[float], object], stop: bool = True) -> List[CapturedFrame]:
+        """ Spin the motor and capture at every angle in one pass. capture is called with the angle, it may return an awaitable. """
+        self._times.clear()
+        self._tachos.clear()
+        shots = []  # (angle, exposure time, data)
+
+        await run_blocking(self.motor.run, self.power, True)
+        self.start_loop()
+        try:
+            tacho = await self._spin_up()
+            self._times, self._tachos = self._times[-self.window:], self._tachos[-self.window:]  # Drop the acceleration.
+            pending = self.targets(angles, tacho)
+            progress_time = self.now()
+            sampling = None  # Tacho request running in the background while waiting for triggers.
+            next_sample = self.now()
+            while pending:
+                now = self.now()
+                interval = 1 / self.frequency
+                if sampling is not None and sampling.done():
+                    self._add(*sampling.result())  # Raises transport errors.
+                    sampling = None
+                    # Blocked when the tacho didn't change for timeout seconds.
+                    if len(self._tachos) < 2 or self._tachos[-1] != self._tachos[-2]:
+                        progress_time = now
+                    elif now - progress_time > self.timeout:
+                        raise BlockedException('Blocked!')
+                if sampling is None and now >= next_sample:
+                    sampling = asyncio.ensure_future(run_blocking(self._sample))
+                    next_sample = now + interval
+
+                angle, target = pending[0]
+                trigger_at = self.predict(target)
+                wait = None if trigger_at is None else trigger_at - self.trigger_delay - now
+                if wait is not None and wait < interval:
+                    await self.wait_async(max(0, wait))
+                    exposure = self.now() + self.trigger_delay
+                    data = await run_blocking(capture, angle)
+                    if inspect.isawaitable(data):
+                        data = await data
+                    shots.append((angle, exposure, data))
+                    pending.pop(0)
+                    continue
+                # Wake up when the trigger gets close, the running sample returns or the next one is due.
+                timeout = interval if wait is None else wait - interval
+                if sampling is None:
+                    await asyncio.sleep(max(0, min(timeout, next_sample - now)))
+                else:
+                    await asyncio.wait([sampling], timeout=max(0, timeout))
+            if sampling is not None:
+                self._add(*await sampling)
+            self._add(*await run_blocking(self._sample))  # A sample after the last exposure to interpolate against.
+        finally:
+            if stop:
+                await run_blocking(self.motor.brake)
+
+        frames = []
+        for angle, exposure, data in shots:
+            tacho = self.interpolate(exposure)
+            frames.append(CapturedFrame(angle, exposure, tacho, tacho / self.tacho_per_degree, data))
+        logger.info(f'Captured {len(frames)} frames in {self._times[-1] - self._times[0]:.1f}s while moving.')
+        return frames
+
+    def capture(self, angles: Iterable[float], capture: Callable[[float], object], stop: bool = True) -> List[CapturedFrame]:
+        """ Blocking version of capture_async. """
+        return run_sync(self.capture_async(angles, capture, stop))
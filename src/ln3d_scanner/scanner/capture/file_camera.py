@@ -0,0 +1,55 @@
+import os
+
+from typing import Iterable, List
+
+from .camera import Camera, Frame
+from .image_encoding import read_pnm
+
+
+class CameraExhausted(Exception):
+    """ A camera that doesn't loop was asked for a frame after its last image. """
+    pass
+
+
+class FileCamera(Camera):
+    """
+        Stand in camera that replays image files from a directory in name order, one per capture.
+        PGM and PPM files are decoded into pixels, other images are passed on encoded and written unchanged.
+    """
+
+    def __init__(self, directory: str, extensions: Iterable[str] = ('.pgm', '.ppm', '.png', '.jpg', '.jpeg'),
+                 loop: bool = True, exposure: float = 0.0):
+        super().__init__(exposure)
+        self.directory = directory
+        self.extensions = tuple(extension.lower() for extension in extensions)
+        self.loop = loop  # Start over after the last file, otherwise capturing past it raises CameraExhausted.
+        self.files: List[str] = []
+        self._index = 0
+
+    def open(self):
+        self.files = sorted(os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                            if name.lower().endswith(self.extensions))
+        if not self.files:
+            raise FileNotFoundError(f'No images in {self.directory}.')
+        self._index = 0
+
+    def _next_file(self) -> str:
+        if not self.files:
+            self.open()
+        if self._index >= len(self.files):
+            if not self.loop:
+                raise CameraExhausted(f'No more images in {self.directory}.')
+            self._index = 0
+        path = self.files[self._index]
+        self._index += 1
+        return path
+
+    def _grab(self, pose, timestamp: float) -> Frame:
+        path = self._next_file()
+        with open(path, 'rb') as file:
+            data = file.read()
+        extension = os.path.splitext(path)[1].lower()
+        if extension in ('.pgm', '.ppm'):
+            width, height, channels, pixels = read_pnm(data)
+            return Frame(pose, timestamp, width, height, channels, pixels)
+        return Frame(pose, timestamp, 0, 0, 0, data, extension[1:])
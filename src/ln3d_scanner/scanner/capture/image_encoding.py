@@ -0,0 +1,63 @@
+import struct
+import zlib
+
+from typing import Tuple
+
+from .camera import Frame
+
+
+FORMATS = ('png', 'pnm')
+
+
+def encode_pnm(width: int, height: int, channels: int, pixels: bytes) -> bytes:
+    """ Binary PGM (grey) or PPM (RGB), no compression so it is cheap to write. """
+    magic = b'P5' if channels == 1 else b'P6'
+    return b'%s\n%d %d\n255\n' % (magic, width, height) + pixels
+
+
+def read_pnm(data: bytes) -> Tuple[int, int, int, bytes]:
+    """ Return width, height, channels and pixels of a binary PGM or PPM with 8 bit samples. """
+    fields = []
+    position = 0
+    # Magic, width, height and maxval separated by whitespace, comments run till the end of the line.
+    while len(fields) < 4:
+        while data[position:position + 1].isspace():
+            position += 1
+        if data[position:position + 1] == b'#':
+            position = data.index(b'\n', position)
+            continue
+        start = position
+        while not data[position:position + 1].isspace():
+            position += 1
+        fields.append(data[start:position])
+    magic, width, height, maxval = fields[0], int(fields[1]), int(fields[2]), int(fields[3])
+    if magic not in (b'P5', b'P6') or maxval > 255:
+        raise ValueError(f'Unsupported image {magic!r} with maxval {maxval}.')
+    channels = 1 if magic == b'P5' else 3
+    start = position + 1  # A single whitespace separates the header from the pixels.
+    return width, height, channels, data[start:start + width * height * channels]
+
+
+def _chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+
+def encode_png(width: int, height: int, channels: int, pixels: bytes, compression: int = 6) -> bytes:
+    """ 8 bit grey or RGB PNG without row filters. zlib releases the GIL, so frames compress in parallel on worker threads. """
+    stride = width * channels
+    # Every row starts with filter type 0.
+    raw = b''.join(b'\x00' + pixels[y * stride:(y + 1) * stride] for y in range(height))
+    color_type = 0 if channels == 1 else 2
+    header = struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + _chunk(b'IHDR', header) + _chunk(b'IDAT', zlib.compress(raw, compression)) + _chunk(b'IEND', b'')
+
+
+def encode_frame(frame: Frame, image_format: str = 'png', compression: int = 6) -> Tuple[bytes, str]:
+    """ Return the encoded frame and its file extension. Frames that are already encoded are returned unchanged. """
+    if frame.encoding is not None:
+        return frame.pixels, frame.encoding
+    if image_format == 'png':
+        return encode_png(frame.width, frame.height, frame.channels, frame.pixels, compression), 'png'
+    if image_format == 'pnm':
+        return encode_pnm(frame.width, frame.height, frame.channels, frame.pixels), 'pgm' if frame.channels == 1 else 'ppm'
+    raise ValueError(f'Unknown image format {image_format}, use one of {FORMATS}.')
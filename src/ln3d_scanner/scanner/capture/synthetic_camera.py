@@ -0,0 +1,25 @@
+from .camera import Camera, Frame
+
+
+class SyntheticCamera(Camera):
+    """
+        Stand in camera for testing without hardware. Frames are a grey gradient with a vertical bar at the
+        platform angle and a horizontal bar at the camera bar elevation, so a saved frame shows the pose it was taken at.
+    """
+
+    def __init__(self, width: int = 320, height: int = 240, exposure: float = 0.0):
+        super().__init__(exposure)
+        self.width = width
+        self.height = height
+        self._row = bytes(round(255 * x / max(1, width - 1)) // 2 for x in range(width))  # Left to right gradient, half brightness.
+
+    def _grab(self, pose, timestamp: float) -> Frame:
+        angle, elevation = getattr(pose, 'angle', 0.0), getattr(pose, 'elevation', 0.0)
+        row = bytearray(self._row)
+        column = int(angle % 360 / 360 * self.width)
+        row[column:column + 4] = b'\xff' * len(row[column:column + 4])
+        pixels = bytearray(bytes(row) * self.height)
+        # Elevation from -90 (bottom) to 90 (top).
+        line = min(self.height - 4, max(0, int((90 - elevation) / 180 * self.height)))
+        pixels[line * self.width:(line + 4) * self.width] = b'\xff' * (4 * self.width)
+        return Frame(pose, timestamp, self.width, self.height, 1, bytes(pixels))
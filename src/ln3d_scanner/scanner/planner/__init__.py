@@ -0,0 +1,3 @@
+from .axis_model import AxisModel
+from .scan_planner import ScanPlanner, ScanPlan, ScanPose
+from .scan_runner import ScanReport, run_plan, run_plan_async
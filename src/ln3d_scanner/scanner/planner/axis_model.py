@@ -0,0 +1,43 @@
+class AxisModel:
+    """
+        Time cost of moving one axis.
+        tacho_per_degree: motor tacho units per degree of the axis (the gear ratio).
+        speed: motor tacho units per second while moving.
+        overhead: seconds per move spent on acceleration, braking and the stop latency.
+        settle: seconds to wait after a move before capturing.
+        wraps: the axis is continuous (platform) and may turn either way round.
+    """
+
+    def __init__(self, tacho_per_degree: float, speed: float = 800, overhead: float = 0.2, settle: float = 0.0, wraps: bool = False):
+        self.tacho_per_degree = tacho_per_degree
+        self.speed = speed
+        self.overhead = overhead
+        self.settle = settle
+        self.wraps = wraps
+
+    @classmethod
+    def for_motors(cls, motors, power: int, tacho_per_degree: float, max_speed: float = 800, overhead: float = 0.2,
+                   stop_wait: float = 0.0, **kwargs) -> 'AxisModel':
+        """
+            Axis driven by motors moving together at power. Speed and overhead come from the motor models when all motors
+            are identified (the slowest motor counts, stop_wait is added), otherwise from max_speed and overhead.
+        """
+        models = [motor.model for motor in motors]
+        if models and None not in models and all(model.speed(power) > 0 for model in models):
+            return cls(tacho_per_degree, min(model.speed(power) for model in models),
+                       max(model.overhead(power) for model in models) + stop_wait, **kwargs)
+        return cls(tacho_per_degree, max_speed * abs(power) / 100, overhead, **kwargs)
+
+    def delta(self, start: float, end: float) -> float:
+        """ Shortest signed move in degrees from start to end. """
+        delta = end - start
+        if self.wraps:
+            delta = (delta + 180) % 360 - 180
+        return delta
+
+    def move_time(self, start: float, end: float) -> float:
+        """ Estimated seconds to move from start to end, 0 when not moving. """
+        tacho = abs(self.delta(start, end)) * self.tacho_per_degree
+        if tacho < 1:
+            return 0.0
+        return self.overhead + tacho / self.speed + self.settle
@@ -0,0 +1,139 @@
+import itertools
+import logging
+
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Sequence
+
+from .axis_model import AxisModel
+
+
+logger = logging.getLogger(__name__)
+
+
+class ScanPose(NamedTuple):
+    angle: float  # Platform degrees.
+    elevation: float  # Camera bar degrees, 0 is the top.
+
+
+class ScanPlan:
+    """ Ordered capture poses with the estimated duration of moving through them. """
+
+    def __init__(self, planner: 'ScanPlanner', poses: List[ScanPose], start: ScanPose, strategy: str):
+        self.planner = planner
+        self.poses = poses
+        self.start = start
+        self.strategy = strategy
+        self.estimated = planner.duration(poses, start)
+
+    def __len__(self) -> int:
+        return len(self.poses)
+
+    def __iter__(self) -> Iterator[ScanPose]:
+        return iter(self.poses)
+
+    def __str__(self):
+        return f'Scan plan of {len(self)} poses ({self.strategy}), estimated {self.estimated:.1f}s'
+
+    def resume(self, done: Iterable[ScanPose], start: Optional[ScanPose] = None) -> 'ScanPlan':
+        """ Plan of the poses not done yet in the same order, from start (default the start of this plan). """
+        done = {(round(pose.angle % 360, 6), round(pose.elevation, 6)) for pose in done}
+        poses = [pose for pose in self.poses if (round(pose.angle % 360, 6), round(pose.elevation, 6)) not in done]
+        return ScanPlan(self.planner, poses, self.start if start is None else start, self.strategy)
+
+
+class ScanPlanner:
+    """
+        Orders capture poses over platform angles and camera bar elevations to minimize motion time.
+        Serpentine orders (rows of one axis, alternating direction along the other) are the baseline,
+        a 2-opt search on the cost model tries to improve on the best of them.
+        With concurrent set both axes move at the same time, so a transition costs the slowest axis.
+    """
+
+    def __init__(self, platform: AxisModel, camera_bar: AxisModel, capture_time: float = 0.0, concurrent: bool = True,
+                 max_search_poses: int = 600, max_passes: int = 20):
+        self.platform = platform
+        self.camera_bar = camera_bar
+        self.capture_time = capture_time
+        self.concurrent = concurrent
+        self.max_search_poses = max_search_poses  # Larger scans only use serpentine orders.
+        self.max_passes = max_passes
+
+    @classmethod
+    def for_scanner(cls, camera_bar, platform=None, bar_power: Optional[int] = None, max_speed: float = 800, **kwargs) -> 'ScanPlanner':
+        """
+            Planner with axis models from the platform and camera bar gearing and motor power.
+            Identified motors (see load_motor_models) give the speed and overhead, max_speed is the guess for the others.
+        """
+        bar_power = abs(camera_bar.power) if bar_power is None else bar_power
+        motors, gear_ratio, power, settle = ([], 1, 100, 0.0) if platform is None else (
+            [platform.motor], platform.gear_ratio, platform.power, platform.settle)
+        return cls(
+            AxisModel.for_motors(motors, power, gear_ratio, max_speed, settle=settle, wraps=True),
+            # Dual motor stops wait 0.5s.
+            AxisModel.for_motors(camera_bar.motors.motors, bar_power, camera_bar._gear_ratio, max_speed, overhead=0.7, stop_wait=0.5),
+            **kwargs
+        )
+
+    def transition(self, start: ScanPose, end: ScanPose) -> float:
+        """ Seconds from capturing at start till capturing at end. """
+        platform = self.platform.move_time(start.angle, end.angle)
+        camera_bar = self.camera_bar.move_time(start.elevation, end.elevation)
+        motion = max(platform, camera_bar) if self.concurrent else platform + camera_bar
+        return motion + self.capture_time
+
+    def duration(self, poses: Sequence[ScanPose], start: ScanPose) -> float:
+        return sum(self.transition(a, b) for a, b in zip(itertools.chain([start], poses), poses))
+
+    def serpentine(self, angles: Sequence[float], elevations: Sequence[float], start: ScanPose) -> List[List[ScanPose]]:
+        """ Serpentine orders: rows per elevation or per angle, each starting from the row closest to the start. """
+        orders = []
+        for rows, columns, make in (
+            (elevations, angles, lambda row, column: ScanPose(column, row)),
+            (angles, elevations, lambda row, column: ScanPose(row, column)),
+        ):
+            for reverse_rows, reverse_columns in itertools.product((False, True), repeat=2):
+                order = []
+                columns_forward = sorted(columns, reverse=reverse_columns)
+                for index, row in enumerate(sorted(rows, reverse=reverse_rows)):
+                    row_columns = columns_forward if index % 2 == 0 else columns_forward[::-1]
+                    order.extend(make(row, column) for column in row_columns)
+                orders.append(order)
+        return orders
+
+    def _two_opt(self, route: List[ScanPose], start: ScanPose) -> List[ScanPose]:
+        """ Reverse route segments while it shortens the path. The path is open, it ends at the last pose. """
+        nodes = [start] + route
+        count = len(nodes)
+        cost = [[self.transition(a, b) for b in nodes] for a in nodes]
+        order = list(range(count))
+        for _ in range(self.max_passes):
+            improved = False
+            for i in range(1, count - 1):
+                a, b = order[i - 1], order[i]
+                for j in range(i + 1, count):
+                    c = order[j]
+                    d = order[j + 1] if j + 1 < count else None
+                    before = cost[a][b] + (cost[c][d] if d is not None else 0)
+                    after = cost[a][c] + (cost[b][d] if d is not None else 0)
+                    if after < before - 1e-9:
+                        order[i:j + 1] = order[i:j + 1][::-1]
+                        b = order[i]
+                        improved = True
+            if not improved:
+                break
+        return [nodes[index] for index in order[1:]]
+
+    def plan(self, angles: Iterable[float], elevations: Iterable[float], start: Optional[ScanPose] = None) -> ScanPlan:
+        """ Return the fastest order found to capture every combination of platform angle and camera bar elevation. """
+        angles = sorted(set(angle % 360 for angle in angles))
+        elevations = sorted(set(elevations))
+        start = ScanPose(angles[0], elevations[0]) if start is None else start
+
+        candidates = [('serpentine', order) for order in self.serpentine(angles, elevations, start)]
+        strategy, best = min(candidates, key=lambda candidate: self.duration(candidate[1], start))
+        if len(best) <= self.max_search_poses:
+            searched = self._two_opt(best, start)
+            if self.duration(searched, start) < self.duration(best, start):
+                strategy, best = 'serpentine + 2-opt', searched
+        plan = ScanPlan(self, best, start, strategy)
+        logger.info(str(plan))
+        return plan
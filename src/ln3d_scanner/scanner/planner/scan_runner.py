@@ -0,0 +1,89 @@
+import asyncio
+import inspect
+import logging
+import time
+
+from typing import Callable, List, Optional, Tuple
+
+from ln3d_scanner.timer import run_blocking, run_sync
+from ln3d_scanner.scanner.platform import Platform
+from .scan_planner import ScanPlan, ScanPose
+
+
+logger = logging.getLogger(__name__)
+
+
+class ScanReport:
+    """ Estimated vs actual duration of an executed scan plan. """
+
+    def __init__(self, plan: ScanPlan):
+        self.plan = plan
+        self.estimated = plan.estimated
+        self.actual = 0.0
+        self.steps: List[Tuple[ScanPose, float, float]] = []  # Pose, estimated and actual seconds.
+
+    def add(self, pose: ScanPose, estimated: float, actual: float):
+        self.steps.append((pose, estimated, actual))
+        self.actual += actual
+
+    @property
+    def error(self) -> Optional[float]:
+        """ Relative error of the estimate, positive when the scan took longer. """
+        return (self.actual - self.estimated) / self.estimated if self.estimated else None
+
+    def to_dict(self) -> dict:
+        return {
+            'poses': len(self.plan),
+            'strategy': self.plan.strategy,
+            'estimated': self.estimated,
+            'actual': self.actual,
+            'steps': [{'angle': pose.angle, 'elevation': pose.elevation, 'estimated': estimated, 'actual': actual}
+                      for pose, estimated, actual in self.steps],
+        }
+
+    def __str__(self):
+        error = '' if self.error is None else f' ({self.error * 100:+.0f}%)'
+        return f'Scanned {len(self.steps)} poses in {self.actual:.1f}s, estimated {self.estimated:.1f}s{error}'
+
+
+async def run_plan_async(plan: ScanPlan, platform: Platform, camera_bar, capture: Optional[Callable[[ScanPose], object]] = None,
+                         predictive: bool = True, profiled: bool = False) -> ScanReport:
+    """
+        Move through the poses of the plan and call capture at each one, both axes move at the same time.
+        With profiled set the camera bar ramps its power with its motion profile.
+        The camera bar is assumed to be at the start elevation of the plan, usually just homed.
+        Platform angles are absolute, so the platform should be zeroed at angle 0 of the plan.
+    """
+    report = ScanReport(plan)
+    planner = plan.planner
+    current = plan.start
+    bar_tacho = round(camera_bar.elevation_tacho(current.elevation))
+
+    for pose in plan:
+        started = time.monotonic()
+        moves = []
+        if planner.platform.delta(current.angle, pose.angle):
+            moves.append(platform.goto_angle_async(pose.angle))
+        target = round(camera_bar.elevation_tacho(pose.elevation))
+        if target != bar_tacho:
+            # Away from the stop is the up direction of the bar.
+            power = camera_bar.power if target > bar_tacho else -camera_bar.power
+            moves.append(camera_bar.motors.turn_async(power, abs(target - bar_tacho), predictive=predictive, synchronized=True,
+                                                      profile=camera_bar.profile if profiled else None))
+            bar_tacho = target
+        await asyncio.gather(*moves)
+        if capture is not None:
+            result = await run_blocking(capture, pose)
+            if inspect.isawaitable(result):
+                await result
+        report.add(pose, planner.transition(current, pose), time.monotonic() - started)
+        current = pose
+
+    logger.info(str(report))
+    return report
+
+
+def run_plan(plan: ScanPlan, platform: Platform, camera_bar, capture: Optional[Callable[[ScanPose], object]] = None,
+             predictive: bool = True, profiled: bool = False) -> ScanReport:
+    """ Blocking version of run_plan_async. """
+    return run_sync(run_plan_async(plan, platform, camera_bar, capture, predictive, profiled))
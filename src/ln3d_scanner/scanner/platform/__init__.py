@@ -1,2 +1 @@
-from .platform import Platform
-
+from .platform import Platform, PlatformStep
@@ -1,15 +1,131 @@
+import logging
+
+from typing import List, NamedTuple, Optional
+
 import nxt.motor as Motor
 from nxt.brick import Brick
 
-from ln3d_scanner.timer import LN3DTimer
+from ln3d_scanner.timer import LN3DTimer, run_blocking, run_sync
+from ln3d_scanner.nxt.motors import PrecisionMotor, InvertedMotor
+
+
+logger = logging.getLogger(__name__)
+
+
+class PlatformStep(NamedTuple):
+    target: float  # Requested angle in degrees, not wrapped so multiple revolutions keep counting.
+    achieved: float  # Measured angle in degrees after the move settled.
+    error: float  # Achieved minus target in degrees.
+    tacho_error: int  # Achieved minus target in tacho units.
 
 
 class Platform(LN3DTimer):
+    """
+        Rotating platform as an absolute position indexer.
+        Targets are absolute tacho positions (rotation count since zero) computed from the gear ratio,
+        so the landing error of a move is made up by the next one instead of adding up over a rotation.
+        The average overshoot of past moves is subtracted from the next move as well.
+    """
 
-    def __init__(self, brick: Brick, motor_port: Motor.Port, frequency = 30):
+    def __init__(self, brick: Brick, motor_port: Motor.Port, frequency = 30, gear_ratio: float = 1, power: int = 100,
+                 inverted: bool = True, tolerance: int = 2, settle: float = 0.05, predictive: bool = True, corrections: int = 1,
+                 correction_power: int = 25):
         super().__init__(frequency)
         self.brick = brick
-        self.motor = brick.get_motor(motor_port)
-    
-    
-    
+        self.motor = InvertedMotor(brick, motor_port) if inverted else PrecisionMotor(brick, motor_port)
+        self.gear_ratio = gear_ratio  # Motor degrees per platform degree.
+        self.power = abs(power)
+        self.tolerance = tolerance  # Tacho units of error that aren't corrected.
+        self.settle = settle  # Seconds to let the motor stop before measuring where it landed.
+        self.predictive = predictive
+        self.corrections = corrections  # Slow moves allowed after landing outside the tolerance.
+        self.correction_power = abs(correction_power)
+        self.steps: List[PlatformStep] = []
+        self._target = 0.0  # Unwrapped target angle of the last move.
+        self._overshoot = 0.0  # Average tacho units a move ends beyond its target, negative when short.
+
+    def zero(self):
+        """ Make the current position angle 0. """
+        self.motor.reset_position(False)
+        self._target = 0.0
+        self.steps.clear()
+
+    def _tacho(self) -> int:
+        return self.motor.get_tacho().rotation_count
+
+    @property
+    def angle(self) -> float:
+        """ Measured platform angle in degrees, not wrapped. """
+        return self._tacho() / self.gear_ratio
+
+    @property
+    def target(self) -> float:
+        return self._target
+
+    @property
+    def last_error(self) -> Optional[float]:
+        """ Angle error of the last move in degrees. """
+        return self.steps[-1].error if self.steps else None
+
+    async def _move_to_async(self, target: float) -> PlatformStep:
+        """ Move to an unwrapped target angle. """
+        self._target = target
+        target_tacho = round(target * self.gear_ratio)
+        landed = await run_blocking(self._tacho)
+        distance = target_tacho - landed
+        direction = 1 if distance > 0 else -1
+        # Stop short by the overshoot of previous moves, moves shorter than that are left to the corrections.
+        tacho_units = abs(distance) - round(self._overshoot)
+        if abs(distance) > self.tolerance and tacho_units > 0:
+            await self.motor.turn_async(direction * self.power, tacho_units, predictive=self.predictive)
+            await self.wait_async(self.settle)
+            landed = await run_blocking(self._tacho)
+            overshoot = direction * (landed - target_tacho)
+            self._overshoot = 0.7 * self._overshoot + 0.3 * (overshoot + round(self._overshoot))
+        for _ in range(self.corrections):
+            error = target_tacho - landed
+            if abs(error) <= self.tolerance:
+                break
+            landed = await self._correct_async(error)
+        tacho_error = landed - target_tacho
+        step = PlatformStep(target, landed / self.gear_ratio, tacho_error / self.gear_ratio, tacho_error)
+        self.steps.append(step)
+        logger.debug(f'Platform at {step.achieved:.2f} degrees, error {step.error:+.2f}.')
+        return step
+
+    async def _correct_async(self, error: int) -> int:
+        """ Slow move the brick stops itself, returns where the motor came to rest. """
+        before = await run_blocking(self._tacho)
+        await run_blocking(self.motor.run_limited, (1 if error > 0 else -1) * self.correction_power, abs(error))
+        landed = before
+        start = self.now()
+        while self.now() - start < self.settle + abs(error) / 50:  # Give up long after a 50 tacho per second move.
+            await self.wait_async()
+            tacho = await run_blocking(self._tacho)
+            # Stopped once it moved, or when it didn't start within the settle time.
+            if tacho == landed and (tacho != before or self.now() - start > self.settle):
+                break
+            landed = tacho
+        return landed
+
+    async def goto_angle_async(self, angle: float, direction: int = 0) -> PlatformStep:
+        """
+            Move to an angle in degrees (0 - 360). The shortest way round is taken unless direction is 1 or -1.
+            Returns the achieved angle and its error.
+        """
+        delta = (angle - self._target) % 360
+        if direction < 0 or (direction == 0 and delta > 180):
+            delta -= 360
+        return await self._move_to_async(self._target + delta)
+
+    async def step_async(self, degrees: float) -> PlatformStep:
+        """ Move degrees from the previous target, not from where the platform landed, so errors don't add up. """
+        return await self._move_to_async(self._target + degrees)
+
+    def goto_angle(self, angle: float, direction: int = 0) -> PlatformStep:
+        """ Blocking version of goto_angle_async. """
+        return run_sync(self.goto_angle_async(angle, direction))
+
+    def step(self, degrees: float) -> PlatformStep:
+        """ Blocking version of step_async. """
+        return run_sync(self.step_async(degrees))
@@ -0,0 +1 @@
+from .scan_session import ScanSession, FrameRecord, open_session
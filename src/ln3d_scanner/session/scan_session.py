@@ -0,0 +1,307 @@
+import io
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from ln3d_scanner.scanner.capture import Frame
+from ln3d_scanner.scanner.planner import ScanPose
+from ln3d_scanner.telemetry import TelemetryRecorder, read_telemetry
+
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'LN3DSES1'
+END_MAGIC = b'LN3DEND\0'
+ALIGNMENT = 64  # Chunks start aligned so frame pixels can be mapped as arrays.
+
+# Every chunk starts with its kind and payload length.
+CHUNK_HEADER = struct.Struct('<4s4xQ')
+# Frame chunks start with the record, the pixels follow 64 bytes into the chunk.
+FRAME_RECORD = struct.Struct('<I4xdddIIB7s')
+# Index chunk entry: frame number, chunk offset, angle and elevation.
+INDEX_ENTRY = struct.Struct('<IQdd')
+TRAILER = struct.Struct('<8sQ')  # End magic and offset of the index chunk.
+
+META, FRAME, TELEMETRY, INDEX = b'META', b'FRAM', b'TELE', b'INDX'
+
+
+class FrameRecord(NamedTuple):
+    index: int  # Frame number in capture order.
+    offset: int  # Chunk offset in the file.
+    pose: ScanPose
+
+
+def _pose_key(angle: float, elevation: float) -> Tuple[float, float]:
+    return round(angle % 360, 6), round(elevation, 6)
+
+
+def _padding(size: int) -> int:
+    return -size % ALIGNMENT
+
+
+class ScanSession:
+    """
+        Append only scan file: a chunk per frame, metadata update or telemetry dump, aligned so the frame pixels can be
+        memory mapped. An index of the frames and their poses is kept in memory for O(1) lookup by frame number or pose and
+        written as the last chunk on close. A file without index (an interrupted scan) is recovered by walking the chunks,
+        a partly written chunk is cut off, and appending continues after the last complete frame.
+        Modes: 'r' read, 'w' create or overwrite, 'a' append to an existing session or create it.
+    """
+
+    def __init__(self, path: str, mode: str = 'r'):
+        if mode not in ('r', 'w', 'a'):
+            raise ValueError(f'Unknown mode {mode}, use r, w or a.')
+        self.path = path
+        self.mode = mode
+        self.metadata: dict = {}
+        self.records: List[FrameRecord] = []
+        self._by_index: Dict[int, FrameRecord] = {}
+        self._by_pose: Dict[Tuple[float, float], FrameRecord] = {}
+        self._telemetry: List[int] = []  # Offsets of the telemetry chunks.
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+        self._end = 0  # Where the next chunk is written.
+        self._lock = threading.Lock()
+        self.recovered = False  # True when the index was rebuilt from an interrupted scan.
+
+    def open(self) -> 'ScanSession':
+        exists = os.path.exists(self.path) and os.path.getsize(self.path) > 0
+        if self.mode == 'w' or (self.mode == 'a' and not exists):
+            self._file = open(self.path, 'w+b')
+            self._file.write(MAGIC + bytes(_padding(len(MAGIC))))
+            self._end = self._file.tell()
+            return self
+        self._file = open(self.path, 'rb' if self.mode == 'r' else 'r+b')
+        if self._file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f'{self.path} is not a scan session.')
+        if not self._read_index():
+            self._recover()
+        if self.mode == 'a':
+            # The index is written again on close, appending starts where it was.
+            self._file.truncate(self._end)
+        return self
+
+    def __enter__(self) -> 'ScanSession':
+        return self.open()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self._file is None:
+            return
+        if self.mode != 'r':
+            self._write_index()
+        self._unmap()
+        self._file.close()
+        self._file = None
+
+    # Reading the chunk structure.
+
+    def _read_at(self, offset: int, size: int) -> bytes:
+        self._file.seek(offset)
+        return self._file.read(size)
+
+    def _read_index(self) -> bool:
+        """ Load the index written on close, False when there is none. """
+        size = os.fstat(self._file.fileno()).st_size
+        if size < TRAILER.size + ALIGNMENT:
+            return False
+        magic, offset = TRAILER.unpack(self._read_at(size - TRAILER.size, TRAILER.size))
+        if magic != END_MAGIC:
+            return False
+        kind, length = CHUNK_HEADER.unpack(self._read_at(offset, CHUNK_HEADER.size))
+        if kind != INDEX:
+            return False
+        payload = self._read_at(offset + CHUNK_HEADER.size, length)
+        metadata_length, = struct.unpack_from('<Q', payload)
+        self.metadata = json.loads(payload[8:8 + metadata_length].decode('utf-8'))
+        position = 8 + metadata_length
+        count, telemetry_count = struct.unpack_from('<QQ', payload, position)
+        position += 16
+        for _ in range(count):
+            index, chunk, angle, elevation = INDEX_ENTRY.unpack_from(payload, position)
+            self._add_record(FrameRecord(index, chunk, ScanPose(angle, elevation)))
+            position += INDEX_ENTRY.size
+        self._telemetry = list(struct.unpack_from(f'<{telemetry_count}Q', payload, position))
+        self._end = offset
+        return True
+
+    def _recover(self):
+        """ Rebuild the index by walking the chunks, stopping at the first incomplete one. """
+        size = os.fstat(self._file.fileno()).st_size
+        offset = ALIGNMENT
+        while offset + CHUNK_HEADER.size <= size:
+            kind, length = CHUNK_HEADER.unpack(self._read_at(offset, CHUNK_HEADER.size))
+            end = offset + CHUNK_HEADER.size + length
+            if kind not in (META, FRAME, TELEMETRY, INDEX) or end > size:
+                break
+            if kind == META:
+                self.metadata.update(json.loads(self._read_at(offset + CHUNK_HEADER.size, length).decode('utf-8')))
+            elif kind == FRAME:
+                index, angle, elevation, *_ = FRAME_RECORD.unpack(self._read_at(offset + CHUNK_HEADER.size, FRAME_RECORD.size))
+                self._add_record(FrameRecord(index, offset, ScanPose(angle, elevation)))
+            elif kind == TELEMETRY:
+                self._telemetry.append(offset)
+            offset = end + _padding(end)
+        self._end = offset
+        self.recovered = True
+        logger.info(f'Recovered {len(self.records)} frames from {self.path}, {size - offset} bytes of an incomplete chunk dropped.')
+
+    def _add_record(self, record: FrameRecord):
+        self.records.append(record)
+        self._by_index[record.index] = record
+        self._by_pose[_pose_key(record.pose.angle, record.pose.elevation)] = record
+
+    # Writing.
+
+    def _append_chunk(self, kind: bytes, *parts: bytes) -> int:
+        """ Write a chunk at the end and return its offset. Called with the lock held. """
+        if self.mode == 'r':
+            raise IOError(f'{self.path} is opened read only.')
+        length = sum(len(part) for part in parts)
+        offset = self._end
+        self._file.seek(offset)
+        self._file.write(CHUNK_HEADER.pack(kind, length))
+        for part in parts:
+            self._file.write(part)
+        end = offset + CHUNK_HEADER.size + length
+        self._file.write(bytes(_padding(end)))
+        self._file.flush()  # A crash loses at most the chunk being written.
+        self._end = end + _padding(end)
+        return offset
+
+    def append_frame(self, frame: Frame, index: Optional[int] = None) -> int:
+        """ Append a frame with its pose, returns its frame number. Thread safe, frames may arrive out of order. """
+        angle, elevation = getattr(frame.pose, 'angle', 0.0), getattr(frame.pose, 'elevation', 0.0)
+        encoding = (frame.encoding or '').encode('ascii')
+        with self._lock:
+            index = len(self.records) if index is None else index
+            record = FRAME_RECORD.pack(index, angle, elevation, frame.timestamp, frame.width, frame.height, frame.channels, encoding)
+            offset = self._append_chunk(FRAME, record, bytes(ALIGNMENT - CHUNK_HEADER.size - FRAME_RECORD.size), frame.pixels)
+            self._add_record(FrameRecord(index, offset, ScanPose(angle, elevation)))
+        return index
+
+    def update_metadata(self, **values):
+        """ Store settings or calibration values, later updates of a key replace earlier ones. """
+        with self._lock:
+            self._append_chunk(META, json.dumps(values).encode('utf-8'))
+            self.metadata.update(values)
+
+    def set_calibration(self, camera_bar, platform=None):
+        """ Store the camera bar calibration (stop offset, up direction, gearing) and platform gearing. """
+        values = {
+            'camera_stop_offset': camera_bar._camera_stop_offset,
+            'up_direction': camera_bar._up_direction,
+            'bar_gear_ratio': camera_bar._gear_ratio,
+        }
+        if platform is not None:
+            values['platform_gear_ratio'] = platform.gear_ratio
+        self.update_metadata(calibration=values)
+
+    def restore_calibration(self, camera_bar, platform=None):
+        """
+            Apply a stored calibration to the camera bar, so a resumed scan doesn't have to calibrate again.
+            Raises ValueError when the bar or platform is geared differently than when the calibration was stored.
+        """
+        values = self.metadata.get('calibration')
+        if values is None:
+            raise KeyError(f'{self.path} has no calibration.')
+        if values['bar_gear_ratio'] != camera_bar._gear_ratio:
+            raise ValueError(f'Calibration of {self.path} is for a camera bar gear ratio of {values["bar_gear_ratio"]}, '
+                             f'not {camera_bar._gear_ratio}.')
+        if platform is not None and values.get('platform_gear_ratio', platform.gear_ratio) != platform.gear_ratio:
+            raise ValueError(f'Calibration of {self.path} is for a platform gear ratio of {values["platform_gear_ratio"]}, '
+                             f'not {platform.gear_ratio}.')
+        camera_bar._camera_stop_offset = values['camera_stop_offset']
+        camera_bar._up_direction = values['up_direction']
+
+    def append_telemetry(self, recorder: TelemetryRecorder):
+        buffer = io.BytesIO()
+        recorder.write(buffer)
+        with self._lock:
+            self._telemetry.append(self._append_chunk(TELEMETRY, buffer.getvalue()))
+
+    def _write_index(self):
+        with self._lock:
+            metadata = json.dumps(self.metadata).encode('utf-8')
+            entries = b''.join(INDEX_ENTRY.pack(record.index, record.offset, record.pose.angle, record.pose.elevation)
+                               for record in self.records)
+            telemetry = struct.pack(f'<{len(self._telemetry)}Q', *self._telemetry)
+            end = self._end
+            offset = self._append_chunk(INDEX, struct.pack('<Q', len(metadata)), metadata,
+                                        struct.pack('<QQ', len(self.records), len(self._telemetry)), entries, telemetry)
+            self._file.write(TRAILER.pack(END_MAGIC, offset))
+            self._file.truncate()
+            self._end = end  # Appending again overwrites the index.
+
+    # Random access.
+
+    def _mapped(self) -> mmap.mmap:
+        """ Map the file for reading, mapped again when it grew. """
+        size = os.fstat(self._file.fileno()).st_size
+        if self._map is None or len(self._map) < size:
+            self._unmap()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def _unmap(self):
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                pass  # Frames still reference the pixels, the map is closed once they are gone.
+            self._map = None
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def poses(self) -> List[ScanPose]:
+        return [record.pose for record in self.records]
+
+    def completed(self) -> Set[ScanPose]:
+        """ Poses with a frame, pass them to ScanPlan.resume to continue an interrupted scan. """
+        return {record.pose for record in self.records}
+
+    def has_pose(self, pose: ScanPose) -> bool:
+        return _pose_key(pose.angle, pose.elevation) in self._by_pose
+
+    def _frame_at(self, record: FrameRecord) -> Frame:
+        data = self._mapped()
+        index, angle, elevation, timestamp, width, height, channels, encoding = FRAME_RECORD.unpack_from(
+            data, record.offset + CHUNK_HEADER.size)
+        _, length = CHUNK_HEADER.unpack_from(data, record.offset)
+        start = record.offset + ALIGNMENT
+        pixels = memoryview(data)[start:record.offset + CHUNK_HEADER.size + length]
+        encoding = encoding.rstrip(b'\0').decode('ascii') or None
+        return Frame(ScanPose(angle, elevation), timestamp, width, height, channels, pixels, encoding)
+
+    def frame(self, index: int) -> Frame:
+        """ Frame by number. Pixels are a view into the mapped file, nothing is copied. """
+        return self._frame_at(self._by_index[index])
+
+    def frame_at(self, pose: ScanPose) -> Frame:
+        """ Last frame captured at a pose. """
+        return self._frame_at(self._by_pose[_pose_key(pose.angle, pose.elevation)])
+
+    def frames(self) -> Iterator[Frame]:
+        for record in sorted(self.records, key=lambda record: record.index):
+            yield self._frame_at(record)
+
+    def telemetry(self) -> List[dict]:
+        """ Columns of every stored telemetry dump. """
+        dumps = []
+        for offset in self._telemetry:
+            _, length = CHUNK_HEADER.unpack(self._read_at(offset, CHUNK_HEADER.size))
+            dumps.append(read_telemetry(io.BytesIO(self._read_at(offset + CHUNK_HEADER.size, length)), self.path))
+        return dumps
+
+
+def open_session(path: str, mode: str = 'r') -> ScanSession:
+    return ScanSession(path, mode).open()
+
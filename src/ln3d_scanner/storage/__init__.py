@@ -0,0 +1 @@
+from .json_store import JsonStore, DATA_DIRECTORY, data_path
@@ -0,0 +1,66 @@
+import json
+import logging
+import os
+
+from typing import Dict
+
+
+logger = logging.getLogger(__name__)
+
+DATA_DIRECTORY = os.path.join(os.path.expanduser('~'), '.ln3d_scanner')
+
+
+def data_path(filename: str) -> str:
+    """ Path of a file in the per user data directory. """
+    return os.path.join(DATA_DIRECTORY, filename)
+
+
+class JsonStore:
+    """
+        Json file of entries keyed by a string. Subclasses set the entry type, anything with to_dict and a
+        from_dict classmethod, and the name used in warnings. Unreadable files and entries are treated as missing.
+    """
+
+    entry_type: type = None  # Set by subclasses.
+    description = 'json'
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _read(self) -> Dict[str, dict]:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.warning('Ignoring corrupt %s file %s', self.description, self.path)
+            return {}
+
+    def get_entry(self, key: str):
+        values = self._read().get(key)
+        if values is None:
+            return None
+        try:
+            return self.entry_type.from_dict(values)
+        except (KeyError, TypeError, ValueError):
+            logger.warning('Ignoring corrupt %s %s in %s', self.description, key, self.path)
+            return None
+
+    def save_entries(self, entries: Dict[str, object]):
+        """ Store entries, replacing the ones with the same key. """
+        stored = self._read()
+        stored.update((key, entry.to_dict()) for key, entry in entries.items())
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'w') as f:
+            json.dump(stored, f, indent=2)
+
+    def save_entry(self, key: str, entry):
+        self.save_entries({key: entry})
+
+    def clear(self):
+        """ Remove the file with all entries. """
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
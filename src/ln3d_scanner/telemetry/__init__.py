@@ -0,0 +1 @@
+from .telemetry_recorder import TelemetryRecorder, load_telemetry, read_telemetry, get_recorder, set_recorder, recording
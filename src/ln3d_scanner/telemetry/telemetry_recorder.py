@@ -0,0 +1,143 @@
+import contextlib
+import struct
+import sys
+
+from array import array
+from typing import Dict, Iterator, Optional
+
+
+MAGIC = b'LN3DTEL1'
+
+# Column name -> array typecode. Every column is preallocated, recording only writes into existing slots.
+COLUMNS = (
+    ('timestamp', 'd'),  # Monotonic seconds the tacho was sampled.
+    ('move', 'I'),  # Move number, increments with start_move.
+    ('port', 'B'),  # Motor port.
+    ('tacho_count', 'i'),
+    ('block_tacho_count', 'i'),
+    ('power', 'b'),
+    ('latency', 'f'),  # Round trip of the tacho request in seconds, nan when unknown.
+)
+
+_BYTESWAP = sys.byteorder != 'little'  # Files are little endian.
+
+_active = None  # Recorder used by motors and the camera bar, if any.
+
+
+class TelemetryRecorder:
+    """
+        Fixed size ring buffer of motor samples. When full the oldest samples are overwritten.
+        Samples are stored column wise in preallocated arrays so recording doesn't allocate per sample.
+    """
+
+    def __init__(self, capacity: int = 65536):
+        self.capacity = capacity
+        self.columns: Dict[str, array] = {name: array(typecode, bytes(array(typecode).itemsize * capacity)) for name, typecode in COLUMNS}
+        self.count = 0  # Samples recorded in total, including overwritten ones.
+        self.moves = 0
+        self._timestamp = self.columns['timestamp']
+        self._move = self.columns['move']
+        self._port = self.columns['port']
+        self._tacho_count = self.columns['tacho_count']
+        self._block_tacho_count = self.columns['block_tacho_count']
+        self._power = self.columns['power']
+        self._latency = self.columns['latency']
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def start_move(self) -> int:
+        """ Start a new move, following samples are tagged with its number. """
+        self.moves += 1
+        return self.moves
+
+    def record(self, timestamp: float, port: int, tacho_count: int, block_tacho_count: Optional[int], power: int,
+               latency: Optional[float]):
+        index = self.count % self.capacity
+        self._timestamp[index] = timestamp
+        self._move[index] = self.moves
+        self._port[index] = port
+        self._tacho_count[index] = tacho_count
+        self._block_tacho_count[index] = block_tacho_count or 0
+        self._power[index] = power
+        self._latency[index] = float('nan') if latency is None else latency
+        self.count += 1
+
+    def clear(self):
+        self.count = 0
+        self.moves = 0
+
+    def ordered(self) -> Dict[str, array]:
+        """ Return copies of the recorded columns, oldest sample first. """
+        if self.count <= self.capacity:
+            return {name: column[:self.count] for name, column in self.columns.items()}
+        start = self.count % self.capacity
+        return {name: column[start:] + column[:start] for name, column in self.columns.items()}
+
+    def save(self, path: str):
+        """ Write the samples to a compact binary file: magic, sample count, then each column as raw little endian values. """
+        with open(path, 'wb') as f:
+            self.write(f)
+
+    def write(self, f):
+        """ Write the samples in the save format to an open binary file. """
+        columns = self.ordered()
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(self)))
+        for name, _ in COLUMNS:
+            column = columns[name]
+            if _BYTESWAP:
+                column.byteswap()
+            column.tofile(f)
+
+    def save_npz(self, path: str):
+        """ Write the samples as compressed numpy arrays. Requires numpy. """
+        try:
+            import numpy
+        except ImportError as e:
+            raise ImportError('numpy is required for npz export, use save for the binary format.') from e
+        columns = self.ordered()
+        numpy.savez_compressed(path, **{name: numpy.frombuffer(columns[name], dtype=typecode) for name, typecode in COLUMNS})
+
+
+def load_telemetry(path: str) -> Dict[str, array]:
+    """ Read a file written by TelemetryRecorder.save. """
+    with open(path, 'rb') as f:
+        return read_telemetry(f, path)
+
+
+def read_telemetry(f, source: str = 'file') -> Dict[str, array]:
+    """ Read samples written by TelemetryRecorder.write from an open binary file. """
+    if f.read(len(MAGIC)) != MAGIC:
+        raise ValueError(f'{source} is not a telemetry file.')
+    count, = struct.unpack('<Q', f.read(8))
+    columns = {}
+    for name, typecode in COLUMNS:
+        column = array(typecode)
+        column.fromfile(f, count)
+        if _BYTESWAP:
+            column.byteswap()
+        columns[name] = column
+    return columns
+
+
+def get_recorder() -> Optional[TelemetryRecorder]:
+    """ Return the active recorder, None when not recording. """
+    return _active
+
+
+def set_recorder(recorder: Optional[TelemetryRecorder]):
+    global _active
+    _active = recorder
+
+
+@contextlib.contextmanager
+def recording(recorder: Optional[TelemetryRecorder] = None) -> Iterator[TelemetryRecorder]:
+    """ Record motor telemetry within the block. """
+    recorder = TelemetryRecorder() if recorder is None else recorder
+    previous = get_recorder()
+    set_recorder(recorder)
+    try:
+        yield recorder
+    finally:
+        set_recorder(previous)
@@ -1 +1 @@
-from .ln3d_timer import LN3DTimer
+from .ln3d_timer import LN3DTimer, LoopStats, run_blocking, run_sync
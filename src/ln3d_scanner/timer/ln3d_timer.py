@@ -1,15 +1,90 @@
+import asyncio
+import concurrent.futures
+import functools
 import time
 
 from typing import Optional
 
 
+def run_sync(coroutine):
+    """
+        Run a coroutine to completion from blocking code, the sync methods wrap their _async variants with it.
+        Called while an event loop runs in this thread (a notebook, a gui or asyncio host, a coroutine), it runs the
+        coroutine on a private loop in a worker thread and blocks that event loop till it is done.
+        Await the _async variant there instead, so other coroutines keep running.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix='run-sync') as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+async def run_blocking(func, *args, **kwargs):
+    """ Run a blocking call (brick I/O) in a thread so other coroutines keep running. """
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args, **kwargs))
+
+
+class LoopStats:
+    """ Requested vs achieved period of deadline scheduled loops. """
+
+    def __init__(self):
+        self.loops = 0
+        self.requested = 0.0  # Sum of requested periods.
+        self.achieved = 0.0  # Sum of periods between wake ups.
+        self.busy = 0.0  # Sum of time spent in the loop body (I/O) before waiting.
+        self.late = 0  # Loops where the body took longer than the requested period.
+
+    def record(self, requested: float, achieved: float, busy: float):
+        self.loops += 1
+        self.requested += requested
+        self.achieved += achieved
+        self.busy += busy
+        if busy > requested:
+            self.late += 1
+
+    @property
+    def requested_rate(self) -> Optional[float]:
+        return self.loops / self.requested if self.requested else None
+
+    @property
+    def achieved_rate(self) -> Optional[float]:
+        return self.loops / self.achieved if self.achieved else None
+
+    def reset(self):
+        self.__init__()
+
+    def to_dict(self) -> dict:
+        return {
+            'loops': self.loops,
+            'requested_rate': self.requested_rate,
+            'achieved_rate': self.achieved_rate,
+            'busy': self.busy,
+            'late': self.late,
+        }
+
+    def __str__(self):
+        if not self.loops:
+            return 'No loops recorded.'
+        return (f"{self.loops} loops, requested {self.requested_rate:.1f}Hz achieved {self.achieved_rate:.1f}Hz, "
+                f"{self.late} late, {self.busy / self.achieved * 100:.0f}% busy")
+
+
 class LN3DTimer:
     """
         Mixing type class.
+        Loops can be deadline scheduled: call start_loop once and wait_next each iteration.
+        The next wake up is measured from the previous one, so time spent in I/O is subtracted from the sleep.
     """
 
+    min_interval = 0.005  # Shortest sleep between polls in seconds, right before the target.
+    max_interval = 0.1  # Longest sleep between polls in seconds, far from the target.
+
     def __init__(self, frequency: int = 30):
         self.frequency = frequency
+        self.loop_stats = LoopStats()
+        self._wake_time = None
 
     def wait(self, duration: Optional[int] = None):
         """ 
@@ -21,6 +96,52 @@ class LN3DTimer:
             duration = 1 / self.frequency
         time.sleep(duration)
 
-    def now(self) -> int:
-        """ Return time in nano seconds. """
-        return time.time()
\ No newline at end of file
+    async def wait_async(self, duration: Optional[int] = None):
+        """ Same as wait but lets other coroutines run. """
+        if duration is None:
+            duration = 1 / self.frequency
+        await asyncio.sleep(duration)
+
+    def next_interval(self, time_to_target: Optional[float] = None, latency: Optional[float] = None) -> float:
+        """
+            Period till the next poll.
+            Half the estimated time to target minus the latency of the next request, so polls get denser near the target.
+            Bound by min_interval and max_interval, 1 over frequency when there is no estimate.
+        """
+        if time_to_target is None:
+            return 1 / self.frequency
+        return max(self.min_interval, min(self.max_interval, (time_to_target - (latency or 0)) / 2))
+
+    def start_loop(self):
+        """ Mark the start of a deadline scheduled loop. """
+        self._wake_time = self.now()
+
+    def _next_deadline(self, interval: Optional[float]) -> tuple:
+        """ Return the requested interval and sleep duration, the time spent since the last wake up is subtracted. """
+        if interval is None:
+            interval = 1 / self.frequency
+        if self._wake_time is None:
+            self.start_loop()
+        return interval, max(0, self._wake_time + interval - self.now())
+
+    def _woke(self, interval: float, sleep: float):
+        now = self.now()
+        achieved = now - self._wake_time
+        self.loop_stats.record(interval, achieved, achieved - sleep)
+        self._wake_time = now
+
+    def wait_next(self, interval: Optional[float] = None):
+        """ Sleep till interval seconds after the previous wake up. """
+        interval, sleep = self._next_deadline(interval)
+        time.sleep(sleep)
+        self._woke(interval, sleep)
+
+    async def wait_next_async(self, interval: Optional[float] = None):
+        """ Same as wait_next but lets other coroutines run. """
+        interval, sleep = self._next_deadline(interval)
+        await asyncio.sleep(sleep)
+        self._woke(interval, sleep)
+
+    def now(self) -> float:
+        """ Return monotonic time in seconds. """
+        return time.monotonic()
\ No newline at end of file
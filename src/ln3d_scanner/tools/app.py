@@ -1,44 +1,128 @@
-import libusb_package
-import time
-import logging
+"""
+    Homes the camera bar and zeroes the platform.
 
+    Usage:
+        python -m ln3d_scanner.tools.app [--record session.rec | --replay session.rec] [--profile-startup]
 
-from typing import List, Optional, Tuple
-
-import nxt.locator
-import nxt.motor as Motor
-import nxt.sensor as Sensor
-from nxt.sensor.generic import Touch
+    The brick is looked up at the backend and address of the last successful connection first, only when it isn't
+    there every backend is searched. The motor and sensor stack, the usb and bluetooth backends and the simulator are
+    imported when they are used. With --profile-startup the seconds spent in import, discovery and connect are written
+    as json and the app stops before any motor moves.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import sys
+import time
 
-from ln3d_scanner.nxt.motors import PrecisionMotor, InvertedMotor, DualMotors
-from ln3d_scanner.nxt.sensors import Switch
-from ln3d_scanner.scanner.camera import CameraBar
+from typing import Dict, Iterator, Optional
 
 
-logging.basicConfig()
-logging.getLogger().setLevel(logging.INFO)
+_STARTED = time.perf_counter()
 
+logger = logging.getLogger(__name__)
 
-if __name__ == '__main__':
 
-    libusb_package.get_libusb1_backend()
+class StartupProfile:
+    """ Seconds spent per startup phase, a phase can be entered more than once. """
 
-    with nxt.locator.find() as brick:
+    def __init__(self):
+        self.phases: Dict[str, float] = {'import': time.perf_counter() - _STARTED}
 
-        # Once found, print its name.
-        print("Found brick:", brick.get_device_info()[0])
-        # And play a recognizable note.
-        print('volt', brick.get_battery_level())
-        
-        platform = InvertedMotor(brick, Motor.Port.A)
-        platform.reset_position(False)
-
-        camera_bar = CameraBar(brick, Motor.Port.B, Motor.Port.C, Sensor.Port.S1)
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
         try:
-            # camera_bar.home()
-            camera_bar.calibrate_camera_offset()
+            yield
         finally:
-            camera_bar.motors.stop()
-            time.sleep(1)
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def to_dict(self) -> dict:
+        return {**self.phases, 'total': time.perf_counter() - _STARTED}
+
+
+def connect(replay: Optional[str] = None, strict: bool = False, cache: bool = True):
+    """ Find the brick, or answer from a recorded session when replay is set. """
+    if replay is not None:
+        from ln3d_scanner.nxt.simulator import ReplaySock
+        return ReplaySock(replay, strict=strict).connect()
+    from ln3d_scanner.nxt.link import find_brick
+    return find_brick(cache=cache)
+
+
+def run(brick):
+    """ Zero the platform and bring the camera bar to its saved or homed position. """
+    import nxt.motor as Motor
+    import nxt.sensor as Sensor
+
+    from ln3d_scanner.nxt.link import load_link_profile
+    from ln3d_scanner.nxt.motors import load_motor_models
+    from ln3d_scanner.scanner.camera import CameraBar
+    from ln3d_scanner.scanner.platform import Platform
 
+    # And play a recognizable note.
+    print('volt', brick.get_battery_level())
+    # Use the measured link latency for thresholds and poll rates.
+    print(load_link_profile(brick, touch_port=Sensor.Port.S1))
+
+    platform = Platform(brick, Motor.Port.A)
+    platform.zero()
+    # Identified once with test moves, the platform can turn freely.
+    load_motor_models(platform.motor)
+
+    camera_bar = CameraBar(brick, Motor.Port.B, Motor.Port.C, Sensor.Port.S1)
+    # Test moves could run the bar into its stop, only stored models are used.
+    load_motor_models(camera_bar.motors, identify=False)
+    try:
+        # Verifies the saved bar position with one touch, homes when there is none.
+        camera_bar.startup()
+        # camera_bar.calibrate_camera_offset()
+    finally:
+        camera_bar.motors.stop()
+        camera_bar.save_state()
         time.sleep(1)
+    logger.info('Brick scheduler stats: %s', brick.stats.to_dict())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Home the camera bar and zero the platform.')
+    parser.add_argument('--record', help='Write every brick telegram with its timestamp to this file.')
+    parser.add_argument('--replay', help='Answer from a recorded session instead of the brick.')
+    parser.add_argument('--strict', action='store_true', help='Fail when the replay sends other requests than the recorded session.')
+    parser.add_argument('--search', action='store_true', help='Search every backend instead of trying the last brick first.')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='Write the seconds spent in import, discovery and connect as json and stop before moving.')
+    args = parser.parse_args(argv)
+
+    profile = StartupProfile()
+    with profile.phase('import'):
+        from ln3d_scanner.nxt.link import BrickScheduler, recorded
+    with profile.phase('discovery'):
+        connection = connect(args.replay, args.strict, cache=not args.search)
+
+    # The scheduler owns the connection, all motors and sensors share it.
+    with connection, recorded(connection, args.record), BrickScheduler(connection) as brick:
+        with profile.phase('connect'):
+            # Connected once the brick answered its first command.
+            name = brick.get_device_info()[0]
+
+        if args.profile_startup:
+            with profile.phase('import'):
+                # What run imports before the first motor command.
+                import ln3d_scanner.scanner.camera
+                import ln3d_scanner.scanner.platform
+            json.dump({'startup': profile.to_dict(), 'backend': connection._sock.type}, sys.stdout, indent=2)
+            return
+
+        # Once found, print its name.
+        print("Found brick:", name)
+        run(brick)
+        if args.replay is not None:
+            logger.info('Replay: %s', connection._sock.to_dict())
+
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    logging.getLogger().setLevel(logging.INFO)
+    main()
@@ -0,0 +1,197 @@
+"""
+    Motion benchmarks against the simulated brick.
+
+    Usage:
+        python -m ln3d_scanner.tools.benchmark --output bench.json
+
+    Every scenario turns the motors once per repeat for each transport and reports time to target, overshoot in tacho units,
+    brick round trips (pipelined requests count once as effective round trips) and for motor groups the skew to the first motor. Results are written as json so they can be compared between commits.
+"""
+import argparse
+import json
+import logging
+import statistics
+import sys
+import time
+
+from typing import Callable, Dict, List, Tuple
+
+import nxt.motor as Motor
+
+from ln3d_scanner.nxt.link import BrickScheduler, profile_link, set_link_profile
+from ln3d_scanner.nxt.motors import PrecisionMotor, InvertedMotor, DualMotors, MotorGroup, MotionProfile
+from ln3d_scanner.nxt.simulator import SimulatedSock, TRANSPORT_PROFILES
+
+
+logger = logging.getLogger(__name__)
+
+
+# Scenario name -> factory returning the motor under test and the tracked (port, sign) pairs.
+# Sign converts the simulated shaft position to the tacho units seen by the motor class.
+Scenario = Callable[[object], Tuple[PrecisionMotor, List[Tuple[Motor.Port, int]]]]
+
+SCENARIOS: Dict[str, Scenario] = {
+    'precision_motor': lambda brick: (PrecisionMotor(brick, Motor.Port.A), [(Motor.Port.A, 1)]),
+    'inverted_motor': lambda brick: (InvertedMotor(brick, Motor.Port.A), [(Motor.Port.A, -1)]),
+    'dual_motors': lambda brick: (
+        DualMotors(PrecisionMotor(brick, Motor.Port.B), InvertedMotor(brick, Motor.Port.C)),
+        [(Motor.Port.B, 1), (Motor.Port.C, -1)]
+    ),
+    'motor_group': lambda brick: (
+        MotorGroup([PrecisionMotor(brick, Motor.Port.A), PrecisionMotor(brick, Motor.Port.B), InvertedMotor(brick, Motor.Port.C)]),
+        [(Motor.Port.A, 1), (Motor.Port.B, 1), (Motor.Port.C, -1)]
+    ),
+}
+
+
+class MotionObserver:
+    """ Tracks ground truth positions of the simulated motors after every simulation step. """
+
+    def __init__(self, tracked: List[Tuple[Motor.Port, int]], targets: List[float], direction: int, threshold: int):
+        self.tracked = tracked
+        self.targets = targets
+        self.direction = direction
+        self.threshold = threshold
+        self.reached = None  # Simulated time when all motors reached their target window.
+        self.max_skew = 0.0
+
+    def positions(self, nxt) -> List[float]:
+        return [sign * nxt.motor(port).position for port, sign in self.tracked]
+
+    def __call__(self, nxt):
+        positions = self.positions(nxt)
+        if len(positions) > 1:
+            self.max_skew = max(self.max_skew, max(positions) - min(positions))
+        if self.reached is None and all(
+            abs(target - position) < self.threshold or self.direction * (position - target) > 0
+            for position, target in zip(positions, self.targets)
+        ):
+            self.reached = nxt.time
+
+
+def run_once(method: str, scenario: str, power: int, tacho_units: int, seed: int, settle: float = 0.5, link_profile: bool = False,
+             scheduled: bool = False, **turn_kwargs) -> dict:
+    """ 
+        Run a single turn on a fresh simulated brick and return its metrics. Extra keyword arguments are passed to turn.
+        With link_profile the link is profiled first so thresholds and poll rates come from measurements.
+        With scheduled all requests go through a BrickScheduler.
+    """
+    sock = SimulatedSock(method, seed=seed)
+    brick = sock.connect()
+    if scheduled:
+        brick = BrickScheduler(brick)
+    if link_profile:
+        set_link_profile(brick, profile_link(brick, samples=10))
+    motor, tracked = SCENARIOS[scenario](brick)
+    if len(tracked) > 1:
+        sock.nxt.motor(tracked[-1][0]).load = 0.05  # The follower is slightly slower.
+    else:
+        turn_kwargs.pop('synchronized', None)  # Only groups are synchronized.
+
+    direction = 1 if power > 0 else -1
+    nxt = sock.nxt
+    nxt.advance_to(time.monotonic())
+    starts = [sign * nxt.motor(port).position for port, sign in tracked]
+    targets = [start + direction * tacho_units for start in starts]
+    observer = MotionObserver(tracked, targets, direction, motor.get_threshold())
+
+    sock.reset_stats()
+    nxt.add_observer(observer)
+    start = time.monotonic()
+    motor.turn(power, tacho_units, **turn_kwargs)
+    duration = time.monotonic() - start
+    round_trips, exchanges, no_replies, opcodes = sock.round_trips, sock.exchanges, sock.no_replies, dict(sock.opcodes)
+    # Let the motors settle before reading the final positions.
+    time.sleep(settle)
+    nxt.advance_to(time.monotonic())
+    nxt.remove_observer(observer)
+    if scheduled:
+        brick.close()
+
+    positions = observer.positions(nxt)
+    overshoot = [direction * (position - target) for position, target in zip(positions, targets)]
+    result = {
+        'transport': method,
+        'scenario': scenario,
+        'power': power,
+        'tacho_units': tacho_units,
+        'duration': duration,
+        'time_to_target': None if observer.reached is None else observer.reached - start,
+        'overshoot': max(overshoot, key=abs),
+        'round_trips': round_trips,
+        'effective_round_trips': exchanges,
+        'no_reply_commands': no_replies,
+        'opcodes': opcodes,
+        'requested_rate': motor.loop_stats.requested_rate,
+        'achieved_rate': motor.loop_stats.achieved_rate,
+    }
+    if len(tracked) > 1:
+        result['max_skew'] = observer.max_skew
+        result['final_skew'] = max(positions) - min(positions)
+        if turn_kwargs.get('synchronized'):
+            skews = [skew.stats.to_dict() for skew in motor.skews]
+            result['skew'] = skews[0] if len(skews) == 1 else skews
+    return result
+
+
+def summarize(runs: List[dict]) -> dict:
+    """ Aggregate repeated runs of the same transport and scenario. """
+    summary = {'transport': runs[0]['transport'], 'scenario': runs[0]['scenario'], 'runs': len(runs)}
+    for key in ('duration', 'time_to_target', 'overshoot', 'round_trips', 'effective_round_trips', 'achieved_rate', 'max_skew', 'final_skew'):
+        values = [run[key] for run in runs if run.get(key) is not None]
+        if values:
+            summary[key] = {'mean': statistics.mean(values), 'max': max(values, key=abs)}
+    return summary
+
+
+def run(transports: List[str], scenarios: List[str], power: int, tacho_units: int, repeat: int, link_profile: bool = False,
+        scheduled: bool = False, **turn_kwargs) -> dict:
+    results = []
+    for method in transports:
+        for scenario in scenarios:
+            runs = [run_once(method, scenario, power, tacho_units, seed, link_profile=link_profile, scheduled=scheduled, **turn_kwargs)
+                    for seed in range(repeat)]
+            summary = summarize(runs)
+            logger.info('%s %s: %s', method, scenario, summary)
+            results.append({'summary': summary, 'runs': runs})
+    return {
+        'benchmark': 'motion',
+        'power': power,
+        'tacho_units': tacho_units,
+        'repeat': repeat,
+        'link_profile': link_profile,
+        'scheduled': scheduled,
+        'turn_options': {key: str(value) if isinstance(value, MotionProfile) else value for key, value in turn_kwargs.items()},
+        'results': results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark motor turns against the simulated brick.')
+    parser.add_argument('--transports', nargs='+', default=list(TRANSPORT_PROFILES), choices=list(TRANSPORT_PROFILES))
+    parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument('--power', type=int, default=100)
+    parser.add_argument('--tacho-units', type=int, default=720)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--predictive', action='store_true', help='Use predictive early braking.')
+    parser.add_argument('--synchronized', action='store_true', help='Trim power to keep grouped motors together.')
+    parser.add_argument('--profile', action='store_true', help='Ramp power up and down with the default motion profile.')
+    parser.add_argument('--link-profile', action='store_true', help='Profile the link to derive thresholds and poll rates.')
+    parser.add_argument('--scheduled', action='store_true', help='Send all requests through a BrickScheduler.')
+    parser.add_argument('--output', help='Write json results to this file instead of stdout.')
+    args = parser.parse_args(argv)
+
+    report = run(args.transports, args.scenarios, args.power, args.tacho_units, args.repeat,
+                 link_profile=args.link_profile, scheduled=args.scheduled, predictive=args.predictive,
+                 synchronized=args.synchronized, profile=MotionProfile() if args.profile else None)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    logging.getLogger().setLevel(logging.INFO)
+    main()
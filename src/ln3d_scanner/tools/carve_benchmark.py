@@ -0,0 +1,102 @@
+"""
+    Reconstruction benchmark on synthetic objects.
+
+    Usage:
+        python -m ln3d_scanner.tools.carve_benchmark --shapes sphere torus --resolutions 64 128 256 --output carve.json
+
+    Silhouettes of each shape are rendered from a ring of platform angles per camera bar elevation, then carved with the
+    dense VoxelCarver and the OctreeCarver at every resolution. Reports voxels projected per second, seconds, the cells
+    held in memory and the intersection over union with the true shape. With --workers the ParallelCarver is run
+    for every worker count and its speedup over the first count is reported. Requires numpy.
+"""
+import argparse
+import json
+import logging
+import math
+import sys
+import time
+
+import numpy as np
+
+from ln3d_scanner.reconstruction import (SHAPES, OctreeCarver, ParallelCarver, PinholeCamera, ScannerGeometry, VoxelCarver,
+                                         render_silhouettes, sample_grid)
+
+
+logger = logging.getLogger(__name__)
+
+BOUNDS = ((-1, -1, -1), (1, 1, 1))
+
+
+def iou(occupancy: np.ndarray, truth: np.ndarray) -> float:
+    return float(np.count_nonzero(occupancy & truth) / max(1, np.count_nonzero(occupancy | truth)))
+
+
+def run_parallel(frames, resolution: int, workers, block: int, dense) -> list:
+    """ ParallelCarver at every worker count, speedup is relative to the first count. """
+    results = []
+    for count in workers:
+        carver = ParallelCarver(*BOUNDS, resolution, workers=count, block=block)
+        grid = carver.carve(frames)
+        results.append(dict(carver.stats.to_dict(), workers=count, blocks=carver.blocks,
+                            speedup=results[0]['seconds'] / carver.stats.seconds if results else 1.0,
+                            matches_dense=bool(np.array_equal(grid.occupancy, dense.occupancy))))
+        logger.info(f'{count} workers at {resolution}: {carver.stats}, speedup {results[-1]["speedup"]:.2f}')
+    return results
+
+
+def run_shape(name: str, geometry: ScannerGeometry, poses, resolutions, steps: int, workers=(), block: int = 32) -> dict:
+    shape = SHAPES[name]()
+    start = time.perf_counter()
+    frames = render_silhouettes(shape, geometry, poses, steps=steps)
+    result = {'shape': name, 'frames': len(frames), 'render_seconds': time.perf_counter() - start, 'resolutions': []}
+    for resolution in resolutions:
+        points, _ = sample_grid(*BOUNDS, resolution)
+        truth = shape(points).reshape((resolution,) * 3)
+
+        dense = VoxelCarver(*BOUNDS, resolution)
+        grid = dense.carve(frames)
+        octree_carver = OctreeCarver(*BOUNDS, max_level=int(math.log2(resolution)))
+        octree = octree_carver.carve(frames)
+        octree_grid = octree.to_grid()
+        result['resolutions'].append({
+            'resolution': resolution,
+            'dense': dict(dense.stats.to_dict(), cells=grid.occupancy.size, occupied=grid.count, iou=iou(grid.occupancy, truth)),
+            'octree': dict(octree_carver.stats.to_dict(), cells=max(octree_carver.cells_per_level), leaves=len(octree),
+                           cells_per_level=octree_carver.cells_per_level, iou=iou(octree_grid.occupancy, truth),
+                           differs_from_dense=int(np.count_nonzero(octree_grid.occupancy ^ grid.occupancy))),
+        })
+        if workers:
+            result['resolutions'][-1]['parallel'] = run_parallel(frames, resolution, workers, block, grid)
+        logger.info(f'{name} at {resolution}: dense {dense.stats}, octree {octree_carver.stats}')
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark silhouette carving on synthetic objects.')
+    parser.add_argument('--shapes', nargs='+', default=list(SHAPES), choices=list(SHAPES))
+    parser.add_argument('--resolutions', nargs='+', type=int, default=[64, 128], help='Voxels per side, powers of 2.')
+    parser.add_argument('--width', type=int, default=160)
+    parser.add_argument('--height', type=int, default=120)
+    parser.add_argument('--fov', type=float, default=40, help='Horizontal field of view in degrees.')
+    parser.add_argument('--distance', type=float, default=4, help='Camera distance from the platform center, the object fits in a 2 unit cube.')
+    parser.add_argument('--angles', type=int, default=12, help='Platform angles per elevation.')
+    parser.add_argument('--elevations', nargs='+', type=float, default=[30, 60, 90, 120])
+    parser.add_argument('--steps', type=int, default=128, help='Samples per pixel ray when rendering silhouettes.')
+    parser.add_argument('--workers', nargs='*', type=int, default=[], help='Worker counts for the parallel scaling run, e.g. 1 2 4 8.')
+    parser.add_argument('--block', type=int, default=32, help='Voxels per block side for the parallel carver.')
+    parser.add_argument('--output', help='Write json results to this file instead of stdout.')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    geometry = ScannerGeometry(PinholeCamera.from_fov(args.width, args.height, args.fov), args.distance)
+    poses = [(360 * index / args.angles, elevation) for elevation in args.elevations for index in range(args.angles)]
+    results = [run_shape(name, geometry, poses, args.resolutions, args.steps, args.workers, args.block) for name in args.shapes]
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+    Per poll overhead of motor group bookkeeping, without brick I/O.
+
+    Usage:
+        python -m ln3d_scanner.tools.motor_group_benchmark --motors 2 3 6 12 --iterations 20000
+
+    Every iteration parses the get_output_state replies of all motors and runs the blocked and target checks of a turn
+    poll. The per motor path creates a state and TachoInfo per motor per poll and checks them one by one, like
+    DualMotors did before MotorGroup. The group path reads into a preallocated GroupTacho and checks all motors in one pass.
+    Reports microseconds per iteration for both.
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+
+from typing import List
+
+import nxt.motor as Motor
+
+from ln3d_scanner.nxt.motors import PrecisionMotor, InvertedMotor, MotorGroup
+from ln3d_scanner.nxt.simulator import SimulatedSock
+
+
+logger = logging.getLogger(__name__)
+
+PORTS = (Motor.Port.A, Motor.Port.B, Motor.Port.C)
+
+
+def make_motors(brick, count: int) -> List[PrecisionMotor]:
+    """ Alternate normal and inverted motors, ports repeat after C since nothing is sent. """
+    return [(PrecisionMotor if index % 2 == 0 else InvertedMotor)(brick, PORTS[index % len(PORTS)]) for index in range(count)]
+
+
+def make_replies(motors: List[PrecisionMotor], tacho_count: int) -> List[tuple]:
+    """ get_output_state replies of running motors at tacho_count. """
+    return [(motor.port.value, 75 * motor.sign, 5, 1, 0, 32, 0, tacho_count * motor.sign, tacho_count * motor.sign, tacho_count * motor.sign)
+            for motor in motors]
+
+
+def per_motor(motors: List[PrecisionMotor], samples: List[List[tuple]], targets, threshold: int, iterations: int) -> float:
+    last = [motor._parse_state(values)[1] for motor, values in zip(motors, samples[0])]
+    start = time.perf_counter()
+    for iteration in range(iterations):
+        tachos = [motor._parse_state(values)[1] for motor, values in zip(motors, samples[iteration & 1])]
+        any(motor._is_blocked(tacho, previous, 1) for motor, tacho, previous in zip(motors, tachos, last))
+        [tacho.is_near(target, threshold) or tacho.is_greater(target, 1) for tacho, target in zip(tachos, targets)]
+        last = tachos
+    return time.perf_counter() - start
+
+
+def grouped(group: MotorGroup, samples: List[List[tuple]], threshold: int, iterations: int) -> float:
+    tacho, last_tacho = group.tacho_type(len(group)), group.tacho_type(len(group))
+    group._parse_tacho(samples[0], last_tacho)
+    target = last_tacho.get_target(100000, 1)
+    start = time.perf_counter()
+    for iteration in range(iterations):
+        group._parse_tacho(samples[iteration & 1], tacho)
+        any(tacho.blocked(last_tacho, 1))
+        tacho.reached(target, threshold, 1)
+        tacho, last_tacho = last_tacho, tacho
+    return time.perf_counter() - start
+
+
+def run(motor_counts: List[int], iterations: int, threshold: int = 5) -> dict:
+    brick = SimulatedSock('usb', seed=0).connect()
+    results = []
+    for count in motor_counts:
+        motors = make_motors(brick, count)
+        samples = [make_replies(motors, 1000), make_replies(motors, 1010)]
+        targets = [motor._parse_state(values)[1].get_target(100000, 1) for motor, values in zip(motors, samples[0])]
+        group = MotorGroup(motors)
+        seconds = {
+            'per_motor': per_motor(motors, samples, targets, threshold, iterations),
+            'group': grouped(group, samples, threshold, iterations),
+        }
+        result = {'motors': count, **{f'{name}_us': value / iterations * 1e6 for name, value in seconds.items()}}
+        result['speedup'] = seconds['per_motor'] / seconds['group']
+        logger.info('%d motors: per motor %.2fus, group %.2fus per poll', count, result['per_motor_us'], result['group_us'])
+        results.append(result)
+    return {'benchmark': 'motor_group_overhead', 'iterations': iterations, 'results': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark motor group bookkeeping per poll.')
+    parser.add_argument('--motors', nargs='+', type=int, default=[2, 3, 6, 12])
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--output', help='Write json results to this file instead of stdout.')
+    args = parser.parse_args(argv)
+
+    report = run(args.motors, args.iterations)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+
+if __name__ == '__main__':
+    logging.basicConfig()
+    logging.getLogger().setLevel(logging.INFO)
+    main()